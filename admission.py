@@ -0,0 +1,119 @@
+"""
+Wedding Elite V2.0 - Admission control
+Token buckets per wedding and per client IP (HTTP requests and WebSocket messages
+draw from the same buckets) plus a global in-flight limit that sheds load early.
+All state is touched from the event loop thread only, so nothing here is locked;
+bucket tables are LRU-bounded and drop buckets that have been idle for a while.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# Sustained requests/messages per second and burst size; a rate of 0 disables that limit
+RATE_PER_WEDDING = float(os.environ.get("WEDDING_RATE_PER_WEDDING", "20"))
+BURST_PER_WEDDING = float(os.environ.get("WEDDING_BURST_PER_WEDDING", "40"))
+RATE_PER_IP = float(os.environ.get("WEDDING_RATE_PER_IP", "50"))
+BURST_PER_IP = float(os.environ.get("WEDDING_BURST_PER_IP", "100"))
+
+# HTTP requests allowed in flight at once before new ones get 503
+MAX_IN_FLIGHT = int(os.environ.get("WEDDING_MAX_IN_FLIGHT", "64"))
+
+BUCKET_TABLE_SIZE = 10000
+BUCKET_IDLE_SECONDS = 600
+
+class BucketTable:
+    """Token buckets keyed by string, bounded to `max_size` entries.
+
+    A bucket idle for longer than it takes to refill is indistinguishable from a new
+    one, so evicting it loses nothing; eviction runs whenever a new key is added.
+    """
+
+    def __init__(self, rate: float, burst: float, max_size: int = BUCKET_TABLE_SIZE,
+                 idle_seconds: float = BUCKET_IDLE_SECONDS):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_size = max_size
+        self.idle_seconds = max(idle_seconds, self.burst / rate if rate > 0 else 0)
+        self.evicted = 0
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()  # key -> [tokens, updated_at]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def take(self, key: str, now: Optional[float] = None) -> float:
+        """Spend one token for `key`: 0 if allowed, else seconds until a token is available"""
+        if self.rate <= 0:
+            return 0.0
+        if now is None:
+            now = time.monotonic()
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self._evict(now)
+            bucket = [self.burst, now]
+            self._buckets[key] = bucket
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / self.rate
+
+    def _evict(self, now: float):
+        while self._buckets:
+            key, (_, updated_at) = next(iter(self._buckets.items()))
+            if len(self._buckets) < self.max_size and now - updated_at < self.idle_seconds:
+                break
+            del self._buckets[key]
+            self.evicted += 1
+
+class AdmissionController:
+    """Rate limits plus the global concurrency limit, with throttle counters"""
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT):
+        self.weddings = BucketTable(RATE_PER_WEDDING, BURST_PER_WEDDING)
+        self.ips = BucketTable(RATE_PER_IP, BURST_PER_IP)
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.throttled: Dict[str, int] = {}
+
+    def _count(self, reason: str):
+        self.throttled[reason] = self.throttled.get(reason, 0) + 1
+
+    def check_rate(self, channel: str, ip: str, wedding_id: Optional[str] = None) -> float:
+        """Charge one request/message on `channel` ("http" or "ws"): 0 if allowed, else Retry-After seconds"""
+        retry_after = self.ips.take(ip)
+        if retry_after:
+            self._count(f"{channel}_ip")
+            return retry_after
+        if wedding_id is not None:
+            retry_after = self.weddings.take(wedding_id)
+            if retry_after:
+                self._count(f"{channel}_wedding")
+        return retry_after
+
+    def acquire(self) -> bool:
+        """Take an in-flight slot; False means the request should be shed"""
+        if self.max_in_flight > 0 and self.in_flight >= self.max_in_flight:
+            self._count("http_concurrency")
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+    def metrics(self) -> Dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "throttled": dict(self.throttled),
+            "wedding_buckets": len(self.weddings),
+            "ip_buckets": len(self.ips),
+            "evicted_buckets": self.weddings.evicted + self.ips.evicted,
+        }
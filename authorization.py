@@ -0,0 +1,120 @@
+"""
+Wedding Elite V2.0 - Authorization
+Who may do what on a wedding: the owner (weddings.user_id, mirrored in the catalog's
+shard map) has full control, collaborators get view or edit access through
+shared_access. A user's permissions are loaded with two indexed catalog queries and
+then served from memory until a grant, revoke or wedding create/delete invalidates them,
+or for at most PERMISSION_CACHE_TTL_SECONDS - invalidation only reaches this process,
+so the TTL bounds how long another worker keeps serving a revoked grant.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from database import get_db, wedding_of_row
+
+# Off by default: clients do not send an identity yet (X-User-Id header / ?user_id= on WebSockets)
+ACCESS_CONTROL_ENABLED = os.environ.get("WEDDING_ENFORCE_ACCESS", "0") == "1"
+
+NO_ACCESS, VIEW, EDIT, OWNER = 0, 1, 2, 3
+
+PERMISSION_CACHE_USERS = 10000
+ROW_CACHE_SIZE = 100000
+PERMISSION_CACHE_TTL_SECONDS = float(os.environ.get("WEDDING_PERMISSION_CACHE_TTL", "5"))
+
+class PermissionCache:
+    """LRU of user_id -> {wedding_id: level}, plus an LRU of wedding-scoped row id -> wedding id.
+
+    Lookups run on the event loop, loads on DB threads, hence the lock. A load that
+    overlaps an invalidation is not cached, so a revoke can never be undone by a
+    slow read that started before it. Permissions older than `ttl` seconds are
+    reloaded, which picks up grants and revokes made by other processes.
+    """
+
+    def __init__(self, max_users: int = PERMISSION_CACHE_USERS, max_rows: int = ROW_CACHE_SIZE,
+                 ttl: float = PERMISSION_CACHE_TTL_SECONDS):
+        self.max_users = max_users
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._users: "OrderedDict[str, Tuple[float, Dict[str, int]]]" = OrderedDict()
+        self._rows: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def cached_level(self, user_id: str, wedding_id: str) -> Optional[int]:
+        """Access level from memory, or None when the user's permissions are not loaded (or stale)"""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self.misses += 1
+                return None
+            grants = entry[1]
+            self._users.move_to_end(user_id)
+            self.hits += 1
+            return grants.get(wedding_id, NO_ACCESS)
+
+    def level(self, user_id: str, wedding_id: str) -> int:
+        """Access level, loading the user's permissions on a miss (blocking)"""
+        level = self.cached_level(user_id, wedding_id)
+        if level is None:
+            level = self._load(user_id).get(wedding_id, NO_ACCESS)
+        return level
+
+    def _load(self, user_id: str) -> Dict[str, int]:
+        with self._lock:
+            version = self._version
+        loaded_at = time.monotonic()
+
+        with get_db() as conn:
+            grants = {
+                row["wedding_id"]: EDIT if row["can_edit"] else VIEW
+                for row in conn.execute("SELECT wedding_id, can_edit FROM shared_access WHERE user_id = ?", (user_id,))
+            }
+            for row in conn.execute("SELECT wedding_id FROM wedding_shards WHERE user_id = ?", (user_id,)):
+                grants[row["wedding_id"]] = OWNER
+
+        with self._lock:
+            if self._version == version:
+                self._users[user_id] = (loaded_at, grants)
+                self._users.move_to_end(user_id)
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+        return grants
+
+    def invalidate(self, *user_ids: str):
+        """Drop cached permissions after a change to what these users may access"""
+        with self._lock:
+            self._version += 1
+            for user_id in user_ids:
+                self._users.pop(user_id, None)
+
+    def cached_wedding_of(self, table: str, row_id: str) -> Optional[str]:
+        with self._lock:
+            return self._rows.get((table, row_id))
+
+    def wedding_of(self, table: str, row_id: str) -> Optional[str]:
+        """Wedding owning a row of a wedding-scoped table (rows never change wedding, so no invalidation)"""
+        wedding_id = self.cached_wedding_of(table, row_id)
+        if wedding_id is not None:
+            return wedding_id
+
+        wedding_id = wedding_of_row(table, row_id)
+        if wedding_id is None:
+            return None
+
+        with self._lock:
+            self._rows[(table, row_id)] = wedding_id
+            while len(self._rows) > self.max_rows:
+                self._rows.popitem(last=False)
+        return wedding_id
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {"users": len(self._users), "rows": len(self._rows), "hits": self.hits, "misses": self.misses}
+
+permissions = PermissionCache()
@@ -0,0 +1,480 @@
+"""
+Wedding Elite V2.0 - Backups
+Online backups of every database file (catalog, shards, archive) into BACKUP_DIR.
+Each backup generation starts with a full copy made through SQLite's backup API, a few
+pages per step from one pinned read snapshot, so writers are never blocked and the copy
+never restarts. After that, committed WAL frames are shipped as numbered segment files,
+and a restore replays them over the copy. A long-lived read transaction per database
+keeps SQLite from resetting the WAL over frames that have not been shipped; checkpoints
+run here, under a brief write lock, once everything has been shipped.
+
+Layout: BACKUP_DIR/<database file>/<generation>/{base.db, 00000001.wal, ..., manifest.json}
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from database import all_database_paths, archive_path, connect
+
+BACKUP_DIR = os.environ.get("WEDDING_BACKUP_DIR", "backups")
+# Continuous backups from the API server (off by default); `python main.py backup` works either way
+BACKUPS_ENABLED = os.environ.get("WEDDING_BACKUPS", "0") == "1"
+
+# Full copies: pages per backup step and the pause between steps
+BACKUP_PAGES_PER_STEP = int(os.environ.get("WEDDING_BACKUP_PAGES_PER_STEP", "256"))
+BACKUP_STEP_PAUSE_SECONDS = float(os.environ.get("WEDDING_BACKUP_STEP_PAUSE", "0.005"))
+
+# A new generation (full copy) this often, WAL frames shipped in between
+FULL_BACKUP_INTERVAL_SECONDS = int(os.environ.get("WEDDING_FULL_BACKUP_INTERVAL", str(24 * 3600)))
+WAL_SHIP_INTERVAL_SECONDS = int(os.environ.get("WEDDING_WAL_SHIP_INTERVAL", "30"))
+WAL_CHECKPOINT_FRAMES = 1000
+
+# Rotation: the newest KEEP_LAST generations plus the newest one of each of the last KEEP_DAILY days
+BACKUP_KEEP_LAST = max(1, int(os.environ.get("WEDDING_BACKUP_KEEP_LAST", "3")))
+BACKUP_KEEP_DAILY = int(os.environ.get("WEDDING_BACKUP_KEEP_DAILY", "7"))
+
+GENERATION_FORMAT = "%Y%m%dT%H%M%S%fZ"
+MANIFEST = "manifest.json"
+BASE = "base.db"
+
+WAL_HEADER = struct.Struct(">IIIIIIII")  # magic, version, page size, checkpoint seq, salt1, salt2, cksum1, cksum2
+FRAME_HEADER = struct.Struct(">IIIIII")  # page number, db size after commit (0 if not a commit), salt1, salt2, cksum1, cksum2
+WAL_MAGIC = 0x377F0682
+
+class BackupError(Exception):
+    """A backup could not be restored or failed verification"""
+
+# ==================== WAL FORMAT ====================
+
+def wal_checksum(data: bytes, checksum: Tuple[int, int], big_endian: bool) -> Tuple[int, int]:
+    """SQLite's WAL checksum of `data`, continuing from `checksum`"""
+    words = struct.unpack(f"{'>' if big_endian else '<'}{len(data) // 4}I", data)
+    s0, s1 = checksum
+    for i in range(0, len(words), 2):
+        s0 = (s0 + words[i] + s1) & 0xFFFFFFFF
+        s1 = (s1 + words[i + 1] + s0) & 0xFFFFFFFF
+    return s0, s1
+
+def read_wal_header(wal_path: str) -> Optional[dict]:
+    """Parsed WAL header, or None while the WAL is missing, empty or not yet written"""
+    try:
+        with open(wal_path, "rb") as f:
+            raw = f.read(WAL_HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(raw) < WAL_HEADER.size:
+        return None
+
+    magic, _, page_size, _, salt1, salt2, cksum1, cksum2 = WAL_HEADER.unpack(raw)
+    if magic & 0xFFFFFFFE != WAL_MAGIC:
+        return None
+    big_endian = bool(magic & 1)
+    if wal_checksum(raw[:24], (0, 0), big_endian) != (cksum1, cksum2):
+        return None
+    return {"page_size": page_size, "salts": (salt1, salt2), "checksum": (cksum1, cksum2), "big_endian": big_endian}
+
+def iter_frames(data: bytes, page_size: int, salts: Tuple[int, int],
+                checksum: Optional[Tuple[int, int]] = None, big_endian: bool = False):
+    """Yield (offset, page number, commit size, checksum after) per frame, stopping at the first foreign one.
+
+    Frames are matched by salt; given the running `checksum` before the first frame, every
+    frame's checksum is verified as well (slow in Python, so only restores do it).
+    """
+    frame_size = FRAME_HEADER.size + page_size
+    for offset in range(0, len(data) - frame_size + 1, frame_size):
+        pgno, commit, salt1, salt2, cksum1, cksum2 = FRAME_HEADER.unpack_from(data, offset)
+        if (salt1, salt2) != salts:
+            return
+        if checksum is not None:
+            checksum = wal_checksum(data[offset:offset + 8], checksum, big_endian)
+            checksum = wal_checksum(data[offset + FRAME_HEADER.size:offset + frame_size], checksum, big_endian)
+            if checksum != (cksum1, cksum2):
+                return
+        yield offset, pgno, commit, (cksum1, cksum2)
+
+def read_committed_frames(wal_path: str, header: dict, start_frame: int) -> Tuple[bytes, int, Optional[Tuple[int, int]]]:
+    """Frames after `start_frame` up to the last commit: (raw frames, frame count, checksum after them).
+
+    Only call this while holding the write lock, so that no frame is half-written.
+    """
+    frame_size = FRAME_HEADER.size + header["page_size"]
+    with open(wal_path, "rb") as f:
+        f.seek(WAL_HEADER.size + start_frame * frame_size)
+        data = f.read()
+
+    end, count, checksum = 0, 0, None
+    for offset, _, commit, frame_checksum in iter_frames(data, header["page_size"], header["salts"]):
+        if commit:
+            end, count, checksum = offset + frame_size, offset // frame_size + 1, frame_checksum
+    return data[:end], count, checksum
+
+# ==================== FILES ====================
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _write_durable(path: str, data: bytes):
+    """Write a file so that it either exists complete or not at all"""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def _write_manifest(generation_dir: str, manifest: dict):
+    _write_durable(os.path.join(generation_dir, MANIFEST), json.dumps(manifest, indent=1).encode("utf-8"))
+
+def _load_manifest(generation_dir: str) -> dict:
+    try:
+        with open(os.path.join(generation_dir, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as exc:
+        raise BackupError(f"{generation_dir}: unreadable manifest ({exc})") from None
+
+def list_generations(database_dir: str) -> List[str]:
+    """Complete generations of one database, oldest first"""
+    if not os.path.isdir(database_dir):
+        return []
+    return sorted(name for name in os.listdir(database_dir)
+                  if os.path.isfile(os.path.join(database_dir, name, MANIFEST)))
+
+def generations_to_keep(generations: List[str], now: datetime, keep_last: int = BACKUP_KEEP_LAST,
+                        keep_daily: int = BACKUP_KEEP_DAILY) -> set:
+    """Rotation policy over generation names (oldest first)"""
+    keep = set(generations[-keep_last:])
+    newest_of_day: Dict[str, str] = {}
+    for name in generations:
+        newest_of_day[name[:8]] = name
+    cutoff = (now - timedelta(days=keep_daily)).strftime("%Y%m%d")
+    keep.update(name for day, name in newest_of_day.items() if day > cutoff)
+    return keep
+
+# ==================== BACKUP STREAMS ====================
+
+class BackupStream:
+    """Backup state of one database file: its current generation and how far its WAL is shipped"""
+
+    def __init__(self, path: str, root: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.directory = os.path.join(root, self.name)
+        self.lock = threading.Lock()
+        self.hold: Optional[sqlite3.Connection] = None
+
+        self.generation: Optional[str] = None
+        self.generation_started = 0.0
+        self.manifest: Optional[dict] = None
+        self.salts: Optional[Tuple[int, int]] = None
+        self.checksum: Tuple[int, int] = (0, 0)
+        self.frame = 0  # frames of the current WAL shipped
+
+        self.full_backups = 0
+        self.last_full_backup_ms = 0.0
+        self.last_full_backup_steps = 0
+        self.shipped_frames = 0
+        self.shipped_bytes = 0
+        self.last_ship_ms = 0.0
+        self.caught_up_at: Optional[float] = None
+        self.checkpoints = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def generation_dir(self) -> str:
+        return os.path.join(self.directory, self.generation)
+
+    def metrics(self) -> Dict:
+        now = time.time()
+        return {
+            "generation": self.generation,
+            "generation_age_seconds": round(now - self.generation_started) if self.generation else None,
+            "full_backups": self.full_backups,
+            "last_full_backup_ms": self.last_full_backup_ms,
+            "last_full_backup_steps": self.last_full_backup_steps,
+            "segments": len(self.manifest["segments"]) if self.manifest else 0,
+            "shipped_frames": self.shipped_frames,
+            "shipped_bytes": self.shipped_bytes,
+            "last_ship_ms": self.last_ship_ms,
+            "lag_seconds": round(now - self.caught_up_at, 1) if self.caught_up_at else None,
+            "checkpoints": self.checkpoints,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+def _pin_snapshot(conn: sqlite3.Connection):
+    """Open a read transaction on an autocommit-mode connection and keep it"""
+    conn.execute("BEGIN")
+    conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+class BackupManager:
+    """Full copies plus WAL shipping for the catalog, every shard and the archive"""
+
+    def __init__(self, root: str = BACKUP_DIR):
+        self.root = root
+        self._streams: Dict[str, BackupStream] = {}
+        self._lock = threading.Lock()
+
+    def streams(self) -> List[BackupStream]:
+        with self._lock:
+            for path in all_database_paths() + [archive_path()]:
+                if path not in self._streams:
+                    self._streams[path] = BackupStream(path, self.root)
+            return list(self._streams.values())
+
+    def full_backup(self) -> Dict[str, str]:
+        """Start a new generation for every database now (waits for running backup work)"""
+        done = {}
+        for stream in self.streams():
+            with stream.lock:
+                self._guarded(stream, self._start_generation)
+                done[stream.name] = stream.generation
+        return done
+
+    def ship_wal(self) -> int:
+        """Ship newly committed WAL frames of every database; starts a generation where one is due"""
+        shipped = 0
+        for stream in self.streams():
+            if not stream.lock.acquire(blocking=False):
+                continue  # a full copy of this database is in progress
+            try:
+                shipped += self._guarded(stream, self._ship, 0)
+            finally:
+                stream.lock.release()
+        return shipped
+
+    def _guarded(self, stream: BackupStream, fn, default=None):
+        try:
+            return fn(stream)
+        except (sqlite3.Error, OSError) as exc:
+            stream.errors += 1
+            stream.last_error = f"{type(exc).__name__}: {exc}"
+            return default
+
+    def _start_generation(self, stream: BackupStream):
+        started = time.monotonic()
+        if stream.hold is None:
+            # Pinned before the copy: the WAL cannot be reset under frames newer than the copy
+            stream.hold = sqlite3.connect(stream.path, isolation_level=None, check_same_thread=False)
+            _pin_snapshot(stream.hold)
+
+        generation = datetime.utcnow().strftime(GENERATION_FORMAT)
+        generation_dir = os.path.join(stream.directory, generation)
+        os.makedirs(generation_dir, exist_ok=True)
+        base = os.path.join(generation_dir, BASE)
+
+        steps = 0
+        def pause(status, remaining, total):
+            nonlocal steps
+            steps += 1
+            time.sleep(BACKUP_STEP_PAUSE_SECONDS)
+
+        source = sqlite3.connect(stream.path, isolation_level=None)
+        try:
+            _pin_snapshot(source)  # every step copies from the same snapshot, so writes never restart the copy
+            target = sqlite3.connect(base + ".tmp")
+            try:
+                source.backup(target, pages=BACKUP_PAGES_PER_STEP, progress=pause)
+            finally:
+                target.close()
+        finally:
+            source.close()
+        os.replace(base + ".tmp", base)
+
+        stream.manifest = {
+            "database": stream.name,
+            "generation": generation,
+            "base": {"file": BASE, "bytes": os.path.getsize(base), "sha256": _sha256(base)},
+            "segments": [],
+        }
+        _write_manifest(generation_dir, stream.manifest)
+
+        # Replaying the whole current WAL over the copy is safe: frames older than the copy rewrite what it already holds
+        stream.generation = generation
+        stream.generation_started = time.time()
+        stream.salts, stream.frame = None, 0
+        stream.full_backups += 1
+        stream.last_full_backup_steps = steps
+        stream.last_full_backup_ms = round((time.monotonic() - started) * 1000, 2)
+        self._rotate(stream)
+        self._ship_frames(stream)
+
+    def _rotate(self, stream: BackupStream):
+        generations = list_generations(stream.directory)
+        keep = generations_to_keep(generations, datetime.utcnow())
+        keep.add(stream.generation)
+        for name in generations:
+            if name not in keep:
+                shutil.rmtree(os.path.join(stream.directory, name), ignore_errors=True)
+
+    def _ship(self, stream: BackupStream) -> int:
+        started = time.monotonic()
+        due = stream.generation is None or time.time() - stream.generation_started >= FULL_BACKUP_INTERVAL_SECONDS
+        if due or not os.path.isdir(stream.generation_dir):
+            self._start_generation(stream)
+            return stream.frame
+
+        shipped = self._ship_frames(stream, checkpoint=True)
+        stream.last_ship_ms = round((time.monotonic() - started) * 1000, 2)
+        return shipped
+
+    def _ship_frames(self, stream: BackupStream, checkpoint: bool = False) -> int:
+        """Copy committed frames not shipped yet into a new segment, checkpointing once the WAL is long.
+
+        Writers are held off meanwhile (a few milliseconds): SQLite writes a frame header
+        before its page, so reading the WAL under a concurrent append could see a torn frame.
+        """
+        with connect(stream.path) as writer:
+            writer.execute("BEGIN IMMEDIATE")
+            caught_up_at = time.time()
+            try:
+                shipped = self._copy_frames(stream)
+                if checkpoint and stream.frame >= WAL_CHECKPOINT_FRAMES:
+                    # Everything is shipped and nothing new can commit, so the WAL may now be reset
+                    stream.hold.execute("ROLLBACK")
+                    stream.hold.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+                    _pin_snapshot(stream.hold)
+                    stream.checkpoints += 1
+            finally:
+                writer.rollback()
+        stream.caught_up_at = caught_up_at
+        return shipped
+
+    def _copy_frames(self, stream: BackupStream) -> int:
+        header = read_wal_header(stream.path + "-wal")
+        if header is None:
+            return 0
+        if header["salts"] != stream.salts:
+            # The WAL was reset (only possible once every older frame was shipped) - follow it from frame 0
+            stream.salts, stream.checksum, stream.frame = header["salts"], header["checksum"], 0
+
+        data, count, checksum = read_committed_frames(stream.path + "-wal", header, stream.frame)
+        if not count:
+            return 0
+
+        segments = stream.manifest["segments"]
+        name = f"{len(segments) + 1:08d}.wal"
+        _write_durable(os.path.join(stream.generation_dir, name), data)
+        segments.append({
+            "file": name,
+            "page_size": header["page_size"],
+            "big_endian": header["big_endian"],
+            "salts": list(header["salts"]),
+            "first_frame": stream.frame,
+            "frames": count,
+            "checksum_in": list(stream.checksum),
+            "checksum_out": list(checksum),
+            "sha256": hashlib.sha256(data).hexdigest(),
+        })
+        _write_manifest(stream.generation_dir, stream.manifest)
+        stream.frame += count
+        stream.checksum = checksum
+        stream.shipped_frames += count
+        stream.shipped_bytes += len(data)
+        return count
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            streams = list(self._streams.values())
+        return {
+            "enabled": BACKUPS_ENABLED,
+            "directory": self.root,
+            "databases": {stream.name: stream.metrics() for stream in streams},
+        }
+
+backups = BackupManager()
+
+# ==================== RESTORE ====================
+
+def _pick_generation(database_dir: str, generation: Optional[str]) -> str:
+    generations = list_generations(database_dir)
+    if generation is not None:
+        generations = [name for name in generations if name <= generation]
+    if not generations:
+        raise BackupError(f"{database_dir}: no backup generation found")
+    return generations[-1]
+
+def restore_generation(generation_dir: str, target: str) -> Dict:
+    """Rebuild one database from a generation into `target`, verifying every file and frame"""
+    manifest = _load_manifest(generation_dir)
+    base = os.path.join(generation_dir, manifest["base"]["file"])
+    if _sha256(base) != manifest["base"]["sha256"]:
+        raise BackupError(f"{base}: checksum mismatch")
+
+    work = target + ".restoring"
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(work + suffix):
+            os.remove(work + suffix)
+    shutil.copyfile(base, work)
+
+    frames, previous = 0, None
+    with open(work, "r+b") as db:
+        for segment in manifest["segments"]:
+            with open(os.path.join(generation_dir, segment["file"]), "rb") as f:
+                data = f.read()
+            if hashlib.sha256(data).hexdigest() != segment["sha256"]:
+                raise BackupError(f"{segment['file']}: checksum mismatch")
+            if previous is not None and previous["salts"] == segment["salts"]:
+                contiguous = (segment["first_frame"] == previous["first_frame"] + previous["frames"]
+                              and segment["checksum_in"] == previous["checksum_out"])
+            else:
+                contiguous = segment["first_frame"] == 0
+            if not contiguous:
+                raise BackupError(f"{segment['file']}: gap in the shipped WAL")
+
+            page_size = segment["page_size"]
+            count, checksum = 0, tuple(segment["checksum_in"])
+            for offset, pgno, commit, checksum in iter_frames(data, page_size, tuple(segment["salts"]),
+                                                              tuple(segment["checksum_in"]), segment["big_endian"]):
+                page = offset + FRAME_HEADER.size
+                db.seek((pgno - 1) * page_size)
+                db.write(data[page:page + page_size])
+                if commit:
+                    db.truncate(commit * page_size)
+                count += 1
+            if count != segment["frames"] or list(checksum) != segment["checksum_out"]:
+                raise BackupError(f"{segment['file']}: invalid WAL frames")
+            frames += count
+            previous = segment
+        db.flush()
+        os.fsync(db.fileno())
+
+    with connect(work) as conn:
+        integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    if integrity != "ok":
+        raise BackupError(f"{target}: integrity check failed ({integrity})")
+
+    os.replace(work, target)
+    return {"generation": manifest["generation"], "segments": len(manifest["segments"]), "frames": frames,
+            "bytes": os.path.getsize(target)}
+
+def restore_backup(target_dir: str = "restored", generation: Optional[str] = None) -> Dict:
+    """Restore every database into `target_dir` from its newest generation (or the newest at or before `generation`)"""
+    if not os.path.isdir(BACKUP_DIR):
+        raise BackupError(f"{BACKUP_DIR}: no backups")
+    os.makedirs(target_dir, exist_ok=True)
+    restored = {}
+    for name in sorted(os.listdir(BACKUP_DIR)):
+        database_dir = os.path.join(BACKUP_DIR, name)
+        if os.path.isdir(database_dir):
+            chosen = _pick_generation(database_dir, generation)
+            restored[name] = restore_generation(os.path.join(database_dir, chosen), os.path.join(target_dir, name))
+    return restored
+
+def verify_backups() -> Dict:
+    """Restore the newest generations into a scratch directory and discard them"""
+    with tempfile.TemporaryDirectory() as scratch:
+        return restore_backup(scratch)
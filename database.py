@@ -1 +1,696 @@
+"""
+Wedding Elite V2.0 - Storage layer
+Hash-sharded SQLite: wedding-scoped tables are partitioned by wedding_id across
+SHARD_COUNT files, global tables (users, vendors, reviews, notifications, ...)
+live in the catalog database together with the wedding -> shard map and the
+row -> wedding index used by row-id routes (/tasks/{id}, ...).
+"""
 
+import asyncio
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+# Catalog database (also shard 0, so a single-shard deployment is one file)
+DATABASE = os.environ.get("WEDDING_DATABASE", "wedding_elite_v2.db")
+SHARD_COUNT = max(1, int(os.environ.get("WEDDING_SHARD_COUNT", "1")))
+
+# Tables partitioned by wedding, with the column that holds the wedding id.
+# Order matters for migration: parents are copied first and deleted last.
+WEDDING_SCOPED_TABLES = [
+    ("weddings", "id"),
+    ("budget_categories", "wedding_id"),
+    ("vendor_bookings", "wedding_id"),
+    ("tasks", "wedding_id"),
+    ("seating_tables", "wedding_id"),
+    ("guests", "wedding_id"),
+    ("seating_constraints", "wedding_id"),
+]
+
+SHARD_MAP_CACHE_SIZE = 100000
+
+# Shard map value for weddings moved to the cold archive
+ARCHIVED_SHARD = -1
+# Weddings whose date is further in the past than this are archived, a batch at a time
+ARCHIVE_AFTER_DAYS = int(os.environ.get("WEDDING_ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVE_BATCH_SIZE = 50
+
+# Per-wedding tables copied into the archive: the shard-local ones (ledger included; budget
+# snapshots are only a cache and are rebuilt) and the catalog tables that reference weddings
+ARCHIVED_SHARD_TABLES = WEDDING_SCOPED_TABLES + [("budget_ledger", "wedding_id")]
+ARCHIVED_CATALOG_TABLES = [("notifications", "wedding_id"), ("vendor_event_claims", "wedding_id")]
+
+# Tables whose rows are addressed by their own id, registered in the catalog's wedding_rows index
+ROW_INDEXED_TABLES = ["budget_categories", "vendor_bookings", "tasks", "seating_tables", "guests"]
+
+# Times get_wedding_db follows moved_weddings tombstones before giving up with WeddingMoved
+MOVE_REROUTE_ATTEMPTS = 3
+
+# Blocking sqlite3 work from request handlers runs on a dedicated pool of this size
+DB_WORKERS = max(1, int(os.environ.get("WEDDING_DB_WORKERS", "8")))
+# Seconds a request may spend waiting for and running its database work
+REQUEST_DEADLINE_SECONDS = float(os.environ.get("WEDDING_REQUEST_DEADLINE", "10"))
+
+_shard_map_cache: Dict[str, int] = {}
+_scatter_executor = ThreadPoolExecutor(max_workers=SHARD_COUNT, thread_name_prefix="shard")
+
+def shard_path(shard: int) -> str:
+    """File backing a shard (shard 0 is the catalog file)"""
+    if shard == 0:
+        return DATABASE
+    root, ext = os.path.splitext(DATABASE)
+    return f"{root}.shard{shard}{ext or '.db'}"
+
+def archive_path() -> str:
+    """File holding archived weddings"""
+    root, ext = os.path.splitext(DATABASE)
+    return f"{root}.archive{ext or '.db'}"
+
+def all_database_paths() -> List[str]:
+    """Catalog plus every shard file"""
+    return [shard_path(shard) for shard in range(SHARD_COUNT)]
+
+@contextmanager
+def connect(path: str):
+    """Context manager for a connection to one database file"""
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+def get_db():
+    """Connection to the catalog database (global tables)"""
+    return connect(DATABASE)
+
+def get_shard_db(shard: int):
+    """Connection to one shard"""
+    return connect(shard_path(shard))
+
+def init_storage():
+    """Switch every database to WAL and create the shard map in the catalog"""
+    for path in all_database_paths():
+        with connect(path) as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+
+    with get_db() as conn:
+        map_exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'wedding_shards'"
+        ).fetchone() is not None
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS wedding_shards (
+                wedding_id TEXT PRIMARY KEY,
+                user_id TEXT,
+                shard INTEGER NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_wedding_shards_user ON wedding_shards (user_id)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS wedding_rows (
+                row_id TEXT PRIMARY KEY,
+                wedding_id TEXT NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_wedding_rows_wedding ON wedding_rows (wedding_id)")
+
+        legacy_weddings = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'weddings'"
+        ).fetchone() is not None
+        if not map_exists and legacy_weddings:
+            # Weddings created before sharding all live in the catalog file (shard 0)
+            conn.execute("INSERT INTO wedding_shards (wedding_id, user_id, shard) SELECT id, user_id, 0 FROM weddings")
+        conn.commit()
+
+    with connect(archive_path()) as conn:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS archived_weddings (
+                wedding_id TEXT PRIMARY KEY,
+                user_id TEXT,
+                wedding_date DATE,
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                payload BLOB NOT NULL
+            )
+        """)
+        conn.commit()
+
+def install_move_guards(conn):
+    """Tombstones for weddings moved off a shard, and triggers refusing new rows for them.
+
+    A writer that picked the shard just before a move committed would otherwise add
+    rows nobody reads again; with the guard its insert fails and get_wedding_db turns
+    that into WeddingMoved. Call after the shard tables exist.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS moved_weddings (
+            wedding_id TEXT PRIMARY KEY,
+            shard INTEGER NOT NULL,
+            moved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    for table, key in ARCHIVED_SHARD_TABLES:
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_move_guard BEFORE INSERT ON {table}
+            WHEN EXISTS (SELECT 1 FROM moved_weddings WHERE wedding_id = NEW.{key})
+            BEGIN
+                SELECT RAISE(ABORT, 'wedding moved to another shard');
+            END
+        """)
+
+# ==================== SHARD MAP ====================
+
+def hash_shard(wedding_id: str) -> int:
+    """Home shard of a wedding for the current SHARD_COUNT (stable across processes)"""
+    return zlib.crc32(wedding_id.encode("utf-8")) % SHARD_COUNT
+
+def shard_for_wedding(wedding_id: str) -> int:
+    """Shard holding a wedding's data: the shard map wins, hashing places unmapped ids"""
+    shard = _shard_map_cache.get(wedding_id)
+    if shard is not None:
+        return shard
+
+    with get_db() as conn:
+        row = conn.execute("SELECT shard FROM wedding_shards WHERE wedding_id = ?", (wedding_id,)).fetchone()
+    shard = row["shard"] if row else hash_shard(wedding_id)
+
+    if len(_shard_map_cache) >= SHARD_MAP_CACHE_SIZE:
+        _shard_map_cache.clear()
+    _shard_map_cache[wedding_id] = shard
+    return shard
+
+def assign_wedding_shard(wedding_id: str, user_id: Optional[str]) -> int:
+    """Register a new wedding in the shard map"""
+    shard = hash_shard(wedding_id)
+    with get_db() as conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO wedding_shards (wedding_id, user_id, shard) VALUES (?, ?, ?)
+        """, (wedding_id, user_id, shard))
+        conn.commit()
+    _shard_map_cache[wedding_id] = shard
+    return shard
+
+def forget_wedding_shard(wedding_id: str):
+    """Remove a deleted wedding from the shard map and the row index"""
+    with get_db() as conn:
+        conn.execute("DELETE FROM wedding_shards WHERE wedding_id = ?", (wedding_id,))
+        conn.execute("DELETE FROM wedding_rows WHERE wedding_id = ?", (wedding_id,))
+        conn.commit()
+    _shard_map_cache.pop(wedding_id, None)
+
+class WeddingMoved(Exception):
+    """A wedding moved to another shard or the archive while a request was using it (safe to retry)"""
+
+def moved_to(conn, wedding_id: str) -> Optional[int]:
+    """Where a wedding went if it was moved off the shard behind conn, else None"""
+    row = conn.execute("SELECT shard FROM moved_weddings WHERE wedding_id = ?", (wedding_id,)).fetchone()
+    return row["shard"] if row else None
+
+@contextmanager
+def get_wedding_db(wedding_id: str, write: bool = False):
+    """Connection to the shard holding a wedding.
+
+    Archived weddings are served from a read-only in-memory copy; pass write=True
+    to restore an archived wedding to its shard first. The shard map is cached per
+    process, so a tombstone left by a move (rebalance or archive, possibly run by
+    another process) redirects a stale lookup; a move that commits while the request
+    is running makes its failed write or empty read raise WeddingMoved instead.
+    """
+    for _ in range(MOVE_REROUTE_ATTEMPTS):
+        shard = shard_for_wedding(wedding_id)
+        if shard == ARCHIVED_SHARD:
+            if write:
+                shard = restore_wedding(wedding_id)
+            else:
+                payload = _load_archive_payload(wedding_id)
+                if payload is None:
+                    # Restored since the map was cached
+                    _shard_map_cache.pop(wedding_id, None)
+                    continue
+                with open_archived_wedding(wedding_id, payload) as conn:
+                    yield conn
+                return
+
+        with get_shard_db(shard) as conn:
+            moved = moved_to(conn, wedding_id)
+            if moved is not None:
+                _shard_map_cache[wedding_id] = moved
+                continue
+            try:
+                yield conn
+            except Exception as exc:
+                conn.rollback()
+                moved = moved_to(conn, wedding_id)
+                if moved is not None:
+                    _shard_map_cache[wedding_id] = moved
+                    raise WeddingMoved(wedding_id) from exc
+                raise
+            return
+    raise WeddingMoved(wedding_id)
+
+def index_wedding_rows(wedding_id: str, row_ids: List[str]):
+    """Record the wedding of newly created rows (call once their shard write has committed)"""
+    with get_db() as conn:
+        conn.executemany("INSERT OR IGNORE INTO wedding_rows (row_id, wedding_id) VALUES (?, ?)",
+                         [(row_id, wedding_id) for row_id in row_ids])
+        conn.commit()
+
+def wedding_of_row(table: str, row_id: str) -> Optional[str]:
+    """Wedding owning a wedding-scoped row, from the catalog's row index.
+
+    Rows created before the index existed are found by probing the shards once and
+    then indexed. Rows never change wedding, so entries need no invalidation.
+    """
+    with get_db() as conn:
+        row = conn.execute("SELECT wedding_id FROM wedding_rows WHERE row_id = ?", (row_id,)).fetchone()
+    if row:
+        return row["wedding_id"]
+
+    for shard in range(SHARD_COUNT):
+        with get_shard_db(shard) as conn:
+            row = conn.execute(f"SELECT wedding_id FROM {table} WHERE id = ?", (row_id,)).fetchone()
+        if row:
+            index_wedding_rows(row["wedding_id"], [row_id])
+            return row["wedding_id"]
+    return None
+
+def get_row_db(table: str, row_id: str, write: bool = False):
+    """Connection to the shard holding a wedding-scoped row looked up by its own id.
+
+    Resolves the row's wedding through the row index, then routes like get_wedding_db;
+    falls back to shard 0 when the row does not exist so callers keep their usual
+    "0 rows -> 404" handling.
+    """
+    wedding_id = wedding_of_row(table, row_id)
+    if wedding_id is None:
+        return get_shard_db(0)
+    return get_wedding_db(wedding_id, write)
+
+def weddings_by_shard(user_id: str, include_shared: bool = False) -> Dict[int, List[str]]:
+    """Active (not archived) wedding ids owned by a user - plus those shared with them if
+    include_shared - grouped by shard (catalog lookup, no scatter)"""
+    query = "SELECT wedding_id, shard FROM wedding_shards WHERE shard >= 0 AND (user_id = ?"
+    params = [user_id]
+    if include_shared:
+        query += " OR wedding_id IN (SELECT wedding_id FROM shared_access WHERE user_id = ?)"
+        params.append(user_id)
+    with get_db() as conn:
+        rows = conn.execute(query + ")", params).fetchall()
+    grouped: Dict[int, List[str]] = {}
+    for row in rows:
+        grouped.setdefault(row["shard"], []).append(row["wedding_id"])
+    return grouped
+
+# ==================== SCATTER-GATHER ====================
+
+def scatter_gather(fn: Callable, shards: Optional[List[int]] = None) -> list:
+    """Run fn(conn, shard) on every shard in parallel and return the results in shard order"""
+    if shards is None:
+        shards = list(range(SHARD_COUNT))
+
+    def run(shard):
+        with get_shard_db(shard) as conn:
+            return fn(conn, shard)
+
+    if len(shards) == 1:
+        return [run(shards[0])]
+    return list(_scatter_executor.map(run, shards))
+
+# ==================== REBALANCING ====================
+
+def migrate_wedding(wedding_id: str, target: int) -> bool:
+    """Move one wedding's rows to another shard.
+
+    The source shard's write lock is held from the copy until its rows are replaced by
+    a tombstone, so no write lands in between and gets lost. Rows are committed on the
+    target first and the shard map is flipped last (until then the tombstone routes
+    requests), so a crash at any point leaves the wedding readable. Ledger entries get
+    fresh sequence numbers on the target and snapshots are dropped; the snapshot job
+    rebuilds them.
+    """
+    source = shard_for_wedding(wedding_id)
+    if source == target or source == ARCHIVED_SHARD:
+        return False
+
+    with get_shard_db(source) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        moved = moved_to(conn, wedding_id)
+        if moved is not None:
+            # Moved by an earlier run that stopped before flipping the map
+            conn.rollback()
+            with get_db() as catalog:
+                _flip_shard_map(catalog, [wedding_id], moved)
+                catalog.commit()
+            _shard_map_cache[wedding_id] = moved
+            return False
+
+        dumps = {table: _dump_rows(conn, table, key, [wedding_id]).get(wedding_id)
+                 for table, key in ARCHIVED_SHARD_TABLES}
+        with get_shard_db(target) as copy:
+            _load_wedding_rows(copy, wedding_id, dumps)
+            copy.commit()
+
+        _drop_wedding_rows(conn, [wedding_id], target)
+        if source == 0:
+            # The catalog is this file: flip the map in the same transaction
+            _flip_shard_map(conn, [wedding_id], target)
+        conn.commit()
+
+    if source != 0:
+        with get_db() as catalog:
+            _flip_shard_map(catalog, [wedding_id], target)
+            catalog.commit()
+    _shard_map_cache[wedding_id] = target
+    return True
+
+def rebalance_shards() -> int:
+    """Register unmapped weddings, then move every wedding that is not on its hash shard"""
+    with get_db() as catalog:
+        known_shards = {row["shard"] for row in catalog.execute("SELECT DISTINCT shard FROM wedding_shards WHERE shard >= 0")}
+
+    for shard in sorted(known_shards | set(range(SHARD_COUNT))):
+        if shard != 0 and not os.path.exists(shard_path(shard)):
+            continue
+        with get_shard_db(shard) as conn:
+            weddings = conn.execute("SELECT id, user_id FROM weddings").fetchall()
+        with get_db() as catalog:
+            catalog.executemany("""
+                INSERT OR IGNORE INTO wedding_shards (wedding_id, user_id, shard) VALUES (?, ?, ?)
+            """, [(row["id"], row["user_id"], shard) for row in weddings])
+            catalog.commit()
+
+    _shard_map_cache.clear()
+    with get_db() as catalog:
+        mapped = catalog.execute("SELECT wedding_id, shard FROM wedding_shards WHERE shard >= 0").fetchall()
+
+    moved = 0
+    for row in mapped:
+        target = hash_shard(row["wedding_id"])
+        if row["shard"] != target and migrate_wedding(row["wedding_id"], target):
+            moved += 1
+    return moved
+
+def _flip_shard_map(conn, wedding_ids: List[str], shard: int):
+    placeholders = ", ".join("?" for _ in wedding_ids)
+    conn.execute(f"UPDATE wedding_shards SET shard = ? WHERE wedding_id IN ({placeholders})", [shard] + wedding_ids)
+
+def _load_wedding_rows(conn, wedding_id: str, dumps: Dict[str, Optional[dict]]):
+    """Insert one wedding's dumped shard rows (re-running after an interrupted move is safe)"""
+    conn.execute("DELETE FROM moved_weddings WHERE wedding_id = ?", (wedding_id,))
+    for table, _ in ARCHIVED_SHARD_TABLES:
+        if table == "budget_ledger":
+            # Fresh sequence numbers on the target, in the original order, without duplicating a
+            # previous attempt's entries. Snapshots taken of that attempt refer to the old numbers.
+            conn.execute("""
+                DELETE FROM budget_snapshots WHERE category_id IN (
+                    SELECT category_id FROM budget_ledger WHERE wedding_id = ?
+                )
+            """, (wedding_id,))
+            conn.execute("DELETE FROM budget_ledger WHERE wedding_id = ?", (wedding_id,))
+            _insert_rows(conn, table, dumps[table], "INSERT", skip=("seq",))
+        else:
+            _insert_rows(conn, table, dumps[table])
+
+def _drop_wedding_rows(conn, wedding_ids: List[str], moved_to_shard: int):
+    """Delete weddings' rows from a shard and leave tombstones pointing at their new home"""
+    placeholders = ", ".join("?" for _ in wedding_ids)
+    conn.execute(f"""
+        DELETE FROM budget_snapshots WHERE category_id IN (
+            SELECT id FROM budget_categories WHERE wedding_id IN ({placeholders})
+        )
+    """, wedding_ids)
+    for table, key in reversed(ARCHIVED_SHARD_TABLES):
+        conn.execute(f"DELETE FROM {table} WHERE {key} IN ({placeholders})", wedding_ids)
+    conn.executemany("INSERT OR REPLACE INTO moved_weddings (wedding_id, shard) VALUES (?, ?)",
+                     [(wedding_id, moved_to_shard) for wedding_id in wedding_ids])
+
+# ==================== ARCHIVE ====================
+
+def _dump_rows(conn, table: str, key: str, wedding_ids: List[str]) -> Dict[str, dict]:
+    """{wedding_id: {"columns": [...], "rows": [...]}} for one table, in insertion (ledger seq) order"""
+    placeholders = ", ".join("?" for _ in wedding_ids)
+    cursor = conn.execute(f"SELECT * FROM {table} WHERE {key} IN ({placeholders}) ORDER BY rowid", wedding_ids)
+    columns = [d[0] for d in cursor.description]
+    position = columns.index(key)
+    dumped: Dict[str, dict] = {}
+    for row in cursor:
+        dumped.setdefault(row[position], {"columns": columns, "rows": []})["rows"].append(list(row))
+    return dumped
+
+def _insert_rows(conn, table: str, dump: Optional[dict], verb: str = "INSERT OR REPLACE", skip: tuple = ()):
+    if not dump:
+        return
+    keep = [i for i, column in enumerate(dump["columns"]) if column not in skip]
+    columns = ", ".join(dump["columns"][i] for i in keep)
+    placeholders = ", ".join("?" for _ in keep)
+    conn.executemany(f"{verb} INTO {table} ({columns}) VALUES ({placeholders})",
+                     [[row[i] for i in keep] for row in dump["rows"]])
+
+def _archive_batch(shard: int, wedding_ids: List[str]) -> int:
+    """Copy a batch of weddings into the archive, then replace the hot rows with tombstones.
+
+    As in migrate_wedding, the shard's write lock - and the catalog's, for the catalog
+    rows - is held from the dump until the delete, so nothing written in between is lost.
+    """
+    with ExitStack() as stack:
+        conn = stack.enter_context(get_shard_db(shard))
+        conn.execute("BEGIN IMMEDIATE")
+        # Shard 0 is the catalog file: one connection, one transaction
+        catalog = conn if shard == 0 else stack.enter_context(get_db())
+        if catalog is not conn:
+            catalog.execute("BEGIN IMMEDIATE")
+
+        # Skip weddings archived or moved since they were picked
+        placeholders = ", ".join("?" for _ in wedding_ids)
+        wedding_ids = [row["id"] for row in conn.execute(
+            f"SELECT id FROM weddings WHERE id IN ({placeholders})", wedding_ids
+        )]
+        if not wedding_ids:
+            return 0
+
+        shard_dumps = {table: _dump_rows(conn, table, key, wedding_ids) for table, key in ARCHIVED_SHARD_TABLES}
+        catalog_dumps = {table: _dump_rows(catalog, table, key, wedding_ids) for table, key in ARCHIVED_CATALOG_TABLES}
+
+        records = []
+        for wedding_id in wedding_ids:
+            payload = {
+                "shard": {table: dumps.get(wedding_id) for table, dumps in shard_dumps.items()},
+                "catalog": {table: dumps.get(wedding_id) for table, dumps in catalog_dumps.items()},
+            }
+            wedding = payload["shard"]["weddings"]
+            row = dict(zip(wedding["columns"], wedding["rows"][0]))
+            records.append((wedding_id, row["user_id"], row["wedding_date"],
+                            zlib.compress(json.dumps(payload).encode("utf-8"), 9)))
+
+        with connect(archive_path()) as archive:
+            archive.executemany("""
+                INSERT OR REPLACE INTO archived_weddings (wedding_id, user_id, wedding_date, payload) VALUES (?, ?, ?, ?)
+            """, records)
+            archive.commit()
+
+        # The shard commits first: its tombstones send requests to the archive even if the
+        # catalog commit below never happens (a restore ignores the stray catalog rows)
+        _drop_wedding_rows(conn, wedding_ids, ARCHIVED_SHARD)
+        if catalog is not conn:
+            conn.commit()
+
+        placeholders = ", ".join("?" for _ in wedding_ids)
+        for table, key in ARCHIVED_CATALOG_TABLES:
+            catalog.execute(f"DELETE FROM {table} WHERE {key} IN ({placeholders})", wedding_ids)
+        # Row-id routes (/tasks/{id}, ...) must still find archived rows, whenever they were created
+        catalog.executemany("INSERT OR IGNORE INTO wedding_rows (row_id, wedding_id) VALUES (?, ?)", [
+            (row[dump["columns"].index("id")], wedding_id)
+            for table in ROW_INDEXED_TABLES
+            for wedding_id, dump in shard_dumps[table].items()
+            for row in dump["rows"]
+        ])
+        _flip_shard_map(catalog, wedding_ids, ARCHIVED_SHARD)
+        catalog.commit()
+
+    for wedding_id in wedding_ids:
+        _shard_map_cache[wedding_id] = ARCHIVED_SHARD
+    return len(wedding_ids)
+
+def archive_past_weddings(older_than_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Move weddings dated more than `older_than_days` ago into the archive.
+
+    Works shard by shard in batches of `batch_size` weddings, each batch its own short
+    transactions, so writers are never blocked for long.
+    """
+    cutoff = (date.today() - timedelta(days=older_than_days)).isoformat()
+    archived = 0
+    for shard in range(SHARD_COUNT):
+        while True:
+            with get_shard_db(shard) as conn:
+                wedding_ids = [row["id"] for row in conn.execute(
+                    "SELECT id FROM weddings WHERE wedding_date < ? LIMIT ?", (cutoff, batch_size)
+                )]
+            if not wedding_ids:
+                break
+            archived += _archive_batch(shard, wedding_ids)
+    return archived
+
+def _load_archive_payload(wedding_id: str) -> Optional[dict]:
+    with connect(archive_path()) as conn:
+        row = conn.execute("SELECT payload FROM archived_weddings WHERE wedding_id = ?", (wedding_id,)).fetchone()
+    return json.loads(zlib.decompress(row["payload"])) if row else None
+
+@contextmanager
+def open_archived_wedding(wedding_id: str, payload: Optional[dict] = None):
+    """Read-only in-memory database with the shard schema and one archived wedding's rows"""
+    if payload is None:
+        payload = _load_archive_payload(wedding_id)
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    try:
+        # Snapshots stay empty: budget totals come straight from the archived ledger
+        tables = [table for table, _ in ARCHIVED_SHARD_TABLES] + ["budget_snapshots"]
+        with get_shard_db(0) as shard:
+            schema = shard.execute(
+                f"SELECT sql FROM sqlite_master WHERE type = 'table' AND name IN ({', '.join('?' for _ in tables)})",
+                tables
+            ).fetchall()
+        for row in schema:
+            conn.execute(row["sql"])
+        if payload:
+            for table, _ in ARCHIVED_SHARD_TABLES:
+                _insert_rows(conn, table, payload["shard"][table])
+        conn.commit()
+        conn.execute("PRAGMA query_only = ON")
+        yield conn
+    finally:
+        conn.close()
+
+def restore_wedding(wedding_id: str) -> int:
+    """Move an archived wedding back to its hash shard; returns the shard it now lives on"""
+    payload = _load_archive_payload(wedding_id)
+    if payload is None:
+        # Restored concurrently (or never archived): trust the map
+        _shard_map_cache.pop(wedding_id, None)
+        shard = shard_for_wedding(wedding_id)
+        return 0 if shard == ARCHIVED_SHARD else shard
+
+    target = hash_shard(wedding_id)
+    with get_shard_db(target) as conn:
+        _load_wedding_rows(conn, wedding_id, payload["shard"])
+        conn.commit()
+
+    with get_db() as conn:
+        for table, _ in ARCHIVED_CATALOG_TABLES:
+            _insert_rows(conn, table, payload["catalog"][table], "INSERT OR IGNORE")
+        conn.execute("UPDATE wedding_shards SET shard = ? WHERE wedding_id = ?", (target, wedding_id))
+        conn.commit()
+    _shard_map_cache[wedding_id] = target
+
+    with connect(archive_path()) as conn:
+        conn.execute("DELETE FROM archived_weddings WHERE wedding_id = ?", (wedding_id,))
+        conn.commit()
+    return target
+
+# ==================== DB EXECUTOR ====================
+
+class DeadlineExceeded(Exception):
+    """Database work for a request did not finish before its deadline"""
+
+class DatabaseExecutor:
+    """Sized thread pool for blocking sqlite3 calls, with queue-depth and wait-time metrics.
+
+    Jobs whose deadline passes while they are still queued are dropped without touching
+    the database. A job that is already running cannot be interrupted; the caller stops
+    waiting for it and the job finishes in the background.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.peak_queued = 0
+        self.dequeued = 0
+        self.completed = 0
+        self.expired_in_queue = 0
+        self.deadline_exceeded = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _job(self, fn: Callable, args, kwargs, enqueued_at: float, expires_at: Optional[float]):
+        started_at = time.monotonic()
+        waited = started_at - enqueued_at
+        with self._lock:
+            self.queued -= 1
+            self.dequeued += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            if expires_at is not None and started_at >= expires_at:
+                self.expired_in_queue += 1
+                raise DeadlineExceeded(f"Queued for {waited:.2f}s")
+            self.running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    async def run(self, fn: Callable, *args, deadline: Optional[float] = None, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) on the pool; raise DeadlineExceeded after `deadline` seconds"""
+        enqueued_at = time.monotonic()
+        expires_at = enqueued_at + deadline if deadline else None
+        with self._lock:
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._pool, self._job, fn, args, kwargs, enqueued_at, expires_at)
+        if expires_at is None:
+            return await future
+        try:
+            # shield: a queued job must stay queued so it can expire itself and keep the counters right
+            return await asyncio.wait_for(asyncio.shield(future), timeout=deadline)
+        except asyncio.TimeoutError:
+            # Nobody awaits the abandoned job any more; consume its outcome when it ends
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            with self._lock:
+                self.deadline_exceeded += 1
+            raise DeadlineExceeded(f"No result within {deadline:g}s") from None
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": self.queued,
+                "running": self.running,
+                "peak_queue_depth": self.peak_queued,
+                "completed": self.completed,
+                "expired_in_queue": self.expired_in_queue,
+                "deadline_exceeded": self.deadline_exceeded,
+                "avg_queue_wait_ms": round(self.wait_seconds_total / self.dequeued * 1000, 2) if self.dequeued else 0.0,
+                "max_queue_wait_ms": round(self.wait_seconds_max * 1000, 2),
+            }
+
+db_executor = DatabaseExecutor(DB_WORKERS)
+
+def db_handler(fn: Optional[Callable] = None, *, deadline: Optional[float] = REQUEST_DEADLINE_SECONDS):
+    """Turn a blocking endpoint into an async one whose body runs on db_executor.
+
+    The wrapper keeps the original signature, so FastAPI still sees the same parameters.
+    Use as @db_handler or @db_handler(deadline=seconds); deadline=None waits forever.
+    """
+    def decorate(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        async def handler(*args, **kwargs):
+            return await db_executor.run(fn, *args, deadline=deadline, **kwargs)
+        return handler
+
+    if fn is not None:
+        return decorate(fn)
+    return decorate
@@ -3,15 +3,34 @@ Wedding Elite V2.0 - Backend API
 FastAPI application with full CRUD + Real-time support
 """
 
-from fastapi import FastAPI, HTTPException, Depends, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional, Dict
 from datetime import datetime, date, timedelta
 import sqlite3
-from contextlib import contextmanager
 import json
 import asyncio
+import hashlib
+import math
+import re
+import argparse
+import inspect
+import logging
+
+from serialization import FastJSONResponse, RowPlan, tuple_cursor, dumps, benchmark as benchmark_serialization
+from database import (
+    get_db, get_wedding_db, get_row_db, connect, all_database_paths, init_storage, install_move_guards,
+    assign_wedding_shard, forget_wedding_shard, index_wedding_rows, weddings_by_shard, scatter_gather,
+    rebalance_shards, archive_past_weddings, restore_wedding, shard_for_wedding, ARCHIVED_SHARD, WeddingMoved,
+    db_executor, db_handler, DeadlineExceeded, REQUEST_DEADLINE_SECONDS
+)
+from admission import AdmissionController
+from seating import solve_seating
+from authorization import permissions, ACCESS_CONTROL_ENABLED, NO_ACCESS, VIEW, EDIT, OWNER
+from backup import backups, BACKUPS_ENABLED, WAL_SHIP_INTERVAL_SECONDS, restore_backup, verify_backups
 
 app = FastAPI(
     title="Wedding Elite V2.0 API",
@@ -19,6 +38,128 @@ app = FastAPI(
     version="2.0.0"
 )
 
+# ==================== HTTP CACHING ====================
+
+# Reads are always revalidated (the service worker serves them stale-while-revalidate);
+# an unchanged response costs a 304 with no body
+ETAG_CACHE_CONTROL = "private, no-cache"
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+# Registered first, so it runs innermost: access control and rate limits apply before any 304
+@app.middleware("http")
+async def conditional_get(request: Request, call_next):
+    """ETag every successful JSON GET and answer If-None-Match with 304 Not Modified"""
+    response = await call_next(request)
+    if (request.method != "GET" or response.status_code != 200 or "etag" in response.headers
+            or not response.headers.get("content-type", "").startswith("application/json")):
+        return response
+
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    headers = {key: value for key, value in response.headers.items() if key != "content-length"}
+    headers["ETag"] = etag
+    headers.setdefault("cache-control", ETAG_CACHE_CONTROL)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        headers.pop("content-type", None)
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, status_code=200, headers=headers)
+
+# ==================== ACCESS CONTROL ====================
+
+# Wedding-scoped URLs: by wedding id, or by the id of a row in a wedding-scoped table
+WEDDING_PATH = re.compile(r"^/(?:weddings|ws/wedding)/([^/]+)")
+ROW_PATH = re.compile(r"^/(tasks|bookings|budget|guests|tables)/([^/]+)")
+ROW_PATH_TABLES = {"tasks": "tasks", "bookings": "vendor_bookings", "budget": "budget_categories",
+                   "guests": "guests", "tables": "seating_tables"}
+USER_PATH = re.compile(r"^/(?:users|planners)/([^/]+)")
+OWNER_ONLY_PATH = re.compile(r"^/weddings/[^/]+(?:/shares(?:/.*)?)?$")
+
+def wedding_id_from_path(path: str) -> Optional[str]:
+    match = WEDDING_PATH.match(path)
+    return match.group(1) if match else None
+
+def required_access(method: str, path: str) -> int:
+    """Level needed for a request: reads need view, writes edit; deleting or sharing a wedding needs the owner"""
+    if method in ("GET", "HEAD"):
+        return VIEW
+    if OWNER_ONLY_PATH.match(path) and (method == "DELETE" or "/shares" in path):
+        return OWNER
+    return EDIT
+
+async def access_level(user_id: str, wedding_id: str) -> int:
+    """User's level on a wedding: from the permission cache, or loaded on the DB executor"""
+    level = permissions.cached_level(user_id, wedding_id)
+    if level is None:
+        level = await db_executor.run(permissions.level, user_id, wedding_id, deadline=REQUEST_DEADLINE_SECONDS)
+    return level
+
+# Registered before admission control, so it runs inside it: rate limits apply before any permission lookup
+@app.middleware("http")
+async def access_control(request: Request, call_next):
+    """Enforce shared_access / ownership on wedding-scoped routes (X-User-Id identifies the caller)"""
+    path = request.url.path
+    if not ACCESS_CONTROL_ENABLED or request.method == "OPTIONS":
+        return await call_next(request)
+
+    user_id = request.headers.get("X-User-Id")
+    wedding_id = wedding_id_from_path(path)
+    if wedding_id is None:
+        row_match = ROW_PATH.match(path)
+        if row_match:
+            table, row_id = ROW_PATH_TABLES[row_match.group(1)], row_match.group(2)
+            wedding_id = permissions.cached_wedding_of(table, row_id)
+            if wedding_id is None:
+                wedding_id = await db_executor.run(permissions.wedding_of, table, row_id,
+                                                   deadline=REQUEST_DEADLINE_SECONDS)
+            if wedding_id is None:
+                return await call_next(request)  # unknown row: the handler answers 404
+    user_match = USER_PATH.match(path)
+
+    if wedding_id is None and user_match is None:
+        return await call_next(request)
+    if not user_id:
+        return JSONResponse(status_code=401, content={"detail": "X-User-Id header required"})
+    if user_match is not None and user_match.group(1) != user_id:
+        return JSONResponse(status_code=403, content={"detail": "Access denied"})
+    if wedding_id is not None and await access_level(user_id, wedding_id) < required_access(request.method, path):
+        return JSONResponse(status_code=403, content={"detail": "Access denied"})
+    return await call_next(request)
+
+# ==================== ADMISSION CONTROL ====================
+
+admission = AdmissionController()
+
+# Row-id routes like /tasks/{id} only get the per-IP limit
+RATE_LIMIT_EXEMPT_PATHS = {"/health"}
+
+def client_ip(connection) -> str:
+    return connection.client.host if connection.client else "unknown"
+
+# Registered before CORS so CORS wraps it and 429/503 responses stay readable by the browser
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """Per-IP / per-wedding rate limits, then the global in-flight limit"""
+    if request.method == "OPTIONS" or request.url.path in RATE_LIMIT_EXEMPT_PATHS:
+        return await call_next(request)
+
+    retry_after = admission.check_rate("http", client_ip(request), wedding_id_from_path(request.url.path))
+    if retry_after:
+        return JSONResponse(status_code=429, content={"detail": "Too many requests"},
+                            headers={"Retry-After": str(math.ceil(retry_after))})
+
+    if not admission.acquire():
+        return JSONResponse(status_code=503, content={"detail": "Server busy, please retry"},
+                            headers={"Retry-After": "1"})
+    try:
+        return await call_next(request)
+    finally:
+        admission.release()
+
 # CORS Configuration
 app.add_middleware(
     CORSMiddleware,
@@ -26,173 +167,431 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Retry-After"],
 )
 
-# ==================== DATABASE ====================
-DATABASE = "wedding_elite_v2.db"
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    """Database work missed the request deadline - ask the client to retry shortly"""
+    return JSONResponse(status_code=503, content={"detail": "Server busy, please retry"},
+                        headers={"Retry-After": "1"})
 
-@contextmanager
-def get_db():
-    """Context manager for database connections"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-    finally:
-        conn.close()
+@app.exception_handler(WeddingMoved)
+async def wedding_moved_handler(request: Request, exc: WeddingMoved):
+    """The wedding changed shards mid-request - a retry is routed to its new home"""
+    return JSONResponse(status_code=503, content={"detail": "Wedding is being moved, please retry"},
+                        headers={"Retry-After": "1"})
+
+# ==================== DATABASE ====================
+# Bayesian prior for vendor ranking: every vendor starts with
+# REVIEW_PRIOR_WEIGHT pseudo-reviews of REVIEW_PRIOR_MEAN stars
+REVIEW_PRIOR_MEAN = 4.0
+REVIEW_PRIOR_WEIGHT = 5
+
+def add_column_if_missing(cursor, table: str, column: str, definition: str) -> bool:
+    """Add a column to an existing table (schema migration for older databases)"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    if any(row["name"] == column for row in cursor.fetchall()):
+        return False
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return True
 
 def init_database():
-    """Initialize database with all tables"""
-    with get_db() as conn:
-        cursor = conn.cursor()
-        
-        # Users table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id TEXT PRIMARY KEY,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                user_type TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Weddings table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS weddings (
-                id TEXT PRIMARY KEY,
-                user_id TEXT NOT NULL,
-                groom_name TEXT NOT NULL,
-                bride_name TEXT NOT NULL,
-                wedding_date DATE NOT NULL,
-                venue_name TEXT,
-                guest_count INTEGER DEFAULT 400,
-                total_budget REAL DEFAULT 165000,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
-        
-        # Budget categories table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS budget_categories (
-                id TEXT PRIMARY KEY,
-                wedding_id TEXT NOT NULL,
-                name TEXT NOT NULL,
-                icon TEXT,
-                planned_amount REAL NOT NULL,
-                actual_amount REAL DEFAULT 0,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (wedding_id) REFERENCES weddings (id) ON DELETE CASCADE
-            )
-        """)
-        
-        # Vendors (marketplace)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS vendors (
-                id TEXT PRIMARY KEY,
-                business_name TEXT NOT NULL,
-                category TEXT NOT NULL,
-                description TEXT,
-                price_range_min REAL,
-                price_range_max REAL,
-                location TEXT,
-                phone TEXT,
-                email TEXT,
-                website TEXT,
-                instagram TEXT,
-                rating REAL DEFAULT 0,
-                review_count INTEGER DEFAULT 0,
-                is_verified INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Vendor bookings (couple's vendors)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS vendor_bookings (
-                id TEXT PRIMARY KEY,
-                wedding_id TEXT NOT NULL,
-                vendor_id TEXT,
-                category_id TEXT NOT NULL,
-                vendor_name TEXT NOT NULL,
-                amount REAL NOT NULL,
-                deposit_paid REAL DEFAULT 0,
-                payment_due_date DATE,
-                status TEXT DEFAULT 'pending',
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (wedding_id) REFERENCES weddings (id) ON DELETE CASCADE,
-                FOREIGN KEY (vendor_id) REFERENCES vendors (id),
-                FOREIGN KEY (category_id) REFERENCES budget_categories (id)
-            )
-        """)
-        
-        # Tasks table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS tasks (
-                id TEXT PRIMARY KEY,
-                wedding_id TEXT NOT NULL,
-                title TEXT NOT NULL,
-                description TEXT,
-                timeline_period TEXT,
-                due_date DATE,
-                is_completed INTEGER DEFAULT 0,
-                is_urgent INTEGER DEFAULT 0,
-                completed_at TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (wedding_id) REFERENCES weddings (id) ON DELETE CASCADE
-            )
-        """)
-        
-        # Reviews table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS reviews (
-                id TEXT PRIMARY KEY,
-                wedding_id TEXT NOT NULL,
-                vendor_id TEXT NOT NULL,
-                rating INTEGER CHECK (rating >= 1 AND rating <= 5),
-                comment TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (wedding_id) REFERENCES weddings (id),
-                FOREIGN KEY (vendor_id) REFERENCES vendors (id)
-            )
-        """)
-        
-        # Shared access table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS shared_access (
-                id TEXT PRIMARY KEY,
-                wedding_id TEXT NOT NULL,
-                user_id TEXT NOT NULL,
-                access_type TEXT NOT NULL,
-                can_edit INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (wedding_id) REFERENCES weddings (id) ON DELETE CASCADE,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
-        
-        # Notifications table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS notifications (
-                id TEXT PRIMARY KEY,
-                user_id TEXT NOT NULL,
-                wedding_id TEXT,
-                title TEXT NOT NULL,
-                body TEXT NOT NULL,
-                type TEXT,
-                is_read INTEGER DEFAULT 0,
-                action_url TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id),
-                FOREIGN KEY (wedding_id) REFERENCES weddings (id)
-            )
-        """)
-        
-        conn.commit()
+    """Initialize the catalog and every shard with all tables"""
+    init_storage()
+
+    for path in all_database_paths():
+        with connect(path) as conn:
+            cursor = conn.cursor()
+
+            # Users table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS users (
+                    id TEXT PRIMARY KEY,
+                    email TEXT UNIQUE NOT NULL,
+                    password_hash TEXT NOT NULL,
+                    user_type TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # Weddings table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS weddings (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    groom_name TEXT NOT NULL,
+                    bride_name TEXT NOT NULL,
+                    wedding_date DATE NOT NULL,
+                    venue_name TEXT,
+                    guest_count INTEGER DEFAULT 400,
+                    total_budget REAL DEFAULT 165000,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (id)
+                )
+            """)
+
+            # Budget categories table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS budget_categories (
+                    id TEXT PRIMARY KEY,
+                    wedding_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    icon TEXT,
+                    planned_amount REAL NOT NULL,
+                    actual_amount REAL DEFAULT 0,  -- legacy, totals now come from budget_ledger
+                    notes TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (wedding_id) REFERENCES weddings (id) ON DELETE CASCADE
+                )
+            """)
+
+            # Vendors (marketplace)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS vendors (
+                    id TEXT PRIMARY KEY,
+                    business_name TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    description TEXT,
+                    price_range_min REAL,
+                    price_range_max REAL,
+                    location TEXT,
+                    phone TEXT,
+                    email TEXT,
+                    website TEXT,
+                    instagram TEXT,
+                    rating REAL DEFAULT 0,
+                    review_count INTEGER DEFAULT 0,
+                    is_verified INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # Running review aggregate (kept up to date by review writes)
+            if add_column_if_missing(cursor, "vendors", "rating_sum", "REAL NOT NULL DEFAULT 0"):
+                cursor.execute("UPDATE vendors SET rating_sum = rating * review_count")
+            if add_column_if_missing(cursor, "vendors", "ranking_score", f"REAL NOT NULL DEFAULT {REVIEW_PRIOR_MEAN}"):
+                cursor.execute("""
+                    UPDATE vendors SET ranking_score = (? * ? + rating_sum) / (? + review_count)
+                """, (REVIEW_PRIOR_WEIGHT, REVIEW_PRIOR_MEAN, REVIEW_PRIOR_WEIGHT))
+
+            # How many events a vendor can take on one day (overridable per day)
+            add_column_if_missing(cursor, "vendors", "daily_capacity", "INTEGER NOT NULL DEFAULT 1")
+
+            # Vendor blocked date ranges (inclusive)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS vendor_blocked_dates (
+                    id TEXT PRIMARY KEY,
+                    vendor_id TEXT NOT NULL,
+                    start_date DATE NOT NULL,
+                    end_date DATE NOT NULL,
+                    reason TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (vendor_id) REFERENCES vendors (id) ON DELETE CASCADE
+                )
+            """)
+
+            # Vendor per-day capacity overrides
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS vendor_day_capacity (
+                    vendor_id TEXT NOT NULL,
+                    day DATE NOT NULL,
+                    capacity INTEGER NOT NULL,
+                    PRIMARY KEY (vendor_id, day),
+                    FOREIGN KEY (vendor_id) REFERENCES vendors (id) ON DELETE CASCADE
+                )
+            """)
+
+            # Vendor bookings (couple's vendors)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS vendor_bookings (
+                    id TEXT PRIMARY KEY,
+                    wedding_id TEXT NOT NULL,
+                    vendor_id TEXT,
+                    category_id TEXT NOT NULL,
+                    vendor_name TEXT NOT NULL,
+                    amount REAL NOT NULL,
+                    deposit_paid REAL DEFAULT 0,
+                    payment_due_date DATE,
+                    status TEXT DEFAULT 'pending',
+                    notes TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (wedding_id) REFERENCES weddings (id) ON DELETE CASCADE,
+                    FOREIGN KEY (vendor_id) REFERENCES vendors (id),
+                    FOREIGN KEY (category_id) REFERENCES budget_categories (id)
+                )
+            """)
+
+            # Date the vendor works the event (defaults to the wedding date)
+            if add_column_if_missing(cursor, "vendor_bookings", "event_date", "DATE"):
+                cursor.execute("""
+                    UPDATE vendor_bookings SET event_date = (
+                        SELECT wedding_date FROM weddings WHERE weddings.id = vendor_bookings.wedding_id
+                    ) WHERE vendor_id IS NOT NULL
+                """)
+
+            # Vendor event claims: catalog copy of vendor-linked bookings so availability
+            # can be checked without querying every wedding shard
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'vendor_event_claims'")
+            claims_exist = cursor.fetchone() is not None
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS vendor_event_claims (
+                    booking_id TEXT PRIMARY KEY,
+                    vendor_id TEXT NOT NULL,
+                    wedding_id TEXT NOT NULL,
+                    event_date DATE NOT NULL,
+                    status TEXT
+                )
+            """)
+            if not claims_exist:
+                cursor.execute("""
+                    INSERT INTO vendor_event_claims (booking_id, vendor_id, wedding_id, event_date, status)
+                    SELECT id, vendor_id, wedding_id, event_date, status FROM vendor_bookings
+                    WHERE vendor_id IS NOT NULL AND event_date IS NOT NULL
+                """)
+
+            # Tasks table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id TEXT PRIMARY KEY,
+                    wedding_id TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    description TEXT,
+                    timeline_period TEXT,
+                    due_date DATE,
+                    is_completed INTEGER DEFAULT 0,
+                    is_urgent INTEGER DEFAULT 0,
+                    completed_at TIMESTAMP,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (wedding_id) REFERENCES weddings (id) ON DELETE CASCADE
+                )
+            """)
+
+            # Guest list, tables and seating constraints
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS guests (
+                    id TEXT PRIMARY KEY,
+                    wedding_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    phone TEXT,
+                    email TEXT,
+                    side TEXT,
+                    group_name TEXT,
+                    party_size INTEGER DEFAULT 1,
+                    rsvp_status TEXT DEFAULT 'pending',
+                    dietary TEXT,
+                    table_id TEXT,
+                    seat_locked INTEGER DEFAULT 0,
+                    notes TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (wedding_id) REFERENCES weddings (id) ON DELETE CASCADE
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS seating_tables (
+                    id TEXT PRIMARY KEY,
+                    wedding_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    capacity INTEGER DEFAULT 12,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (wedding_id) REFERENCES weddings (id) ON DELETE CASCADE
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS seating_constraints (
+                    id TEXT PRIMARY KEY,
+                    wedding_id TEXT NOT NULL,
+                    guest_id TEXT NOT NULL,
+                    other_guest_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (wedding_id) REFERENCES weddings (id) ON DELETE CASCADE
+                )
+            """)
+
+            # Reviews table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS reviews (
+                    id TEXT PRIMARY KEY,
+                    wedding_id TEXT NOT NULL,
+                    vendor_id TEXT NOT NULL,
+                    rating INTEGER CHECK (rating >= 1 AND rating <= 5),
+                    comment TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (wedding_id) REFERENCES weddings (id),
+                    FOREIGN KEY (vendor_id) REFERENCES vendors (id)
+                )
+            """)
+
+            # Shared access table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS shared_access (
+                    id TEXT PRIMARY KEY,
+                    wedding_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    access_type TEXT NOT NULL,
+                    can_edit INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (wedding_id) REFERENCES weddings (id) ON DELETE CASCADE,
+                    FOREIGN KEY (user_id) REFERENCES users (id)
+                )
+            """)
+
+            # Notifications table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS notifications (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    wedding_id TEXT,
+                    title TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    type TEXT,
+                    is_read INTEGER DEFAULT 0,
+                    action_url TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (id),
+                    FOREIGN KEY (wedding_id) REFERENCES weddings (id)
+                )
+            """)
+
+            # Budget ledger (append-only spending entries; replaces budget_categories.actual_amount)
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'budget_ledger'")
+            ledger_exists = cursor.fetchone() is not None
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS budget_ledger (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    category_id TEXT NOT NULL,
+                    wedding_id TEXT NOT NULL,
+                    booking_id TEXT,
+                    delta REAL NOT NULL,
+                    reason TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            if not ledger_exists:
+                # Carry over totals accumulated before the ledger existed
+                cursor.execute("""
+                    INSERT INTO budget_ledger (category_id, wedding_id, delta, reason)
+                    SELECT id, wedding_id, actual_amount, 'opening_balance'
+                    FROM budget_categories WHERE actual_amount != 0
+                """)
+
+            # Budget snapshots (category total as of a ledger seq)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS budget_snapshots (
+                    category_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    total REAL NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (category_id, seq)
+                )
+            """)
+
+            # Unread notification counters (maintained by triggers, never by COUNT)
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'notification_counters'")
+            counters_exist = cursor.fetchone() is not None
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS notification_counters (
+                    user_id TEXT PRIMARY KEY,
+                    unread_count INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            if not counters_exist:
+                # One-time backfill for databases created before the counters existed
+                cursor.execute("""
+                    INSERT INTO notification_counters (user_id, unread_count)
+                    SELECT user_id, COUNT(*) FROM notifications WHERE is_read = 0 GROUP BY user_id
+                """)
+
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS notifications_unread_insert
+                AFTER INSERT ON notifications WHEN NEW.is_read = 0
+                BEGIN
+                    INSERT INTO notification_counters (user_id, unread_count) VALUES (NEW.user_id, 1)
+                    ON CONFLICT (user_id) DO UPDATE SET unread_count = unread_count + 1;
+                END
+            """)
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS notifications_unread_update
+                AFTER UPDATE OF is_read ON notifications WHEN OLD.is_read != NEW.is_read
+                BEGIN
+                    INSERT INTO notification_counters (user_id, unread_count)
+                    VALUES (NEW.user_id, CASE WHEN NEW.is_read = 0 THEN 1 ELSE -1 END)
+                    ON CONFLICT (user_id) DO UPDATE SET unread_count = unread_count + excluded.unread_count;
+                END
+            """)
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS notifications_unread_delete
+                AFTER DELETE ON notifications WHEN OLD.is_read = 0
+                BEGIN
+                    UPDATE notification_counters SET unread_count = unread_count - 1
+                    WHERE user_id = OLD.user_id;
+                END
+            """)
+
+            # Stored results of POSTs sent with an Idempotency-Key (response is NULL while executing)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS idempotency_keys (
+                    scope TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    request_hash TEXT NOT NULL,
+                    response TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (scope, key)
+                )
+            """)
+
+            # Indexes
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_notifications_user_created
+                ON notifications (user_id, created_at DESC, id DESC)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_notifications_read_created
+                ON notifications (created_at) WHERE is_read = 1
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_weddings_user ON weddings (user_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_weddings_date ON weddings (wedding_date)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_shared_access_user ON shared_access (user_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_shared_access_wedding ON shared_access (wedding_id, user_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys (created_at)")
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_reviews_vendor_created
+                ON reviews (vendor_id, created_at DESC, id DESC)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_vendors_category_score
+                ON vendors (category, ranking_score DESC, review_count DESC)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_vendor_blocked_dates_vendor
+                ON vendor_blocked_dates (vendor_id, start_date, end_date)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_vendor_event_claims_vendor
+                ON vendor_event_claims (vendor_id, event_date, status)
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_vendor_event_claims_wedding ON vendor_event_claims (wedding_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_budget_categories_wedding ON budget_categories (wedding_id)")
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_guests_wedding_rsvp
+                ON guests (wedding_id, rsvp_status, party_size)
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_seating_tables_wedding ON seating_tables (wedding_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_seating_constraints_wedding ON seating_constraints (wedding_id)")
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_budget_ledger_category
+                ON budget_ledger (category_id, seq, delta)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_vendor_bookings_wedding_due
+                ON vendor_bookings (wedding_id, payment_due_date, status, amount, deposit_paid)
+            """)
+            install_move_guards(conn)
+
+            conn.commit()
 
 # Initialize database on startup
 init_database()
@@ -206,6 +605,11 @@ class WeddingCreate(BaseModel):
     total_budget: Optional[float] = 165000
     guest_count: Optional[int] = 400
 
+class ShareCreate(BaseModel):
+    user_id: str
+    access_type: str = "partner"
+    can_edit: bool = False
+
 class WeddingUpdate(BaseModel):
     groom_name: Optional[str] = None
     bride_name: Optional[str] = None
@@ -255,6 +659,20 @@ class VendorCreate(BaseModel):
     email: Optional[str] = ""
     website: Optional[str] = ""
     instagram: Optional[str] = ""
+    daily_capacity: Optional[int] = Field(1, ge=1)
+
+class VendorBlockCreate(BaseModel):
+    start_date: date
+    end_date: date
+    reason: Optional[str] = ""
+
+class VendorCapacityUpdate(BaseModel):
+    capacity: int = Field(..., ge=0)
+
+class ReviewCreate(BaseModel):
+    wedding_id: str
+    rating: int = Field(..., ge=1, le=5)
+    comment: Optional[str] = ""
 
 class VendorBookingCreate(BaseModel):
     vendor_id: Optional[str] = None
@@ -263,6 +681,7 @@ class VendorBookingCreate(BaseModel):
     amount: float
     deposit_paid: Optional[float] = 0
     payment_due_date: Optional[date] = None
+    event_date: Optional[date] = None
     notes: Optional[str] = ""
 
 class VendorBookingUpdate(BaseModel):
@@ -270,6 +689,7 @@ class VendorBookingUpdate(BaseModel):
     amount: Optional[float] = None
     deposit_paid: Optional[float] = None
     payment_due_date: Optional[date] = None
+    event_date: Optional[date] = None
     status: Optional[str] = None
     notes: Optional[str] = None
 
@@ -286,6 +706,52 @@ class TaskUpdate(BaseModel):
     due_date: Optional[date] = None
     is_urgent: Optional[bool] = None
 
+class GuestCreate(BaseModel):
+    name: str
+    phone: Optional[str] = None
+    email: Optional[str] = None
+    side: Optional[str] = None
+    group_name: Optional[str] = None
+    party_size: int = Field(1, ge=1, le=20)
+    rsvp_status: str = "pending"
+    dietary: Optional[str] = None
+    notes: Optional[str] = None
+
+class GuestUpdate(BaseModel):
+    name: Optional[str] = None
+    phone: Optional[str] = None
+    email: Optional[str] = None
+    side: Optional[str] = None
+    group_name: Optional[str] = None
+    party_size: Optional[int] = Field(None, ge=1, le=20)
+    dietary: Optional[str] = None
+    notes: Optional[str] = None
+    table_id: Optional[str] = None
+    seat_locked: Optional[bool] = None
+
+class GuestImport(BaseModel):
+    guests: List[GuestCreate] = Field(..., max_length=5000)
+
+class RsvpUpdate(BaseModel):
+    rsvp_status: str
+    party_size: Optional[int] = Field(None, ge=1, le=20)
+
+class SeatingTableCreate(BaseModel):
+    name: str
+    capacity: int = Field(12, ge=1, le=100)
+
+class SeatingTableUpdate(BaseModel):
+    name: Optional[str] = None
+    capacity: Optional[int] = Field(None, ge=1, le=100)
+
+class SeatingConstraintCreate(BaseModel):
+    guest_id: str
+    other_guest_id: str
+    kind: str  # together / apart
+
+class SeatingSolveRequest(BaseModel):
+    incremental: bool = True
+
 class DashboardResponse(BaseModel):
     days_remaining: int
     control_percentage: int
@@ -296,6 +762,64 @@ class DashboardResponse(BaseModel):
     budget_actual: float
     budget_remaining: float
     budget_percentage: float
+    guests_invited: int = 0
+    guests_attending: int = 0
+    guests_pending: int = 0
+    guests_declined: int = 0
+
+class PortfolioWedding(BaseModel):
+    wedding_id: str
+    groom_name: str
+    bride_name: str
+    wedding_date: date
+    role: str  # owner / shared
+    days_remaining: int
+    control_percentage: int
+    tasks_urgent: int
+    tasks_total: int
+    budget_planned: float
+    budget_actual: float
+    budget_percentage: float
+    risk_score: float
+    risk_level: str
+
+class PortfolioPage(BaseModel):
+    items: List[PortfolioWedding]
+    next_cursor: Optional[str]
+    total: int
+    risk_counts: Dict[str, int]
+
+class CashflowBucket(BaseModel):
+    period_start: str
+    outstanding: float
+    overdue: float
+    bookings: int
+    cumulative: float
+
+class CashflowResponse(BaseModel):
+    granularity: str
+    total_outstanding: float
+    total_overdue: float
+    unscheduled: float
+    buckets: List[CashflowBucket]
+
+class NotificationResponse(BaseModel):
+    id: str
+    wedding_id: Optional[str]
+    title: str
+    body: str
+    type: Optional[str]
+    is_read: bool
+    action_url: Optional[str]
+    created_at: str
+
+class NotificationPage(BaseModel):
+    items: List[NotificationResponse]
+    next_cursor: Optional[str]
+    unread_count: int
+
+class NotificationReadRequest(BaseModel):
+    ids: List[str] = Field(..., max_length=1000)
 
 # ==================== HELPER FUNCTIONS ====================
 
@@ -356,10 +880,128 @@ def get_default_tasks(wedding_date: date):
     
     return tasks
 
+# ==================== IDEMPOTENCY ====================
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+IDEMPOTENCY_TTL_HOURS = 24
+IDEMPOTENCY_MAX_KEYS = 100000
+IDEMPOTENCY_PRUNE_INTERVAL_SECONDS = 600
+# A key still marked as executing after this long belongs to a crashed process and may be retried
+IDEMPOTENCY_LEASE_SECONDS = 3 * REQUEST_DEADLINE_SECONDS
+
+# (scope, key) -> (request_hash, future) for executions in progress in this process
+_idempotency_in_flight: Dict[tuple, tuple] = {}
+
+def _execute_idempotent(scope: str, key: str, request_hash: str, fn, args: tuple):
+    """Claim the key, run fn and store its result - or return the stored result (DB thread)"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT OR IGNORE INTO idempotency_keys (scope, key, request_hash) VALUES (?, ?, ?)
+        """, (scope, key, request_hash))
+        if cursor.rowcount == 0:
+            cursor.execute("""
+                SELECT request_hash, response, (julianday('now') - julianday(created_at)) * 86400 AS age
+                FROM idempotency_keys WHERE scope = ? AND key = ?
+            """, (scope, key))
+            row = cursor.fetchone()
+            if row["request_hash"] != request_hash:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+            if row["response"] is not None:
+                return json.loads(row["response"]), True
+            if row["age"] < IDEMPOTENCY_LEASE_SECONDS:
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress",
+                                    headers={"Retry-After": "1"})
+            # Abandoned claim: take it over
+            cursor.execute("""
+                UPDATE idempotency_keys SET created_at = CURRENT_TIMESTAMP
+                WHERE scope = ? AND key = ? AND response IS NULL
+            """, (scope, key))
+        conn.commit()
+
+    try:
+        content = jsonable_encoder(fn(*args))
+    except Exception:
+        # Failed requests are not remembered; a retry executes again
+        with get_db() as conn:
+            conn.execute("DELETE FROM idempotency_keys WHERE scope = ? AND key = ?", (scope, key))
+            conn.commit()
+        raise
+
+    with get_db() as conn:
+        conn.execute("""
+            UPDATE idempotency_keys SET response = ?, created_at = CURRENT_TIMESTAMP WHERE scope = ? AND key = ?
+        """, (json.dumps(content), scope, key))
+        conn.commit()
+    return content, False
+
+async def run_idempotent(idempotency_key: Optional[str], scope: str, payload: BaseModel, fn, *args):
+    """Run a create handler body on the DB executor at most once per Idempotency-Key.
+
+    Retries get the stored response (with an Idempotent-Replayed header). Concurrent
+    duplicates in this process wait for the first execution and share its outcome.
+    """
+    if idempotency_key is None:
+        return await db_executor.run(fn, *args, deadline=REQUEST_DEADLINE_SECONDS)
+    if not idempotency_key or len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail="Invalid Idempotency-Key")
+
+    request_hash = hashlib.sha256(
+        json.dumps(jsonable_encoder(payload), sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    slot = (scope, idempotency_key)
+
+    in_flight = _idempotency_in_flight.get(slot)
+    if in_flight is not None:
+        in_flight_hash, future = in_flight
+        if in_flight_hash != request_hash:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        content, _ = await asyncio.shield(future)
+        return JSONResponse(content=content, headers={"Idempotent-Replayed": "true"})
+
+    future = asyncio.get_running_loop().create_future()
+    # Waiters re-raise failures themselves; don't warn when there are none
+    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    _idempotency_in_flight[slot] = (request_hash, future)
+    try:
+        content, replayed = await db_executor.run(
+            _execute_idempotent, scope, idempotency_key, request_hash, fn, args,
+            deadline=REQUEST_DEADLINE_SECONDS
+        )
+        future.set_result((content, replayed))
+    except Exception as exc:
+        future.set_exception(exc)
+        raise
+    finally:
+        if not future.done():
+            future.cancel()
+        del _idempotency_in_flight[slot]
+
+    if replayed:
+        return JSONResponse(content=content, headers={"Idempotent-Replayed": "true"})
+    return content
+
+def prune_idempotency_keys(ttl_hours: int = IDEMPOTENCY_TTL_HOURS, max_keys: int = IDEMPOTENCY_MAX_KEYS) -> int:
+    """Forget keys older than the TTL, then the oldest completed keys beyond max_keys"""
+    cutoff = (datetime.utcnow() - timedelta(hours=ttl_hours)).strftime("%Y-%m-%d %H:%M:%S")
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM idempotency_keys WHERE created_at < ?", (cutoff,))
+        deleted = cursor.rowcount
+        cursor.execute("""
+            DELETE FROM idempotency_keys WHERE rowid IN (
+                SELECT rowid FROM idempotency_keys WHERE response IS NOT NULL
+                ORDER BY created_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (max_keys,))
+        deleted += cursor.rowcount
+        conn.commit()
+    return deleted
+
 # ==================== API ENDPOINTS ====================
 
 @app.get("/")
-def root():
+async def root():
     """API root"""
     return {
         "message": "Wedding Elite V2.0 API",
@@ -370,12 +1012,19 @@ def root():
 # ==================== WEDDINGS ====================
 
 @app.post("/weddings", response_model=WeddingResponse)
-def create_wedding(wedding: WeddingCreate):
-    """Create a new wedding"""
+async def create_wedding(wedding: WeddingCreate, idempotency_key: Optional[str] = Header(None),
+                         x_user_id: Optional[str] = Header(None)):
+    """Create a new wedding (safe to retry with an Idempotency-Key header)"""
+    scope = f"POST /weddings as {x_user_id}" if x_user_id else "POST /weddings"
+    return await run_idempotent(idempotency_key, scope, wedding, _create_wedding, wedding, x_user_id)
+
+def _create_wedding(wedding: WeddingCreate, owner_id: Optional[str] = None) -> WeddingResponse:
     wedding_id = generate_id()
-    user_id = generate_id()  # Simplified - in production use auth
+    user_id = owner_id or generate_id()  # Simplified - in production use auth
+    assign_wedding_shard(wedding_id, user_id)
+    permissions.invalidate(user_id)
     
-    with get_db() as conn:
+    with get_wedding_db(wedding_id) as conn:
         cursor = conn.cursor()
         
         # Insert wedding
@@ -386,8 +1035,10 @@ def create_wedding(wedding: WeddingCreate):
               wedding.wedding_date, wedding.total_budget, wedding.guest_count))
         
         # Add default categories
+        row_ids = []
         for category in get_default_categories():
             cat_id = generate_id()
+            row_ids.append(cat_id)
             cursor.execute("""
                 INSERT INTO budget_categories (id, wedding_id, name, icon, planned_amount)
                 VALUES (?, ?, ?, ?, ?)
@@ -396,12 +1047,14 @@ def create_wedding(wedding: WeddingCreate):
         # Add default tasks
         for task in get_default_tasks(wedding.wedding_date):
             task_id = generate_id()
+            row_ids.append(task_id)
             cursor.execute("""
                 INSERT INTO tasks (id, wedding_id, title, timeline_period, is_urgent)
                 VALUES (?, ?, ?, ?, ?)
             """, (task_id, wedding_id, task["title"], task["timeline_period"], task["is_urgent"]))
         
         conn.commit()
+    index_wedding_rows(wedding_id, row_ids)
     
     return WeddingResponse(
         id=wedding_id,
@@ -415,9 +1068,10 @@ def create_wedding(wedding: WeddingCreate):
     )
 
 @app.get("/weddings/{wedding_id}", response_model=WeddingResponse)
+@db_handler
 def get_wedding(wedding_id: str):
     """Get wedding details"""
-    with get_db() as conn:
+    with get_wedding_db(wedding_id) as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM weddings WHERE id = ?", (wedding_id,))
         row = cursor.fetchone()
@@ -439,9 +1093,10 @@ def get_wedding(wedding_id: str):
         )
 
 @app.put("/weddings/{wedding_id}")
+@db_handler
 def update_wedding(wedding_id: str, update: WeddingUpdate):
     """Update wedding details (EDITABLE)"""
-    with get_db() as conn:
+    with get_wedding_db(wedding_id, write=True) as conn:
         cursor = conn.cursor()
         
         # Build dynamic update query
@@ -470,20 +1125,47 @@ def update_wedding(wedding_id: str, update: WeddingUpdate):
         updates.append("updated_at = CURRENT_TIMESTAMP")
         values.append(wedding_id)
         
-        if updates:
+        # Vendor bookings on the wedding date follow it; move their claims first (409 if a
+        # vendor is taken on the new date) and put them back if the update does not commit
+        following = []
+        if update.wedding_date is not None:
+            cursor.execute("SELECT wedding_date FROM weddings WHERE id = ?", (wedding_id,))
+            wedding = cursor.fetchone()
+            if not wedding:
+                raise HTTPException(status_code=404, detail="Wedding not found")
+            old_date = wedding["wedding_date"]
+            if str(update.wedding_date) != old_date:
+                cursor.execute("""
+                    SELECT id FROM vendor_bookings
+                    WHERE wedding_id = ? AND vendor_id IS NOT NULL AND event_date = ?
+                """, (wedding_id, old_date))
+                following = [row["id"] for row in cursor.fetchall()]
+                move_vendor_claims(following, update.wedding_date)
+        
+        try:
             query = f"UPDATE weddings SET {', '.join(updates)} WHERE id = ?"
             cursor.execute(query, values)
+            if cursor.rowcount == 0:
+                raise HTTPException(status_code=404, detail="Wedding not found")
+            if following:
+                placeholders = ", ".join("?" for _ in following)
+                cursor.execute(f"UPDATE vendor_bookings SET event_date = ? WHERE id IN ({placeholders})",
+                               [update.wedding_date] + following)
             conn.commit()
-        
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Wedding not found")
+        except Exception:
+            # Roll back first: on shard 0 the open write would block the catalog
+            conn.rollback()
+            if following:
+                move_vendor_claims(following, old_date, check=False)
+            raise
     
     return {"message": "Wedding updated successfully"}
 
 @app.delete("/weddings/{wedding_id}")
+@db_handler
 def delete_wedding(wedding_id: str):
     """Delete wedding"""
-    with get_db() as conn:
+    with get_wedding_db(wedding_id, write=True) as conn:
         cursor = conn.cursor()
         cursor.execute("DELETE FROM weddings WHERE id = ?", (wedding_id,))
         conn.commit()
@@ -491,14 +1173,210 @@ def delete_wedding(wedding_id: str):
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Wedding not found")
     
+    # Free the wedding's vendor dates, revoke its shares and drop it from the shard map
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT user_id FROM wedding_shards WHERE wedding_id = ?", (wedding_id,))
+        affected_users = [row["user_id"] for row in cursor.fetchall()]
+        cursor.execute("SELECT user_id FROM shared_access WHERE wedding_id = ?", (wedding_id,))
+        affected_users += [row["user_id"] for row in cursor.fetchall()]
+        cursor.execute("DELETE FROM vendor_event_claims WHERE wedding_id = ?", (wedding_id,))
+        cursor.execute("DELETE FROM shared_access WHERE wedding_id = ?", (wedding_id,))
+        conn.commit()
+    forget_wedding_shard(wedding_id)
+    permissions.invalidate(*affected_users)
+    
     return {"message": "Wedding deleted successfully"}
 
+@app.post("/weddings/{wedding_id}/restore")
+@db_handler
+def restore_archived_wedding(wedding_id: str):
+    """Bring an archived wedding back into the active tables"""
+    if shard_for_wedding(wedding_id) != ARCHIVED_SHARD:
+        raise HTTPException(status_code=404, detail="Archived wedding not found")
+    restore_wedding(wedding_id)
+    return {"message": "Wedding restored successfully"}
+
+# ==================== SHARED ACCESS ====================
+
+@app.get("/weddings/{wedding_id}/shares")
+@db_handler
+def get_shares(wedding_id: str):
+    """Get collaborators of a wedding"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT user_id, access_type, can_edit, created_at FROM shared_access
+            WHERE wedding_id = ? ORDER BY created_at
+        """, (wedding_id,))
+        return [{
+            "user_id": row["user_id"],
+            "access_type": row["access_type"],
+            "can_edit": bool(row["can_edit"]),
+            "created_at": row["created_at"]
+        } for row in cursor.fetchall()]
+
+@app.post("/weddings/{wedding_id}/shares")
+@db_handler
+def grant_access(wedding_id: str, share: ShareCreate):
+    """Share a wedding with another user (or change their access)"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM wedding_shards WHERE wedding_id = ?", (wedding_id,))
+        if not cursor.fetchone():
+            raise HTTPException(status_code=404, detail="Wedding not found")
+
+        cursor.execute("""
+            UPDATE shared_access SET access_type = ?, can_edit = ? WHERE wedding_id = ? AND user_id = ?
+        """, (share.access_type, share.can_edit, wedding_id, share.user_id))
+        if cursor.rowcount == 0:
+            cursor.execute("""
+                INSERT INTO shared_access (id, wedding_id, user_id, access_type, can_edit)
+                VALUES (?, ?, ?, ?, ?)
+            """, (generate_id(), wedding_id, share.user_id, share.access_type, share.can_edit))
+            create_notification(cursor, share.user_id, "A wedding was shared with you",
+                                f"You can now {'edit' if share.can_edit else 'view'} this wedding",
+                                wedding_id, "share", f"/weddings/{wedding_id}")
+        conn.commit()
+
+    permissions.invalidate(share.user_id)
+    return {"message": "Access granted"}
+
+@app.delete("/weddings/{wedding_id}/shares/{user_id}")
+@db_handler
+def revoke_access(wedding_id: str, user_id: str):
+    """Stop sharing a wedding with a user"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM shared_access WHERE wedding_id = ? AND user_id = ?", (wedding_id, user_id))
+        conn.commit()
+
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Share not found")
+
+    permissions.invalidate(user_id)
+    return {"message": "Access revoked"}
+
+# ==================== BUDGET LEDGER ====================
+
+BUDGET_SNAPSHOT_MIN_TAIL = 20
+BUDGET_SNAPSHOT_INTERVAL_SECONDS = 300
+
+# Actual amount of category `c`: latest snapshot + ledger entries appended after it.
+# Both lookups are index range scans (budget_snapshots PK, idx_budget_ledger_category).
+CATEGORY_ACTUAL_SQL = """(
+    COALESCE((SELECT s.total FROM budget_snapshots s WHERE s.category_id = c.id
+              ORDER BY s.seq DESC LIMIT 1), 0)
+    + COALESCE((SELECT SUM(l.delta) FROM budget_ledger l WHERE l.category_id = c.id
+                AND l.seq > COALESCE((SELECT MAX(s.seq) FROM budget_snapshots s
+                                      WHERE s.category_id = c.id), 0)), 0)
+)"""
+
+def record_ledger_entry(cursor, wedding_id: str, category_id: str, delta: float, reason: str,
+                        booking_id: Optional[str] = None) -> bool:
+    """Append a spending entry in the caller's transaction (never updates an existing row).
+
+    Returns False when the category does not exist in this wedding and nothing was recorded.
+    """
+    if not delta:
+        return True
+    cursor.execute("""
+        INSERT INTO budget_ledger (category_id, wedding_id, booking_id, delta, reason)
+        SELECT id, wedding_id, ?, ?, ? FROM budget_categories WHERE id = ? AND wedding_id = ?
+    """, (booking_id, delta, reason, category_id, wedding_id))
+    return cursor.rowcount > 0
+
+def get_category_actual(cursor, category_id: str) -> Optional[float]:
+    """Current actual amount of a single category (None if it does not exist)"""
+    cursor.execute(f"SELECT {CATEGORY_ACTUAL_SQL} AS actual_amount FROM budget_categories c WHERE c.id = ?",
+                   (category_id,))
+    row = cursor.fetchone()
+    return row["actual_amount"] if row else None
+
+def snapshot_budget_ledger(min_tail: int = BUDGET_SNAPSHOT_MIN_TAIL) -> int:
+    """Fold long ledger tails into new per-category snapshots (one set-based statement per shard)"""
+    return sum(scatter_gather(lambda conn, shard: _snapshot_shard_ledger(conn, min_tail)))
+
+def _snapshot_shard_ledger(conn, min_tail: int) -> int:
+    """Snapshot one shard's ledger"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO budget_snapshots (category_id, seq, total)
+        SELECT l.category_id, MAX(l.seq), COALESCE(s.total, 0) + SUM(l.delta)
+        FROM budget_ledger l
+        LEFT JOIN (
+            SELECT category_id, MAX(seq) AS seq FROM budget_snapshots GROUP BY category_id
+        ) latest ON latest.category_id = l.category_id
+        LEFT JOIN budget_snapshots s ON s.category_id = latest.category_id AND s.seq = latest.seq
+        WHERE l.seq > COALESCE(latest.seq, 0)
+        GROUP BY l.category_id
+        HAVING COUNT(*) >= ?
+    """, (min_tail,))
+    conn.commit()
+    return cursor.rowcount
+
+@app.get("/budget/{category_id}/history")
+@db_handler
+def get_budget_category_history(category_id: str, limit: int = 100):
+    """Spending history of a category with the running total after each entry"""
+    limit = max(1, min(limit, 1000))
+
+    with get_row_db("budget_categories", category_id) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM budget_categories WHERE id = ?", (category_id,))
+        if not cursor.fetchone():
+            raise HTTPException(status_code=404, detail="Category not found")
+
+        cursor.execute("""
+            SELECT * FROM (
+                SELECT seq, booking_id, delta, reason, created_at,
+                       SUM(delta) OVER (ORDER BY seq) AS running_total
+                FROM budget_ledger WHERE category_id = ?
+            )
+            ORDER BY seq DESC LIMIT ?
+        """, (category_id, limit))
+
+        history = []
+        for row in cursor.fetchall():
+            history.append({
+                "seq": row["seq"],
+                "booking_id": row["booking_id"],
+                "delta": row["delta"],
+                "reason": row["reason"],
+                "running_total": row["running_total"],
+                "created_at": row["created_at"]
+            })
+
+        return history
+
 # ==================== DASHBOARD ====================
 
+def dashboard_metrics(wedding_date: date, total_budget: Optional[float], total_planned: Optional[float],
+                      total_actual: Optional[float], total_tasks: Optional[int], completed_tasks: Optional[int],
+                      urgent_tasks: Optional[int]) -> dict:
+    """Dashboard numbers from raw per-wedding totals (shared by the wedding and planner dashboards)"""
+    total_planned = total_planned or total_budget
+    total_actual = total_actual or 0
+    total_tasks = total_tasks or 1
+    completed_tasks = completed_tasks or 0
+    
+    return {
+        "days_remaining": calculate_days_remaining(wedding_date),
+        "control_percentage": int((completed_tasks / total_tasks * 100)),
+        "tasks_completed": completed_tasks,
+        "tasks_urgent": urgent_tasks or 0,
+        "tasks_total": total_tasks,
+        "budget_planned": total_planned,
+        "budget_actual": total_actual,
+        "budget_remaining": total_planned - total_actual,
+        "budget_percentage": int((total_actual / total_planned * 100)) if total_planned > 0 else 0,
+    }
+
 @app.get("/weddings/{wedding_id}/dashboard", response_model=DashboardResponse)
+@db_handler
 def get_dashboard(wedding_id: str):
     """Get dashboard data"""
-    with get_db() as conn:
+    with get_wedding_db(wedding_id) as conn:
         cursor = conn.cursor()
         
         # Get wedding info
@@ -508,20 +1386,14 @@ def get_dashboard(wedding_id: str):
             raise HTTPException(status_code=404, detail="Wedding not found")
         
         wedding_date = datetime.strptime(wedding["wedding_date"], "%Y-%m-%d").date()
-        days_remaining = calculate_days_remaining(wedding_date)
         
         # Get budget totals
-        cursor.execute("""
-            SELECT SUM(planned_amount) as total_planned, SUM(actual_amount) as total_actual
-            FROM budget_categories WHERE wedding_id = ?
+        cursor.execute(f"""
+            SELECT SUM(c.planned_amount) as total_planned, SUM({CATEGORY_ACTUAL_SQL}) as total_actual
+            FROM budget_categories c WHERE c.wedding_id = ?
         """, (wedding_id,))
         budget = cursor.fetchone()
         
-        total_planned = budget["total_planned"] or wedding["total_budget"]
-        total_actual = budget["total_actual"] or 0
-        remaining = total_planned - total_actual
-        budget_percentage = int((total_actual / total_planned * 100)) if total_planned > 0 else 0
-        
         # Get task counts
         cursor.execute("""
             SELECT 
@@ -532,71 +1404,197 @@ def get_dashboard(wedding_id: str):
         """, (wedding_id,))
         tasks = cursor.fetchone()
         
-        total_tasks = tasks["total_tasks"] or 1
-        completed_tasks = tasks["completed_tasks"] or 0
-        urgent_tasks = tasks["urgent_tasks"] or 0
-        control_percentage = int((completed_tasks / total_tasks * 100))
+        # Get RSVP head counts (seats, so a family of 4 counts 4)
+        cursor.execute("""
+            SELECT rsvp_status, SUM(party_size) AS seats FROM guests WHERE wedding_id = ? GROUP BY rsvp_status
+        """, (wedding_id,))
+        rsvp = {row["rsvp_status"]: row["seats"] for row in cursor.fetchall()}
         
         return DashboardResponse(
-            days_remaining=days_remaining,
-            control_percentage=control_percentage,
-            tasks_completed=completed_tasks,
-            tasks_urgent=urgent_tasks,
-            tasks_total=total_tasks,
-            budget_planned=total_planned,
-            budget_actual=total_actual,
-            budget_remaining=remaining,
-            budget_percentage=budget_percentage
+            **dashboard_metrics(wedding_date, wedding["total_budget"], budget["total_planned"], budget["total_actual"],
+                                tasks["total_tasks"], tasks["completed_tasks"], tasks["urgent_tasks"]),
+            guests_invited=sum(rsvp.values()),
+            guests_attending=rsvp.get("attending", 0),
+            guests_pending=rsvp.get("pending", 0) + rsvp.get("maybe", 0),
+            guests_declined=rsvp.get("declined", 0)
         )
 
+# ==================== PLANNER PORTFOLIO ====================
+
+PORTFOLIO_PAGE_SIZE = 50
+PORTFOLIO_CACHE_SECONDS = 30
+# risk_score >= threshold -> level (checked in order)
+RISK_LEVELS = [(40, "high"), (15, "medium"), (0, "low")]
+
+def query_portfolio(conn, wedding_ids: List[str]) -> list:
+    """Dashboard totals for many weddings on one shard: one grouped query instead of three per wedding"""
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT
+            w.id, w.user_id, w.groom_name, w.bride_name, w.wedding_date, w.total_budget,
+            b.total_planned, b.total_actual, t.total_tasks, t.completed_tasks, t.urgent_tasks
+        FROM weddings w
+        LEFT JOIN (
+            SELECT c.wedding_id, SUM(c.planned_amount) AS total_planned, SUM({CATEGORY_ACTUAL_SQL}) AS total_actual
+            FROM budget_categories c
+            WHERE c.wedding_id IN (SELECT value FROM json_each(?1))
+            GROUP BY c.wedding_id
+        ) b ON b.wedding_id = w.id
+        LEFT JOIN (
+            SELECT
+                wedding_id,
+                COUNT(*) AS total_tasks,
+                SUM(CASE WHEN is_completed = 1 THEN 1 ELSE 0 END) AS completed_tasks,
+                SUM(CASE WHEN is_urgent = 1 AND is_completed = 0 THEN 1 ELSE 0 END) AS urgent_tasks
+            FROM tasks
+            WHERE wedding_id IN (SELECT value FROM json_each(?1))
+            GROUP BY wedding_id
+        ) t ON t.wedding_id = w.id
+        WHERE w.id IN (SELECT value FROM json_each(?1))
+    """, (json.dumps(wedding_ids),))
+    return cursor.fetchall()
+
+def risk_score(wedding_date: date, metrics: dict) -> float:
+    """0 when on track; grows with schedule slip, open urgent tasks and budget overrun.
+
+    Expected progress rises linearly from 0% a year out to 100% on the day.
+    """
+    if wedding_date < date.today():
+        return 0.0
+    expected_progress = min(100, max(0, 100 - metrics["days_remaining"] * 100 / 365))
+    schedule_gap = max(0, expected_progress - metrics["control_percentage"])
+    overrun = max(0, metrics["budget_percentage"] - 100)
+    return round(schedule_gap + 5 * metrics["tasks_urgent"] + overrun, 1)
+
+@app.get("/planners/{user_id}/dashboard", response_model=PortfolioPage)
+@db_handler
+def get_planner_dashboard(user_id: str, cursor: Optional[str] = None, limit: int = PORTFOLIO_PAGE_SIZE,
+                          if_none_match: Optional[str] = Header(None)):
+    """Every wedding a planner owns or shares, riskiest first (keyset pagination via `cursor`).
+
+    One catalog lookup plus one grouped query per shard. Responses carry an ETag, so
+    polling clients get 304 Not Modified while nothing changed.
+    """
+    limit = max(1, min(limit, 200))
+    after = None
+    if cursor:
+        try:
+            cursor_risk, cursor_id = cursor.split("|", 1)
+            after = (-float(cursor_risk), cursor_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    wedding_ids = weddings_by_shard(user_id, include_shared=True)
+    row_sets = scatter_gather(
+        lambda conn, shard: query_portfolio(conn, wedding_ids[shard]),
+        shards=list(wedding_ids)
+    ) if wedding_ids else []
+    
+    weddings = []
+    for rows in row_sets:
+        for row in rows:
+            wedding_date = datetime.strptime(row["wedding_date"], "%Y-%m-%d").date()
+            metrics = dashboard_metrics(wedding_date, row["total_budget"], row["total_planned"], row["total_actual"],
+                                        row["total_tasks"], row["completed_tasks"], row["urgent_tasks"])
+            score = risk_score(wedding_date, metrics)
+            weddings.append(PortfolioWedding(
+                wedding_id=row["id"],
+                groom_name=row["groom_name"],
+                bride_name=row["bride_name"],
+                wedding_date=wedding_date,
+                role="owner" if row["user_id"] == user_id else "shared",
+                days_remaining=metrics["days_remaining"],
+                control_percentage=metrics["control_percentage"],
+                tasks_urgent=metrics["tasks_urgent"],
+                tasks_total=metrics["tasks_total"],
+                budget_planned=metrics["budget_planned"],
+                budget_actual=metrics["budget_actual"],
+                budget_percentage=metrics["budget_percentage"],
+                risk_score=score,
+                risk_level=next(level for threshold, level in RISK_LEVELS if score >= threshold)
+            ))
+    
+    weddings.sort(key=lambda w: (-w.risk_score, w.wedding_id))
+    risk_counts = {level: 0 for _, level in RISK_LEVELS}
+    for wedding in weddings:
+        risk_counts[wedding.risk_level] += 1
+    
+    page = [w for w in weddings if after is None or (-w.risk_score, w.wedding_id) > after][:limit + 1]
+    next_cursor = None
+    if len(page) > limit:
+        last = page[limit - 1]
+        next_cursor = f"{last.risk_score}|{last.wedding_id}"
+    
+    body = dumps(jsonable_encoder(PortfolioPage(
+        items=page[:limit],
+        next_cursor=next_cursor,
+        total=len(weddings),
+        risk_counts=risk_counts
+    )))
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={PORTFOLIO_CACHE_SECONDS}"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return FastJSONResponse(body, headers=headers)
+
 # ==================== BUDGET ====================
 
-@app.get("/weddings/{wedding_id}/budget")
+BUDGET_CATEGORY_PLAN = RowPlan([
+    ("id", "id"),
+    ("name", "name"),
+    ("icon", "icon"),
+    ("planned_amount", "planned_amount"),
+    ("actual_amount", "actual_amount"),
+    ("percentage_spent", "percentage_spent"),
+    ("notes", "notes"),
+])
+
+@app.get("/weddings/{wedding_id}/budget", response_class=FastJSONResponse)
+@db_handler
 def get_budget_categories(wedding_id: str):
     """Get all budget categories"""
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT * FROM budget_categories 
-            WHERE wedding_id = ?
+    with get_wedding_db(wedding_id) as conn:
+        cursor = tuple_cursor(conn)
+        cursor.execute(f"""
+            SELECT *,
+                CASE WHEN planned_amount > 0
+                     THEN CAST(actual_amount / planned_amount * 100 AS INTEGER) ELSE 0 END AS percentage_spent
+            FROM (
+                SELECT c.id, c.name, c.icon, c.planned_amount, c.notes, {CATEGORY_ACTUAL_SQL} AS actual_amount
+                FROM budget_categories c
+                WHERE c.wedding_id = ?
+            )
             ORDER BY planned_amount DESC
         """, (wedding_id,))
         
-        categories = []
-        for row in cursor.fetchall():
-            percentage = int((row["actual_amount"] / row["planned_amount"] * 100)) if row["planned_amount"] > 0 else 0
-            categories.append({
-                "id": row["id"],
-                "name": row["name"],
-                "icon": row["icon"],
-                "planned_amount": row["planned_amount"],
-                "actual_amount": row["actual_amount"],
-                "percentage_spent": percentage,
-                "notes": row["notes"]
-            })
-        
-        return categories
+        return FastJSONResponse(BUDGET_CATEGORY_PLAN.encode(cursor))
 
 @app.post("/weddings/{wedding_id}/budget")
+@db_handler
 def create_budget_category(wedding_id: str, category: BudgetCategoryCreate):
     """Add a new budget category"""
     cat_id = generate_id()
     
-    with get_db() as conn:
+    with get_wedding_db(wedding_id, write=True) as conn:
         cursor = conn.cursor()
         cursor.execute("""
             INSERT INTO budget_categories (id, wedding_id, name, icon, planned_amount, notes)
             VALUES (?, ?, ?, ?, ?, ?)
         """, (cat_id, wedding_id, category.name, category.icon, category.planned_amount, category.notes))
         conn.commit()
+    index_wedding_rows(wedding_id, [cat_id])
     
     return {"id": cat_id, "message": "Category created"}
 
 @app.put("/budget/{category_id}")
+@db_handler
 def update_budget_category(category_id: str, update: BudgetCategoryUpdate):
     """Update budget category (EDITABLE)"""
-    with get_db() as conn:
+    with get_row_db("budget_categories", category_id, write=True) as conn:
         cursor = conn.cursor()
+        # Take the write lock before reading the current total, so a concurrent ledger
+        # entry cannot land between the read and the adjustment computed from it
+        cursor.execute("BEGIN IMMEDIATE")
         
         updates = []
         values = []
@@ -607,9 +1605,6 @@ def update_budget_category(category_id: str, update: BudgetCategoryUpdate):
         if update.planned_amount is not None:
             updates.append("planned_amount = ?")
             values.append(update.planned_amount)
-        if update.actual_amount is not None:
-            updates.append("actual_amount = ?")
-            values.append(update.actual_amount)
         if update.notes is not None:
             updates.append("notes = ?")
             values.append(update.notes)
@@ -619,91 +1614,138 @@ def update_budget_category(category_id: str, update: BudgetCategoryUpdate):
         if updates:
             query = f"UPDATE budget_categories SET {', '.join(updates)} WHERE id = ?"
             cursor.execute(query, values)
-            conn.commit()
-        
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Category not found")
-    
+
+            if cursor.rowcount == 0:
+                raise HTTPException(status_code=404, detail="Category not found")
+
+        if update.actual_amount is not None:
+            # Manual override is recorded as an adjustment entry, not an overwrite
+            cursor.execute("SELECT wedding_id FROM budget_categories WHERE id = ?", (category_id,))
+            category = cursor.fetchone()
+            if not category:
+                raise HTTPException(status_code=404, detail="Category not found")
+            current = get_category_actual(cursor, category_id)
+            record_ledger_entry(cursor, category["wedding_id"], category_id, update.actual_amount - current,
+                                "adjustment")
+
+        conn.commit()
+
     return {"message": "Category updated"}
 
 @app.delete("/budget/{category_id}")
+@db_handler
 def delete_budget_category(category_id: str):
     """Delete budget category"""
-    with get_db() as conn:
+    with get_row_db("budget_categories", category_id, write=True) as conn:
         cursor = conn.cursor()
         cursor.execute("DELETE FROM budget_categories WHERE id = ?", (category_id,))
-        conn.commit()
         
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Category not found")
+        
+        cursor.execute("DELETE FROM budget_ledger WHERE category_id = ?", (category_id,))
+        cursor.execute("DELETE FROM budget_snapshots WHERE category_id = ?", (category_id,))
+        conn.commit()
     
     return {"message": "Category deleted"}
 
 # ==================== VENDOR BOOKINGS ====================
 
-@app.get("/weddings/{wedding_id}/bookings")
+VENDOR_BOOKING_PLAN = RowPlan([
+    ("id", "id"),
+    ("vendor_id", "vendor_id"),
+    ("category_id", "category_id"),
+    ("vendor_name", "vendor_name"),
+    ("amount", "amount"),
+    ("deposit_paid", "deposit_paid"),
+    ("payment_due_date", "payment_due_date"),
+    ("event_date", "event_date"),
+    ("status", "status"),
+    ("notes", "notes"),
+])
+
+@app.get("/weddings/{wedding_id}/bookings", response_class=FastJSONResponse)
+@db_handler
 def get_vendor_bookings(wedding_id: str):
     """Get couple's vendor bookings"""
-    with get_db() as conn:
-        cursor = conn.cursor()
+    with get_wedding_db(wedding_id) as conn:
+        cursor = tuple_cursor(conn)
         cursor.execute("""
             SELECT * FROM vendor_bookings 
             WHERE wedding_id = ?
             ORDER BY created_at DESC
         """, (wedding_id,))
         
-        bookings = []
-        for row in cursor.fetchall():
-            bookings.append({
-                "id": row["id"],
-                "vendor_id": row["vendor_id"],
-                "category_id": row["category_id"],
-                "vendor_name": row["vendor_name"],
-                "amount": row["amount"],
-                "deposit_paid": row["deposit_paid"],
-                "payment_due_date": row["payment_due_date"],
-                "status": row["status"],
-                "notes": row["notes"]
-            })
-        
-        return bookings
+        return FastJSONResponse(VENDOR_BOOKING_PLAN.encode(cursor))
 
 @app.post("/weddings/{wedding_id}/bookings")
-def create_vendor_booking(wedding_id: str, booking: VendorBookingCreate):
-    """Book a vendor"""
+async def create_vendor_booking(wedding_id: str, booking: VendorBookingCreate,
+                                idempotency_key: Optional[str] = Header(None)):
+    """Book a vendor (safe to retry with an Idempotency-Key header)"""
+    return await run_idempotent(idempotency_key, f"POST /weddings/{wedding_id}/bookings", booking,
+                                _create_vendor_booking, wedding_id, booking)
+
+def _create_vendor_booking(wedding_id: str, booking: VendorBookingCreate) -> dict:
     booking_id = generate_id()
     
-    with get_db() as conn:
+    with get_wedding_db(wedding_id, write=True) as conn:
         cursor = conn.cursor()
         
-        # Insert booking
-        cursor.execute("""
-            INSERT INTO vendor_bookings 
-            (id, wedding_id, vendor_id, category_id, vendor_name, amount, deposit_paid, payment_due_date, notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (booking_id, wedding_id, booking.vendor_id, booking.category_id, 
-              booking.vendor_name, booking.amount, booking.deposit_paid, 
-              booking.payment_due_date, booking.notes))
-        
-        # Update category actual amount
-        cursor.execute("""
-            UPDATE budget_categories 
-            SET actual_amount = actual_amount + ?
-            WHERE id = ?
-        """, (booking.amount, booking.category_id))
+        # The category must belong to this wedding, or the spending would land in another ledger
+        cursor.execute("SELECT 1 FROM budget_categories WHERE id = ? AND wedding_id = ?",
+                       (booking.category_id, wedding_id))
+        if not cursor.fetchone():
+            raise HTTPException(status_code=404, detail="Category not found")
         
-        conn.commit()
+        event_date = booking.event_date
+        if booking.vendor_id and event_date is None:
+            cursor.execute("SELECT wedding_date FROM weddings WHERE id = ?", (wedding_id,))
+            wedding = cursor.fetchone()
+            if wedding:
+                event_date = wedding["wedding_date"]
+        
+        claimed = bool(booking.vendor_id and event_date)
+        if claimed:
+            claim_vendor_date(booking_id, booking.vendor_id, wedding_id, event_date, "pending")
+        
+        try:
+            # Insert booking
+            cursor.execute("""
+                INSERT INTO vendor_bookings 
+                (id, wedding_id, vendor_id, category_id, vendor_name, amount, deposit_paid, payment_due_date,
+                 event_date, notes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (booking_id, wedding_id, booking.vendor_id, booking.category_id, 
+                  booking.vendor_name, booking.amount, booking.deposit_paid, 
+                  booking.payment_due_date, event_date, booking.notes))
+            
+            # Record spending in the budget ledger
+            record_ledger_entry(cursor, wedding_id, booking.category_id, booking.amount, "booking_created", booking_id)
+            
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            if claimed:
+                release_vendor_date(booking_id)
+            raise
+    index_wedding_rows(wedding_id, [booking_id])
     
+    notify_wedding_members(wedding_id, "Vendor booked", f"{booking.vendor_name} was booked",
+                           "booking", f"/weddings/{wedding_id}/bookings")
     return {"id": booking_id, "message": "Vendor booked successfully"}
 
 @app.put("/bookings/{booking_id}")
+@db_handler
 def update_vendor_booking(booking_id: str, update: VendorBookingUpdate):
     """Update vendor booking (EDITABLE)"""
-    with get_db() as conn:
+    with get_row_db("vendor_bookings", booking_id, write=True) as conn:
         cursor = conn.cursor()
         
         # Get old amount first
-        cursor.execute("SELECT amount, category_id FROM vendor_bookings WHERE id = ?", (booking_id,))
+        cursor.execute("""
+            SELECT amount, category_id, vendor_id, vendor_name, wedding_id, event_date, status
+            FROM vendor_bookings WHERE id = ?
+        """, (booking_id,))
         old_booking = cursor.fetchone()
         if not old_booking:
             raise HTTPException(status_code=404, detail="Booking not found")
@@ -728,6 +1770,9 @@ def update_vendor_booking(booking_id: str, update: VendorBookingUpdate):
         if update.payment_due_date is not None:
             updates.append("payment_due_date = ?")
             values.append(update.payment_due_date)
+        if update.event_date is not None:
+            updates.append("event_date = ?")
+            values.append(update.event_date)
         if update.status is not None:
             updates.append("status = ?")
             values.append(update.status)
@@ -737,31 +1782,58 @@ def update_vendor_booking(booking_id: str, update: VendorBookingUpdate):
         
         values.append(booking_id)
         
-        if updates:
-            query = f"UPDATE vendor_bookings SET {', '.join(updates)} WHERE id = ?"
-            cursor.execute(query, values)
-            
-            # Update category actual amount if amount changed
-            if new_amount != old_amount:
-                diff = new_amount - old_amount
-                cursor.execute("""
-                    UPDATE budget_categories 
-                    SET actual_amount = actual_amount + ?
-                    WHERE id = ?
-                """, (diff, category_id))
-            
-            conn.commit()
+        # Keep the vendor's calendar in step. A booking takes a new slot - and needs the
+        # conflict check - when it moves date or comes back from cancelled.
+        event_date = update.event_date or old_booking["event_date"]
+        claimed = bool(old_booking["vendor_id"] and event_date and (update.event_date or update.status))
+        if claimed:
+            old_status = old_booking["status"] or "pending"
+            new_status = update.status or old_status
+            date_changed = update.event_date is not None and str(update.event_date) != old_booking["event_date"]
+            check = new_status != "cancelled" and (date_changed or old_status == "cancelled")
+            claim_vendor_date(booking_id, old_booking["vendor_id"], old_booking["wedding_id"], event_date,
+                              new_status, check=check)
+        
+        try:
+            if updates:
+                query = f"UPDATE vendor_bookings SET {', '.join(updates)} WHERE id = ?"
+                cursor.execute(query, values)
+                
+                # Record the difference if amount changed
+                if new_amount != old_amount and not record_ledger_entry(
+                        cursor, old_booking["wedding_id"], category_id, new_amount - old_amount,
+                        "booking_updated", booking_id):
+                    raise HTTPException(status_code=404, detail="Category not found")
+                
+                conn.commit()
+        except Exception:
+            # The booking kept its old date and status: give the vendor's calendar those back
+            # (rolled back first, as on shard 0 the open write would block the catalog)
+            conn.rollback()
+            if claimed and old_booking["event_date"]:
+                claim_vendor_date(booking_id, old_booking["vendor_id"], old_booking["wedding_id"],
+                                  old_booking["event_date"], old_booking["status"], check=False)
+            elif claimed:
+                release_vendor_date(booking_id)
+            raise
     
+    if update.status is not None and update.status != old_booking["status"]:
+        wedding_id = old_booking["wedding_id"]
+        notify_wedding_members(wedding_id, "Booking status changed",
+                               f"{update.vendor_name or old_booking['vendor_name']} booking is now {update.status}",
+                               "booking", f"/weddings/{wedding_id}/bookings")
     return {"message": "Booking updated"}
 
 @app.delete("/bookings/{booking_id}")
+@db_handler
 def delete_vendor_booking(booking_id: str):
     """Delete vendor booking"""
-    with get_db() as conn:
+    with get_row_db("vendor_bookings", booking_id, write=True) as conn:
         cursor = conn.cursor()
         
         # Get amount and category first
-        cursor.execute("SELECT amount, category_id FROM vendor_bookings WHERE id = ?", (booking_id,))
+        cursor.execute("SELECT amount, category_id, vendor_id, wedding_id FROM vendor_bookings WHERE id = ?",
+                       (booking_id,))
         booking = cursor.fetchone()
         if not booking:
             raise HTTPException(status_code=404, detail="Booking not found")
@@ -769,24 +1841,131 @@ def delete_vendor_booking(booking_id: str):
         # Delete booking
         cursor.execute("DELETE FROM vendor_bookings WHERE id = ?", (booking_id,))
         
-        # Update category actual amount
-        cursor.execute("""
-            UPDATE budget_categories 
-            SET actual_amount = actual_amount - ?
-            WHERE id = ?
-        """, (booking["amount"], booking["category_id"]))
+        # Reverse the booking's spending in the ledger (nothing to reverse if the category is gone)
+        record_ledger_entry(cursor, booking["wedding_id"], booking["category_id"], -booking["amount"],
+                            "booking_deleted", booking_id)
         
         conn.commit()
     
+    if booking["vendor_id"]:
+        release_vendor_date(booking_id)
+    
     return {"message": "Booking deleted"}
 
+# ==================== CASH FLOW ====================
+
+CASHFLOW_BUCKETS = {
+    "week": "date(payment_due_date, '-6 days', 'weekday 1')",
+    "month": "strftime('%Y-%m-01', payment_due_date)",
+}
+
+def query_cashflow(conn, wedding_ids: List[str], granularity: str) -> list:
+    """Per-period outstanding/overdue sums for some weddings on one shard (one aggregate query)"""
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT
+            bucket,
+            SUM(outstanding) AS outstanding,
+            SUM(CASE WHEN payment_due_date < date('now') THEN outstanding ELSE 0 END) AS overdue,
+            COUNT(*) AS bookings
+        FROM (
+            SELECT
+                {CASHFLOW_BUCKETS[granularity]} AS bucket,
+                payment_due_date,
+                MAX(amount - COALESCE(deposit_paid, 0), 0) AS outstanding
+            FROM vendor_bookings
+            WHERE wedding_id IN (SELECT value FROM json_each(?))
+              AND COALESCE(status, 'pending') NOT IN ('cancelled', 'paid')
+        )
+        GROUP BY bucket
+    """, (json.dumps(wedding_ids),))
+    return cursor.fetchall()
+
+def build_cashflow(row_sets: list, granularity: str) -> CashflowResponse:
+    """Merge per-shard period sums and add the running total.
+
+    Bucketing and the overdue split are done by SQLite over idx_vendor_bookings_wedding_due,
+    so Python only touches one row per period per shard. The cumulative total is summed
+    here, not by a window function: the same period can come back from several shards and
+    has to be merged before it is added up.
+    """
+    periods: Dict[str, dict] = {}
+    unscheduled = 0.0
+    for rows in row_sets:
+        for row in rows:
+            if row["bucket"] is None:
+                unscheduled += row["outstanding"] or 0
+                continue
+            period = periods.setdefault(row["bucket"], {"outstanding": 0.0, "overdue": 0.0, "bookings": 0})
+            period["outstanding"] += row["outstanding"] or 0
+            period["overdue"] += row["overdue"] or 0
+            period["bookings"] += row["bookings"]
+
+    buckets = []
+    cumulative = 0.0
+    total_overdue = 0.0
+    for period_start in sorted(periods):
+        period = periods[period_start]
+        cumulative += period["outstanding"]
+        total_overdue += period["overdue"]
+        buckets.append(CashflowBucket(
+            period_start=period_start,
+            outstanding=period["outstanding"],
+            overdue=period["overdue"],
+            bookings=period["bookings"],
+            cumulative=cumulative
+        ))
+
+    return CashflowResponse(
+        granularity=granularity,
+        total_outstanding=cumulative + unscheduled,
+        total_overdue=total_overdue,
+        unscheduled=unscheduled,
+        buckets=buckets
+    )
+
+def check_cashflow_granularity(granularity: str):
+    if granularity not in CASHFLOW_BUCKETS:
+        raise HTTPException(status_code=400, detail="granularity must be 'week' or 'month'")
+
+@app.get("/weddings/{wedding_id}/cashflow", response_model=CashflowResponse)
+@db_handler
+def get_wedding_cashflow(wedding_id: str, granularity: str = "month"):
+    """Projected payments for a wedding, bucketed by week or month"""
+    check_cashflow_granularity(granularity)
+    with get_wedding_db(wedding_id) as conn:
+        return build_cashflow([query_cashflow(conn, [wedding_id], granularity)], granularity)
+
+@app.get("/users/{user_id}/cashflow", response_model=CashflowResponse)
+@db_handler
+def get_planner_cashflow(user_id: str, granularity: str = "month"):
+    """Projected payments across every wedding a planner owns or collaborates on (scatter-gather over shards)"""
+    check_cashflow_granularity(granularity)
+    wedding_ids = weddings_by_shard(user_id, include_shared=True)
+    row_sets = scatter_gather(
+        lambda conn, shard: query_cashflow(conn, wedding_ids[shard], granularity),
+        shards=list(wedding_ids)
+    ) if wedding_ids else []
+    return build_cashflow(row_sets, granularity)
+
 # ==================== TASKS ====================
 
-@app.get("/weddings/{wedding_id}/tasks")
+TASK_PLAN = RowPlan([
+    ("id", "id"),
+    ("title", "title"),
+    ("description", "description"),
+    ("timeline_period", "timeline_period"),
+    ("due_date", "due_date"),
+    ("is_completed", "is_completed", bool),
+    ("is_urgent", "is_urgent", bool),
+])
+
+@app.get("/weddings/{wedding_id}/tasks", response_class=FastJSONResponse)
+@db_handler
 def get_tasks(wedding_id: str, timeline_period: Optional[str] = None):
     """Get all tasks"""
-    with get_db() as conn:
-        cursor = conn.cursor()
+    with get_wedding_db(wedding_id) as conn:
+        cursor = tuple_cursor(conn)
         
         if timeline_period:
             cursor.execute("""
@@ -801,26 +1980,18 @@ def get_tasks(wedding_id: str, timeline_period: Optional[str] = None):
                 ORDER BY is_urgent DESC, timeline_period, due_date ASC
             """, (wedding_id,))
         
-        tasks = []
-        for row in cursor.fetchall():
-            tasks.append({
-                "id": row["id"],
-                "title": row["title"],
-                "description": row["description"],
-                "timeline_period": row["timeline_period"],
-                "due_date": row["due_date"],
-                "is_completed": bool(row["is_completed"]),
-                "is_urgent": bool(row["is_urgent"])
-            })
-        
-        return tasks
+        return FastJSONResponse(TASK_PLAN.encode(cursor))
 
 @app.post("/weddings/{wedding_id}/tasks")
-def create_task(wedding_id: str, task: TaskCreate):
-    """Create a new task"""
+async def create_task(wedding_id: str, task: TaskCreate, idempotency_key: Optional[str] = Header(None)):
+    """Create a new task (safe to retry with an Idempotency-Key header)"""
+    return await run_idempotent(idempotency_key, f"POST /weddings/{wedding_id}/tasks", task,
+                                _create_task, wedding_id, task)
+
+def _create_task(wedding_id: str, task: TaskCreate) -> dict:
     task_id = generate_id()
     
-    with get_db() as conn:
+    with get_wedding_db(wedding_id, write=True) as conn:
         cursor = conn.cursor()
         cursor.execute("""
             INSERT INTO tasks (id, wedding_id, title, description, timeline_period, due_date, is_urgent)
@@ -828,13 +1999,15 @@ def create_task(wedding_id: str, task: TaskCreate):
         """, (task_id, wedding_id, task.title, task.description, 
               task.timeline_period, task.due_date, task.is_urgent))
         conn.commit()
+    index_wedding_rows(wedding_id, [task_id])
     
     return {"id": task_id, "message": "Task created"}
 
 @app.put("/tasks/{task_id}")
+@db_handler
 def update_task(task_id: str, update: TaskUpdate):
     """Update task (EDITABLE)"""
-    with get_db() as conn:
+    with get_row_db("tasks", task_id, write=True) as conn:
         cursor = conn.cursor()
         
         updates = []
@@ -866,9 +2039,10 @@ def update_task(task_id: str, update: TaskUpdate):
     return {"message": "Task updated"}
 
 @app.patch("/tasks/{task_id}/complete")
+@db_handler
 def toggle_task_completion(task_id: str):
     """Toggle task completion"""
-    with get_db() as conn:
+    with get_row_db("tasks", task_id, write=True) as conn:
         cursor = conn.cursor()
         
         # Get current state
@@ -890,9 +2064,10 @@ def toggle_task_completion(task_id: str):
     return {"message": "Task updated", "is_completed": new_state}
 
 @app.delete("/tasks/{task_id}")
+@db_handler
 def delete_task(task_id: str):
     """Delete task"""
-    with get_db() as conn:
+    with get_row_db("tasks", task_id, write=True) as conn:
         cursor = conn.cursor()
         cursor.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
         conn.commit()
@@ -902,15 +2077,391 @@ def delete_task(task_id: str):
     
     return {"message": "Task deleted"}
 
+# ==================== GUESTS ====================
+
+RSVP_STATUSES = ("pending", "attending", "maybe", "declined")
+
+GUEST_PLAN = RowPlan([
+    ("id", "id"),
+    ("name", "name"),
+    ("phone", "phone"),
+    ("email", "email"),
+    ("side", "side"),
+    ("group_name", "group_name"),
+    ("party_size", "party_size"),
+    ("rsvp_status", "rsvp_status"),
+    ("dietary", "dietary"),
+    ("table_id", "table_id"),
+    ("seat_locked", "seat_locked", bool),
+    ("notes", "notes"),
+])
+
+def check_rsvp_status(rsvp_status: str):
+    if rsvp_status not in RSVP_STATUSES:
+        raise HTTPException(status_code=400, detail=f"rsvp_status must be one of: {', '.join(RSVP_STATUSES)}")
+
+def insert_guests(cursor, wedding_id: str, guests: List[GuestCreate]) -> List[str]:
+    for guest in guests:
+        check_rsvp_status(guest.rsvp_status)
+    guest_ids = [generate_id() for _ in guests]
+    cursor.executemany("""
+        INSERT INTO guests (id, wedding_id, name, phone, email, side, group_name, party_size, rsvp_status, dietary, notes)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [(guest_id, wedding_id, guest.name, guest.phone, guest.email, guest.side, guest.group_name,
+           guest.party_size, guest.rsvp_status, guest.dietary, guest.notes)
+          for guest_id, guest in zip(guest_ids, guests)])
+    return guest_ids
+
+@app.get("/weddings/{wedding_id}/guests", response_class=FastJSONResponse)
+@db_handler
+def get_guests(wedding_id: str, rsvp_status: Optional[str] = None, group_name: Optional[str] = None):
+    """Get guest list"""
+    with get_wedding_db(wedding_id) as conn:
+        cursor = tuple_cursor(conn)
+        
+        query = "SELECT * FROM guests WHERE wedding_id = ?"
+        params: list = [wedding_id]
+        if rsvp_status:
+            query += " AND rsvp_status = ?"
+            params.append(rsvp_status)
+        if group_name:
+            query += " AND group_name = ?"
+            params.append(group_name)
+        cursor.execute(query + " ORDER BY group_name, name", params)
+        
+        return FastJSONResponse(GUEST_PLAN.encode(cursor))
+
+@app.post("/weddings/{wedding_id}/guests")
+@db_handler
+def create_guest(wedding_id: str, guest: GuestCreate):
+    """Add a guest"""
+    with get_wedding_db(wedding_id, write=True) as conn:
+        cursor = conn.cursor()
+        guest_id, = insert_guests(cursor, wedding_id, [guest])
+        conn.commit()
+    index_wedding_rows(wedding_id, [guest_id])
+    
+    return {"id": guest_id, "message": "Guest added"}
+
+@app.post("/weddings/{wedding_id}/guests/import")
+@db_handler
+def import_guests(wedding_id: str, guest_import: GuestImport):
+    """Bulk-add guests (one transaction)"""
+    with get_wedding_db(wedding_id, write=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM weddings WHERE id = ?", (wedding_id,))
+        if not cursor.fetchone():
+            raise HTTPException(status_code=404, detail="Wedding not found")
+        
+        guest_ids = insert_guests(cursor, wedding_id, guest_import.guests)
+        conn.commit()
+    index_wedding_rows(wedding_id, guest_ids)
+    
+    return {"imported": len(guest_ids), "ids": guest_ids}
+
+@app.put("/guests/{guest_id}")
+@db_handler
+def update_guest(guest_id: str, update: GuestUpdate):
+    """Update guest (EDITABLE)"""
+    with get_row_db("guests", guest_id, write=True) as conn:
+        cursor = conn.cursor()
+        
+        updates = []
+        values = []
+        
+        for field in ("name", "phone", "email", "side", "group_name", "party_size", "dietary", "notes",
+                      "seat_locked"):
+            value = getattr(update, field)
+            if value is not None:
+                updates.append(f"{field} = ?")
+                values.append(value)
+        if "table_id" in update.model_fields_set:
+            # Explicit null unseats the guest; otherwise the table must belong to the same wedding
+            if update.table_id is not None:
+                cursor.execute("""
+                    SELECT 1 FROM seating_tables t JOIN guests g ON g.wedding_id = t.wedding_id
+                    WHERE t.id = ? AND g.id = ?
+                """, (update.table_id, guest_id))
+                if not cursor.fetchone():
+                    raise HTTPException(status_code=404, detail="Table not found")
+            updates.append("table_id = ?")
+            values.append(update.table_id)
+        
+        updates.append("updated_at = CURRENT_TIMESTAMP")
+        values.append(guest_id)
+        
+        cursor.execute(f"UPDATE guests SET {', '.join(updates)} WHERE id = ?", values)
+        conn.commit()
+        
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Guest not found")
+    
+    return {"message": "Guest updated"}
+
+@app.patch("/guests/{guest_id}/rsvp")
+@db_handler
+def update_rsvp(guest_id: str, update: RsvpUpdate):
+    """Record a guest's RSVP (declining frees their seat)"""
+    check_rsvp_status(update.rsvp_status)
+    with get_row_db("guests", guest_id, write=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE guests
+            SET rsvp_status = ?,
+                party_size = COALESCE(?, party_size),
+                table_id = CASE WHEN ? = 'declined' THEN NULL ELSE table_id END,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (update.rsvp_status, update.party_size, update.rsvp_status, guest_id))
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Guest not found")
+        
+        cursor.execute("SELECT name, wedding_id FROM guests WHERE id = ?", (guest_id,))
+        guest = cursor.fetchone()
+        conn.commit()
+    
+    notify_wedding_members(guest["wedding_id"], "RSVP received", f"{guest['name']}: {update.rsvp_status}",
+                           "rsvp", f"/weddings/{guest['wedding_id']}/guests")
+    return {"message": "RSVP updated", "rsvp_status": update.rsvp_status}
+
+@app.delete("/guests/{guest_id}")
+@db_handler
+def delete_guest(guest_id: str):
+    """Delete guest"""
+    with get_row_db("guests", guest_id, write=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM guests WHERE id = ?", (guest_id,))
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Guest not found")
+        
+        cursor.execute("""
+            DELETE FROM seating_constraints WHERE guest_id = ? OR other_guest_id = ?
+        """, (guest_id, guest_id))
+        conn.commit()
+    
+    return {"message": "Guest deleted"}
+
+# ==================== SEATING ====================
+
+SEATING_CONSTRAINT_KINDS = ("together", "apart")
+
+@app.get("/weddings/{wedding_id}/tables")
+@db_handler
+def get_seating_tables(wedding_id: str):
+    """Get tables with their occupancy"""
+    with get_wedding_db(wedding_id) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT t.id, t.name, t.capacity, COALESCE(SUM(g.party_size), 0) AS seated
+            FROM seating_tables t
+            LEFT JOIN guests g ON g.table_id = t.id AND g.rsvp_status != 'declined'
+            WHERE t.wedding_id = ?
+            GROUP BY t.id
+            ORDER BY t.created_at, t.name
+        """, (wedding_id,))
+        
+        return [{
+            "id": row["id"],
+            "name": row["name"],
+            "capacity": row["capacity"],
+            "seated": row["seated"]
+        } for row in cursor.fetchall()]
+
+@app.post("/weddings/{wedding_id}/tables")
+@db_handler
+def create_seating_table(wedding_id: str, table: SeatingTableCreate):
+    """Add a table"""
+    table_id = generate_id()
+    
+    with get_wedding_db(wedding_id, write=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO seating_tables (id, wedding_id, name, capacity) VALUES (?, ?, ?, ?)
+        """, (table_id, wedding_id, table.name, table.capacity))
+        conn.commit()
+    index_wedding_rows(wedding_id, [table_id])
+    
+    return {"id": table_id, "message": "Table created"}
+
+@app.put("/tables/{table_id}")
+@db_handler
+def update_seating_table(table_id: str, update: SeatingTableUpdate):
+    """Update table (EDITABLE)"""
+    with get_row_db("seating_tables", table_id, write=True) as conn:
+        cursor = conn.cursor()
+        
+        updates = []
+        values = []
+        
+        if update.name is not None:
+            updates.append("name = ?")
+            values.append(update.name)
+        if update.capacity is not None:
+            updates.append("capacity = ?")
+            values.append(update.capacity)
+        
+        values.append(table_id)
+        
+        if updates:
+            cursor.execute(f"UPDATE seating_tables SET {', '.join(updates)} WHERE id = ?", values)
+            conn.commit()
+        
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Table not found")
+    
+    return {"message": "Table updated"}
+
+@app.delete("/tables/{table_id}")
+@db_handler
+def delete_seating_table(table_id: str):
+    """Delete table (its guests become unseated)"""
+    with get_row_db("seating_tables", table_id, write=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM seating_tables WHERE id = ?", (table_id,))
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Table not found")
+        
+        cursor.execute("UPDATE guests SET table_id = NULL, seat_locked = 0 WHERE table_id = ?", (table_id,))
+        conn.commit()
+    
+    return {"message": "Table deleted"}
+
+@app.get("/weddings/{wedding_id}/seating/constraints")
+@db_handler
+def get_seating_constraints(wedding_id: str):
+    """Get must-sit-together / must-not-sit-together pairs"""
+    with get_wedding_db(wedding_id) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, guest_id, other_guest_id, kind FROM seating_constraints
+            WHERE wedding_id = ? ORDER BY created_at
+        """, (wedding_id,))
+        
+        return [dict(row) for row in cursor.fetchall()]
+
+@app.post("/weddings/{wedding_id}/seating/constraints")
+@db_handler
+def create_seating_constraint(wedding_id: str, constraint: SeatingConstraintCreate):
+    """Require two guests to sit together ("together") or at different tables ("apart")"""
+    if constraint.kind not in SEATING_CONSTRAINT_KINDS:
+        raise HTTPException(status_code=400, detail="kind must be 'together' or 'apart'")
+    if constraint.guest_id == constraint.other_guest_id:
+        raise HTTPException(status_code=400, detail="A constraint needs two different guests")
+    constraint_id = generate_id()
+    
+    with get_wedding_db(wedding_id, write=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT COUNT(*) FROM guests WHERE wedding_id = ? AND id IN (?, ?)
+        """, (wedding_id, constraint.guest_id, constraint.other_guest_id))
+        if cursor.fetchone()[0] != 2:
+            raise HTTPException(status_code=404, detail="Guest not found")
+        
+        cursor.execute("""
+            INSERT INTO seating_constraints (id, wedding_id, guest_id, other_guest_id, kind)
+            VALUES (?, ?, ?, ?, ?)
+        """, (constraint_id, wedding_id, constraint.guest_id, constraint.other_guest_id, constraint.kind))
+        conn.commit()
+    
+    return {"id": constraint_id, "message": "Constraint added"}
+
+@app.delete("/weddings/{wedding_id}/seating/constraints/{constraint_id}")
+@db_handler
+def delete_seating_constraint(wedding_id: str, constraint_id: str):
+    """Delete seating constraint"""
+    with get_wedding_db(wedding_id, write=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            DELETE FROM seating_constraints WHERE id = ? AND wedding_id = ?
+        """, (constraint_id, wedding_id))
+        conn.commit()
+        
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Constraint not found")
+    
+    return {"message": "Constraint deleted"}
+
+@app.post("/weddings/{wedding_id}/seating/solve")
+@db_handler
+def solve_wedding_seating(wedding_id: str, request: Optional[SeatingSolveRequest] = None):
+    """Assign every guest who has not declined to a table.
+
+    Incremental solves (the default) keep seats that are still valid and only place new
+    or displaced guests; pass {"incremental": false} to re-plan from scratch. Locked
+    seats are always kept.
+    """
+    incremental = request.incremental if request else True
+    
+    with get_wedding_db(wedding_id, write=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        
+        cursor.execute("SELECT id, capacity FROM seating_tables WHERE wedding_id = ?", (wedding_id,))
+        tables = [dict(row) for row in cursor.fetchall()]
+        cursor.execute("""
+            SELECT id, party_size, group_name, table_id, seat_locked FROM guests
+            WHERE wedding_id = ? AND rsvp_status != 'declined'
+        """, (wedding_id,))
+        guests = [dict(row) for row in cursor.fetchall()]
+        cursor.execute("SELECT guest_id, other_guest_id, kind FROM seating_constraints WHERE wedding_id = ?",
+                       (wedding_id,))
+        constraints = cursor.fetchall()
+        
+        result = solve_seating(
+            guests, tables,
+            together=[(row["guest_id"], row["other_guest_id"]) for row in constraints if row["kind"] == "together"],
+            apart=[(row["guest_id"], row["other_guest_id"]) for row in constraints if row["kind"] == "apart"],
+            incremental=incremental
+        )
+        
+        # Write back only the seats that changed
+        changed = []
+        for guest in guests:
+            table_id = result["assignments"][guest["id"]]
+            if table_id != guest["table_id"]:
+                changed.append((table_id, guest["id"]))
+        cursor.executemany("UPDATE guests SET table_id = ? WHERE id = ?", changed)
+        cursor.execute("""
+            UPDATE guests SET table_id = NULL
+            WHERE wedding_id = ? AND rsvp_status = 'declined' AND table_id IS NOT NULL
+        """, (wedding_id,))
+        conn.commit()
+    
+    return {
+        "seated": sum(1 for table_id in result["assignments"].values() if table_id),
+        "unassigned": result["unassigned"],
+        "changed": len(changed),
+        "conflicts": result["conflicts"],
+        "elapsed_ms": result["elapsed_ms"]
+    }
+
 # ==================== VENDORS MARKETPLACE ====================
 
-@app.get("/vendors")
-def search_vendors(category: Optional[str] = None, location: Optional[str] = None):
+VENDOR_SEARCH_PLAN = RowPlan([
+    ("id", "id"),
+    ("business_name", "business_name"),
+    ("category", "category"),
+    ("description", "description"),
+    ("price_range_min", "price_range_min"),
+    ("price_range_max", "price_range_max"),
+    ("location", "location"),
+    ("phone", "phone"),
+    ("email", "email"),
+    ("rating", "rating"),
+    ("review_count", "review_count"),
+    ("ranking_score", "ranking_score"),
+    ("is_verified", "is_verified", bool),
+])
+
+@app.get("/vendors", response_class=FastJSONResponse)
+@db_handler
+def search_vendors(category: Optional[str] = None, location: Optional[str] = None,
+                   available_on: Optional[date] = None):
     """Search vendors in marketplace"""
     with get_db() as conn:
-        cursor = conn.cursor()
+        cursor = tuple_cursor(conn)
         
-        query = "SELECT * FROM vendors WHERE 1=1"
+        query = "SELECT * FROM vendors v WHERE 1=1"
         params = []
         
         if category:
@@ -919,31 +2470,18 @@ def search_vendors(category: Optional[str] = None, location: Optional[str] = Non
         if location:
             query += " AND location LIKE ?"
             params.append(f"%{location}%")
+        if available_on:
+            query += f" AND {VENDOR_AVAILABLE_SQL}"
+            params.extend([available_on] * 4)
         
-        query += " ORDER BY rating DESC, review_count DESC"
+        query += " ORDER BY ranking_score DESC, review_count DESC"
         
         cursor.execute(query, params)
         
-        vendors = []
-        for row in cursor.fetchall():
-            vendors.append({
-                "id": row["id"],
-                "business_name": row["business_name"],
-                "category": row["category"],
-                "description": row["description"],
-                "price_range_min": row["price_range_min"],
-                "price_range_max": row["price_range_max"],
-                "location": row["location"],
-                "phone": row["phone"],
-                "email": row["email"],
-                "rating": row["rating"],
-                "review_count": row["review_count"],
-                "is_verified": bool(row["is_verified"])
-            })
-        
-        return vendors
+        return FastJSONResponse(VENDOR_SEARCH_PLAN.encode(cursor))
 
 @app.get("/vendors/{vendor_id}")
+@db_handler
 def get_vendor_profile(vendor_id: str):
     """Get vendor profile"""
     with get_db() as conn:
@@ -968,10 +2506,13 @@ def get_vendor_profile(vendor_id: str):
             "instagram": row["instagram"],
             "rating": row["rating"],
             "review_count": row["review_count"],
+            "ranking_score": row["ranking_score"],
+            "daily_capacity": row["daily_capacity"],
             "is_verified": bool(row["is_verified"])
         }
 
 @app.post("/vendors")
+@db_handler
 def create_vendor(vendor: VendorCreate):
     """Create vendor profile (for vendors)"""
     vendor_id = generate_id()
@@ -981,23 +2522,522 @@ def create_vendor(vendor: VendorCreate):
         cursor.execute("""
             INSERT INTO vendors 
             (id, business_name, category, description, price_range_min, price_range_max, 
-             location, phone, email, website, instagram)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+             location, phone, email, website, instagram, daily_capacity)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (vendor_id, vendor.business_name, vendor.category, vendor.description,
               vendor.price_range_min, vendor.price_range_max, vendor.location,
-              vendor.phone, vendor.email, vendor.website, vendor.instagram))
+              vendor.phone, vendor.email, vendor.website, vendor.instagram, vendor.daily_capacity))
         conn.commit()
     
     return {"id": vendor_id, "message": "Vendor created"}
 
+# ==================== VENDOR AVAILABILITY ====================
+
+AVAILABILITY_MAX_DAYS = 366
+
+# Vendor `v` is free on a day (bound 4 times): not inside a blocked range and
+# active bookings on that day are below its capacity. All lookups are index seeks.
+VENDOR_AVAILABLE_SQL = """(
+    NOT EXISTS (
+        SELECT 1 FROM vendor_blocked_dates b
+        WHERE b.vendor_id = v.id AND b.start_date <= ? AND b.end_date >= ?
+    )
+    AND (
+        SELECT COUNT(*) FROM vendor_event_claims vc
+        WHERE vc.vendor_id = v.id AND vc.event_date = ?
+          AND COALESCE(vc.status, 'pending') != 'cancelled'
+    ) < COALESCE(
+        (SELECT dc.capacity FROM vendor_day_capacity dc WHERE dc.vendor_id = v.id AND dc.day = ?),
+        v.daily_capacity
+    )
+)"""
+
+def check_vendor_availability(cursor, vendor_id: str, day, exclude_booking_id: Optional[str] = None):
+    """Raise 409 if the vendor is blocked or fully booked on `day`"""
+    cursor.execute("""
+        SELECT 1 FROM vendor_blocked_dates
+        WHERE vendor_id = ? AND start_date <= ? AND end_date >= ?
+        LIMIT 1
+    """, (vendor_id, day, day))
+    if cursor.fetchone():
+        raise HTTPException(status_code=409, detail="Vendor is not available on this date")
+    
+    cursor.execute("""
+        SELECT COALESCE(
+            (SELECT capacity FROM vendor_day_capacity WHERE vendor_id = ? AND day = ?),
+            (SELECT daily_capacity FROM vendors WHERE id = ?)
+        ) AS capacity,
+        (SELECT COUNT(*) FROM vendor_event_claims
+         WHERE vendor_id = ? AND event_date = ? AND booking_id != ?
+           AND COALESCE(status, 'pending') != 'cancelled') AS booked
+    """, (vendor_id, day, vendor_id, vendor_id, day, exclude_booking_id or ""))
+    row = cursor.fetchone()
+    if row["capacity"] is not None and row["booked"] >= row["capacity"]:
+        raise HTTPException(status_code=409, detail="Vendor is fully booked on this date")
+
+def claim_vendor_date(booking_id: str, vendor_id: str, wedding_id: str, event_date, status: Optional[str],
+                      check: bool = True):
+    """Record (or move) a booking's claim on a vendor date in the catalog.
+
+    The catalog write lock serialises claims, so two bookings on different
+    shards cannot both take a vendor's last slot.
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        if check:
+            check_vendor_availability(cursor, vendor_id, event_date, exclude_booking_id=booking_id)
+        cursor.execute("""
+            INSERT INTO vendor_event_claims (booking_id, vendor_id, wedding_id, event_date, status)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (booking_id) DO UPDATE SET event_date = excluded.event_date, status = excluded.status
+        """, (booking_id, vendor_id, wedding_id, event_date, status))
+        conn.commit()
+
+def move_vendor_claims(booking_ids: List[str], event_date, check: bool = True):
+    """Move several bookings' vendor claims to `event_date`, all or none (409 if any vendor is taken)"""
+    if not booking_ids:
+        return
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        placeholders = ", ".join("?" for _ in booking_ids)
+        cursor.execute(f"""
+            SELECT booking_id, vendor_id, status FROM vendor_event_claims WHERE booking_id IN ({placeholders})
+        """, booking_ids)
+        for claim in cursor.fetchall():
+            if check and claim["status"] != "cancelled":
+                check_vendor_availability(cursor, claim["vendor_id"], event_date,
+                                          exclude_booking_id=claim["booking_id"])
+            cursor.execute("UPDATE vendor_event_claims SET event_date = ? WHERE booking_id = ?",
+                           (event_date, claim["booking_id"]))
+        conn.commit()
+
+def release_vendor_date(booking_id: str):
+    """Drop a booking's claim on a vendor date"""
+    with get_db() as conn:
+        conn.execute("DELETE FROM vendor_event_claims WHERE booking_id = ?", (booking_id,))
+        conn.commit()
+
+@app.get("/vendors/{vendor_id}/availability")
+@db_handler
+def get_vendor_availability(vendor_id: str, start: date, end: date):
+    """Day-by-day availability calendar for a vendor"""
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if (end - start).days >= AVAILABILITY_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range is limited to {AVAILABILITY_MAX_DAYS} days")
+    
+    with get_db() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT daily_capacity FROM vendors WHERE id = ?", (vendor_id,))
+        vendor = cursor.fetchone()
+        if not vendor:
+            raise HTTPException(status_code=404, detail="Vendor not found")
+        
+        cursor.execute("""
+            SELECT id, start_date, end_date, reason FROM vendor_blocked_dates
+            WHERE vendor_id = ? AND start_date <= ? AND end_date >= ?
+        """, (vendor_id, end, start))
+        blocks = cursor.fetchall()
+        
+        cursor.execute("""
+            SELECT day, capacity FROM vendor_day_capacity
+            WHERE vendor_id = ? AND day BETWEEN ? AND ?
+        """, (vendor_id, start, end))
+        capacities = {row["day"]: row["capacity"] for row in cursor.fetchall()}
+        
+        cursor.execute("""
+            SELECT event_date, COUNT(*) AS booked FROM vendor_event_claims
+            WHERE vendor_id = ? AND event_date BETWEEN ? AND ?
+              AND COALESCE(status, 'pending') != 'cancelled'
+            GROUP BY event_date
+        """, (vendor_id, start, end))
+        booked = {row["event_date"]: row["booked"] for row in cursor.fetchall()}
+        
+        days = []
+        day = start
+        while day <= end:
+            key = day.isoformat()
+            capacity = capacities.get(key, vendor["daily_capacity"])
+            is_blocked = any(b["start_date"] <= key <= b["end_date"] for b in blocks)
+            days.append({
+                "date": key,
+                "capacity": capacity,
+                "booked": booked.get(key, 0),
+                "is_blocked": is_blocked,
+                "is_available": not is_blocked and booked.get(key, 0) < capacity
+            })
+            day += timedelta(days=1)
+        
+        return {
+            "vendor_id": vendor_id,
+            "blocks": [dict(b) for b in blocks],
+            "days": days
+        }
+
+@app.post("/vendors/{vendor_id}/availability/blocks")
+@db_handler
+def create_vendor_block(vendor_id: str, block: VendorBlockCreate):
+    """Block a date range for a vendor"""
+    if block.end_date < block.start_date:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    
+    block_id = generate_id()
+    
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM vendors WHERE id = ?", (vendor_id,))
+        if not cursor.fetchone():
+            raise HTTPException(status_code=404, detail="Vendor not found")
+        
+        cursor.execute("""
+            INSERT INTO vendor_blocked_dates (id, vendor_id, start_date, end_date, reason)
+            VALUES (?, ?, ?, ?, ?)
+        """, (block_id, vendor_id, block.start_date, block.end_date, block.reason))
+        conn.commit()
+    
+    return {"id": block_id, "message": "Dates blocked"}
+
+@app.delete("/vendors/{vendor_id}/availability/blocks/{block_id}")
+@db_handler
+def delete_vendor_block(vendor_id: str, block_id: str):
+    """Remove a blocked date range"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM vendor_blocked_dates WHERE id = ? AND vendor_id = ?", (block_id, vendor_id))
+        conn.commit()
+        
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Block not found")
+    
+    return {"message": "Block deleted"}
+
+@app.put("/vendors/{vendor_id}/availability/{day}")
+@db_handler
+def set_vendor_day_capacity(vendor_id: str, day: date, update: VendorCapacityUpdate):
+    """Override a vendor's capacity for one day"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM vendors WHERE id = ?", (vendor_id,))
+        if not cursor.fetchone():
+            raise HTTPException(status_code=404, detail="Vendor not found")
+        
+        cursor.execute("""
+            INSERT INTO vendor_day_capacity (vendor_id, day, capacity) VALUES (?, ?, ?)
+            ON CONFLICT (vendor_id, day) DO UPDATE SET capacity = excluded.capacity
+        """, (vendor_id, day, update.capacity))
+        conn.commit()
+    
+    return {"message": "Capacity updated"}
+
+# ==================== REVIEWS ====================
+
+REVIEW_PAGE_SIZE = 20
+
+def recompute_vendor_ratings() -> int:
+    """Rebuild every vendor's review aggregate from the reviews table in one set-based pass"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("""
+            UPDATE vendors SET rating_sum = 0, review_count = 0, rating = 0, ranking_score = ?
+        """, (REVIEW_PRIOR_MEAN,))
+        cursor.execute("""
+            UPDATE vendors
+            SET rating_sum = agg.rating_sum,
+                review_count = agg.review_count,
+                rating = agg.rating_sum / agg.review_count,
+                ranking_score = (? * ? + agg.rating_sum) / (? + agg.review_count)
+            FROM (
+                SELECT vendor_id, CAST(SUM(rating) AS REAL) AS rating_sum, COUNT(*) AS review_count
+                FROM reviews GROUP BY vendor_id
+            ) AS agg
+            WHERE agg.vendor_id = vendors.id
+        """, (REVIEW_PRIOR_WEIGHT, REVIEW_PRIOR_MEAN, REVIEW_PRIOR_WEIGHT))
+        updated = cursor.rowcount
+        conn.commit()
+        return updated
+
+@app.post("/vendors/{vendor_id}/reviews")
+@db_handler
+def create_review(vendor_id: str, review: ReviewCreate, x_user_id: Optional[str] = Header(None)):
+    """Add a review and update the vendor's rating in the same transaction"""
+    review_id = generate_id()
+    
+    # The reviewing wedding comes from the body, which the access middleware does not see
+    if ACCESS_CONTROL_ENABLED:
+        if not x_user_id:
+            raise HTTPException(status_code=401, detail="X-User-Id header required")
+        if permissions.level(x_user_id, review.wedding_id) < EDIT:
+            raise HTTPException(status_code=403, detail="Access denied")
+    
+    with get_wedding_db(review.wedding_id) as conn:
+        if not conn.execute("SELECT 1 FROM weddings WHERE id = ?", (review.wedding_id,)).fetchone():
+            raise HTTPException(status_code=404, detail="Wedding not found")
+    
+    with get_db() as conn:
+        cursor = conn.cursor()
+        
+        # Incremental aggregate - the right-hand side sees the pre-update values
+        cursor.execute("""
+            UPDATE vendors
+            SET rating_sum = rating_sum + ?,
+                review_count = review_count + 1,
+                rating = (rating_sum + ?) / (review_count + 1),
+                ranking_score = (? * ? + rating_sum + ?) / (? + review_count + 1)
+            WHERE id = ?
+        """, (review.rating, review.rating, REVIEW_PRIOR_WEIGHT, REVIEW_PRIOR_MEAN,
+              review.rating, REVIEW_PRIOR_WEIGHT, vendor_id))
+        
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Vendor not found")
+        
+        cursor.execute("""
+            INSERT INTO reviews (id, wedding_id, vendor_id, rating, comment)
+            VALUES (?, ?, ?, ?, ?)
+        """, (review_id, review.wedding_id, vendor_id, review.rating, review.comment))
+        
+        conn.commit()
+    
+    return {"id": review_id, "message": "Review created"}
+
+@app.get("/vendors/{vendor_id}/reviews")
+@db_handler
+def get_reviews(vendor_id: str, cursor: Optional[str] = None, limit: int = REVIEW_PAGE_SIZE):
+    """Get vendor reviews, newest first (keyset pagination via `cursor`)"""
+    limit = max(1, min(limit, 100))
+    
+    with get_db() as conn:
+        db_cursor = conn.cursor()
+        
+        query = "SELECT * FROM reviews WHERE vendor_id = ?"
+        params = [vendor_id]
+        
+        if cursor:
+            try:
+                cursor_created_at, cursor_id = cursor.split("|", 1)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            query += " AND (created_at, id) < (?, ?)"
+            params.extend([cursor_created_at, cursor_id])
+        
+        query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+        
+        db_cursor.execute(query, params)
+        rows = db_cursor.fetchall()
+        
+        reviews = []
+        for row in rows[:limit]:
+            reviews.append({
+                "id": row["id"],
+                "wedding_id": row["wedding_id"],
+                "rating": row["rating"],
+                "comment": row["comment"],
+                "created_at": row["created_at"]
+            })
+        
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = f"{last['created_at']}|{last['id']}"
+        
+        return {"items": reviews, "next_cursor": next_cursor}
+
+# ==================== NOTIFICATIONS ====================
+
+NOTIFICATION_PAGE_SIZE = 20
+NOTIFICATION_RETENTION_DAYS = 90
+NOTIFICATION_PRUNE_BATCH = 500
+NOTIFICATION_PRUNE_INTERVAL_SECONDS = 3600
+
+def create_notification(cursor, user_id: str, title: str, body: str, wedding_id: Optional[str] = None,
+                        notification_type: Optional[str] = None, action_url: Optional[str] = None) -> str:
+    """Insert a notification using the caller's transaction (unread counter is updated by trigger)"""
+    notification_id = generate_id()
+    cursor.execute("""
+        INSERT INTO notifications (id, user_id, wedding_id, title, body, type, action_url)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (notification_id, user_id, wedding_id, title, body, notification_type, action_url))
+    return notification_id
+
+def notify_wedding_members(wedding_id: str, title: str, body: str, notification_type: str,
+                           action_url: Optional[str] = None):
+    """Notify a wedding's owner and collaborators (call after the shard write has committed)"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT user_id FROM wedding_shards WHERE wedding_id = ? AND user_id IS NOT NULL
+            UNION
+            SELECT user_id FROM shared_access WHERE wedding_id = ?
+        """, (wedding_id, wedding_id))
+        for row in cursor.fetchall():
+            create_notification(cursor, row["user_id"], title, body, wedding_id, notification_type, action_url)
+        conn.commit()
+
+def get_unread_count(cursor, user_id: str) -> int:
+    """Read the maintained unread counter - a single primary key lookup"""
+    cursor.execute("SELECT unread_count FROM notification_counters WHERE user_id = ?", (user_id,))
+    row = cursor.fetchone()
+    return row["unread_count"] if row else 0
+
+def prune_read_notifications(retention_days: int = NOTIFICATION_RETENTION_DAYS,
+                             batch_size: int = NOTIFICATION_PRUNE_BATCH) -> int:
+    """Delete read notifications older than the retention window in small batches.
+
+    Each batch is its own short transaction so the write lock is never held for long.
+    """
+    cutoff = (datetime.utcnow() - timedelta(days=retention_days)).strftime("%Y-%m-%d %H:%M:%S")
+    deleted = 0
+    with get_db() as conn:
+        cursor = conn.cursor()
+        while True:
+            cursor.execute("""
+                DELETE FROM notifications WHERE rowid IN (
+                    SELECT rowid FROM notifications
+                    WHERE is_read = 1 AND created_at < ?
+                    LIMIT ?
+                )
+            """, (cutoff, batch_size))
+            conn.commit()
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                break
+    return deleted
+
+@app.get("/users/{user_id}/notifications", response_model=NotificationPage)
+@db_handler
+def get_notifications(user_id: str, cursor: Optional[str] = None, limit: int = NOTIFICATION_PAGE_SIZE,
+                      unread_only: bool = False):
+    """Get notifications inbox, newest first (keyset pagination via `cursor`)"""
+    limit = max(1, min(limit, 100))
+
+    with get_db() as conn:
+        db_cursor = conn.cursor()
+
+        query = "SELECT * FROM notifications WHERE user_id = ?"
+        params = [user_id]
+
+        if unread_only:
+            query += " AND is_read = 0"
+        if cursor:
+            try:
+                cursor_created_at, cursor_id = cursor.split("|", 1)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            query += " AND (created_at, id) < (?, ?)"
+            params.extend([cursor_created_at, cursor_id])
+
+        query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        db_cursor.execute(query, params)
+        rows = db_cursor.fetchall()
+
+        items = []
+        for row in rows[:limit]:
+            items.append(NotificationResponse(
+                id=row["id"],
+                wedding_id=row["wedding_id"],
+                title=row["title"],
+                body=row["body"],
+                type=row["type"],
+                is_read=bool(row["is_read"]),
+                action_url=row["action_url"],
+                created_at=row["created_at"]
+            ))
+
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = f"{last['created_at']}|{last['id']}"
+
+        return NotificationPage(
+            items=items,
+            next_cursor=next_cursor,
+            unread_count=get_unread_count(db_cursor, user_id)
+        )
+
+@app.get("/users/{user_id}/notifications/unread-count")
+@db_handler
+def get_notifications_unread_count(user_id: str):
+    """Get unread notifications counter"""
+    with get_db() as conn:
+        return {"unread_count": get_unread_count(conn.cursor(), user_id)}
+
+@app.post("/users/{user_id}/notifications/read")
+@db_handler
+def mark_notifications_read(user_id: str, request: NotificationReadRequest):
+    """Mark many notifications as read in a single statement"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE notifications SET is_read = 1
+            WHERE user_id = ? AND is_read = 0
+              AND id IN (SELECT value FROM json_each(?))
+        """, (user_id, json.dumps(request.ids)))
+        updated = cursor.rowcount
+        conn.commit()
+
+        return {"updated": updated, "unread_count": get_unread_count(cursor, user_id)}
+
+# ==================== BACKGROUND JOBS ====================
+
+ARCHIVE_INTERVAL_SECONDS = 24 * 3600
+
+BACKGROUND_JOBS = [
+    (prune_read_notifications, NOTIFICATION_PRUNE_INTERVAL_SECONDS),
+    (snapshot_budget_ledger, BUDGET_SNAPSHOT_INTERVAL_SECONDS),
+    (prune_idempotency_keys, IDEMPOTENCY_PRUNE_INTERVAL_SECONDS),
+    (archive_past_weddings, ARCHIVE_INTERVAL_SECONDS),
+]
+
+if BACKUPS_ENABLED:
+    # Ships WAL frames and starts a new full-copy generation whenever one is due
+    BACKGROUND_JOBS.append((backups.ship_wal, WAL_SHIP_INTERVAL_SECONDS))
+
+logger = logging.getLogger("wedding_elite")
+
+# Per job: last success, last failure and failure count, reported by /health
+background_job_status: Dict[str, dict] = {}
+
+async def run_periodic(job, interval_seconds: int):
+    """Run a blocking maintenance job on the DB executor (no deadline), forever.
+
+    A failed run is logged and recorded; the job still runs again next interval.
+    """
+    status = background_job_status.setdefault(job.__name__, {
+        "last_success": None, "last_failure": None, "last_error": None, "failures": 0
+    })
+    while True:
+        try:
+            await db_executor.run(job)
+            status["last_success"] = datetime.now().isoformat()
+        except Exception as exc:
+            logger.exception("Background job %s failed", job.__name__)
+            status.update(last_failure=datetime.now().isoformat(), last_error=repr(exc), failures=status["failures"] + 1)
+        await asyncio.sleep(interval_seconds)
+
+@app.on_event("startup")
+async def start_background_jobs():
+    for job, interval_seconds in BACKGROUND_JOBS:
+        asyncio.create_task(run_periodic(job, interval_seconds))
+
 # ==================== HEALTH CHECK ====================
 
 @app.get("/health")
-def health_check():
+async def health_check():
     """Health check"""
     return {
         "status": "healthy",
-        "timestamp": datetime.now().isoformat()
+        "timestamp": datetime.now().isoformat(),
+        "db_executor": db_executor.metrics(),
+        "admission": admission.metrics(),
+        "permission_cache": permissions.metrics(),
+        "backups": backups.metrics(),
+        "background_jobs": background_job_status
     }
 
 # ==================== WEBSOCKET (Real-time) ====================
@@ -1005,20 +3045,36 @@ def health_check():
 class ConnectionManager:
     def __init__(self):
         self.active_connections: Dict[str, List[WebSocket]] = {}
+        self.connection_users: Dict[WebSocket, Optional[str]] = {}
 
-    async def connect(self, websocket: WebSocket, wedding_id: str):
+    async def connect(self, websocket: WebSocket, wedding_id: str, user_id: Optional[str] = None) -> bool:
+        if ACCESS_CONTROL_ENABLED and (not user_id or await access_level(user_id, wedding_id) < VIEW):
+            await websocket.close(code=1008)
+            return False
         await websocket.accept()
         if wedding_id not in self.active_connections:
             self.active_connections[wedding_id] = []
         self.active_connections[wedding_id].append(websocket)
+        self.connection_users[websocket] = user_id
+        return True
 
     def disconnect(self, websocket: WebSocket, wedding_id: str):
         if wedding_id in self.active_connections:
             self.active_connections[wedding_id].remove(websocket)
+        self.connection_users.pop(websocket, None)
+
+    async def can_send(self, websocket: WebSocket, wedding_id: str) -> bool:
+        """Only editors may push updates to the other clients"""
+        if not ACCESS_CONTROL_ENABLED:
+            return True
+        return await access_level(self.connection_users[websocket], wedding_id) >= EDIT
 
     async def broadcast(self, message: str, wedding_id: str):
         if wedding_id in self.active_connections:
-            for connection in self.active_connections[wedding_id]:
+            for connection in list(self.active_connections[wedding_id]):
+                # Permissions are re-checked from the cache, so a revoke takes effect on open sockets
+                if ACCESS_CONTROL_ENABLED and await access_level(self.connection_users[connection], wedding_id) < VIEW:
+                    continue
                 try:
                     await connection.send_text(message)
                 except:
@@ -1029,15 +3085,70 @@ manager = ConnectionManager()
 @app.websocket("/ws/wedding/{wedding_id}")
 async def websocket_endpoint(websocket: WebSocket, wedding_id: str):
     """WebSocket for real-time updates"""
-    await manager.connect(websocket, wedding_id)
+    ip = client_ip(websocket)
+    if admission.check_rate("ws", ip, wedding_id):
+        await websocket.close(code=1008)  # policy violation: reconnecting too fast
+        return
+
+    # Browsers cannot set headers on WebSockets, so the caller is identified by ?user_id=
+    if not await manager.connect(websocket, wedding_id, websocket.query_params.get("user_id")):
+        return
     try:
         while True:
             data = await websocket.receive_text()
+            retry_after = admission.check_rate("ws", ip, wedding_id)
+            if retry_after:
+                # Drop the message instead of fanning it out; tell the sender when to try again
+                await websocket.send_text(json.dumps({"type": "rate_limited", "retry_after": math.ceil(retry_after)}))
+                continue
+            if not await manager.can_send(websocket, wedding_id):
+                await websocket.send_text(json.dumps({"type": "forbidden"}))
+                continue
             # Broadcast to all connected clients
             await manager.broadcast(data, wedding_id)
     except WebSocketDisconnect:
         manager.disconnect(websocket, wedding_id)
 
+# ==================== MANAGEMENT COMMANDS ====================
+
+MANAGEMENT_COMMANDS = {
+    "prune-notifications": prune_read_notifications,
+    "prune-idempotency-keys": prune_idempotency_keys,
+    "snapshot-budget": snapshot_budget_ledger,
+    "recompute-ratings": recompute_vendor_ratings,
+    "rebalance-shards": rebalance_shards,
+    "archive-weddings": archive_past_weddings,
+    "benchmark-serialization": benchmark_serialization,
+    "backup": backups.full_backup,
+    "restore-backup": restore_backup,
+    "verify-backups": verify_backups,
+}
+
+def management_parser() -> argparse.ArgumentParser:
+    """One sub-command per MANAGEMENT_COMMANDS entry; positional arguments follow the
+    function's parameters and are converted to their annotated types"""
+    parser = argparse.ArgumentParser(prog="python main.py", description="Maintenance commands (no command: run the server)")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="command")
+    for name, command in MANAGEMENT_COMMANDS.items():
+        doc = inspect.getdoc(command) or ""
+        sub = commands.add_parser(name, help=doc.splitlines()[0] if doc else None)
+        for parameter in inspect.signature(command).parameters.values():
+            convert = parameter.annotation if parameter.annotation in (int, float) else str
+            if parameter.default is inspect.Parameter.empty:
+                sub.add_argument(parameter.name, type=convert)
+            else:
+                sub.add_argument(parameter.name, type=convert, nargs="?", default=parameter.default,
+                                 help=f"default: {parameter.default}")
+    return parser
+
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    import sys
+    
+    if len(sys.argv) > 1:
+        # e.g. python main.py prune-notifications 30, python main.py restore-backup restored/
+        args = vars(management_parser().parse_args())
+        command = MANAGEMENT_COMMANDS[args.pop("command")]
+        print(command(**args))
+    else:
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,138 @@
+"""
+Wedding Elite V2.0 - Seating solver
+Assigns guests (parties of `party_size` seats) to tables. Must-sit-together pairs are
+merged into units that are always seated whole, must-not-sit-together pairs keep units
+at different tables, and guests of the same group are spread over as few tables as
+possible. Placement is greedy best-fit, largest groups and units first, so hundreds of
+guests solve in milliseconds. An incremental solve keeps every seat that is still valid
+and only places the guests that are new, moved or displaced.
+"""
+
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+def _find(parent: Dict[str, str], x: str) -> str:
+    while parent[x] != x:
+        parent[x] = parent[parent[x]]
+        x = parent[x]
+    return x
+
+def solve_seating(guests: List[dict], tables: List[dict], together: List[Tuple[str, str]],
+                  apart: List[Tuple[str, str]], incremental: bool = True) -> dict:
+    """Seat `guests` at `tables`.
+
+    guests: dicts with id, party_size, group_name, table_id (current seat or None) and
+    seat_locked (keep at table_id no matter what). tables: dicts with id and capacity.
+    Returns {"assignments": {guest_id: table_id or None}, "unassigned": [...],
+    "conflicts": [...], "elapsed_ms": ...}.
+    """
+    started = time.perf_counter()
+    by_id = {guest["id"]: guest for guest in guests}
+    capacity = {table["id"]: table["capacity"] for table in tables}
+    conflicts: List[str] = []
+
+    # Units: connected components of must-sit-together
+    parent = {guest_id: guest_id for guest_id in by_id}
+    for a, b in together:
+        if a in by_id and b in by_id:
+            parent[_find(parent, a)] = _find(parent, b)
+    members: Dict[str, List[str]] = {}
+    for guest_id in by_id:
+        members.setdefault(_find(parent, guest_id), []).append(guest_id)
+
+    unit_size = {unit: sum(by_id[g]["party_size"] for g in ids) for unit, ids in members.items()}
+    unit_group: Dict[str, Optional[str]] = {}
+    for unit, ids in members.items():
+        groups = Counter(by_id[g]["group_name"] for g in ids if by_id[g]["group_name"])
+        unit_group[unit] = groups.most_common(1)[0][0] if groups else None
+
+    avoid: Dict[str, set] = {unit: set() for unit in members}
+    for a, b in apart:
+        if a not in by_id or b not in by_id:
+            continue
+        unit_a, unit_b = _find(parent, a), _find(parent, b)
+        if unit_a == unit_b:
+            conflicts.append(f"{a} and {b} must sit both together and apart")
+            continue
+        avoid[unit_a].add(unit_b)
+        avoid[unit_b].add(unit_a)
+
+    free = dict(capacity)
+    seated: Dict[str, set] = {table_id: set() for table_id in capacity}
+    group_seats: Dict[str, Counter] = {table_id: Counter() for table_id in capacity}
+    unit_table: Dict[str, str] = {}
+
+    def seat(unit: str, table_id: str):
+        unit_table[unit] = table_id
+        seated[table_id].add(unit)
+        free[table_id] -= unit_size[unit]
+        if unit_group[unit]:
+            group_seats[table_id][unit_group[unit]] += unit_size[unit]
+
+    def fits(unit: str, table_id: str) -> bool:
+        return free[table_id] >= unit_size[unit] and not (avoid[unit] & seated[table_id])
+
+    # Locked seats are kept unconditionally, then (incremental) every still-valid seat
+    for unit, ids in members.items():
+        locked = {by_id[g]["table_id"] for g in ids if by_id[g].get("seat_locked") and by_id[g]["table_id"] in capacity}
+        if locked:
+            if len(locked) > 1:
+                conflicts.append(f"{', '.join(sorted(ids))} are locked to different tables but must sit together")
+            table_id = sorted(locked)[0]
+            if not fits(unit, table_id):
+                conflicts.append(f"locked seats at table {table_id} exceed its capacity or split a must-not pair")
+            seat(unit, table_id)
+
+    if incremental:
+        keep = []
+        for unit, ids in members.items():
+            if unit in unit_table:
+                continue
+            current = {by_id[g]["table_id"] for g in ids}
+            if len(current) == 1:
+                table_id = current.pop()
+                if table_id in capacity:
+                    keep.append((unit_size[unit], unit, table_id))
+        for _, unit, table_id in sorted(keep, reverse=True):
+            if fits(unit, table_id):
+                seat(unit, table_id)
+
+    # Greedy placement of the rest: biggest groups first, biggest units first within a group
+    pending: Dict[Optional[str], List[str]] = {}
+    for unit in members:
+        if unit not in unit_table:
+            pending.setdefault(unit_group[unit], []).append(unit)
+    order = sorted(pending.items(), key=lambda item: (item[0] is None, -sum(unit_size[u] for u in item[1])))
+
+    unassigned_units = []
+    for group, units in order:
+        remaining = sum(unit_size[u] for u in units)
+        for unit in sorted(units, key=lambda u: -unit_size[u]):
+            best, best_key = None, None
+            for table_id in capacity:
+                if not fits(unit, table_id):
+                    continue
+                together_seats = group_seats[table_id][group] if group else 0
+                # Whole rest of the group fits here -> tightest such table; otherwise the roomiest table
+                fits_rest = free[table_id] >= (remaining if group else unit_size[unit])
+                key = (together_seats, fits_rest, -free[table_id] if fits_rest else free[table_id])
+                if best_key is None or key > best_key:
+                    best, best_key = table_id, key
+            if best is None:
+                unassigned_units.append(unit)
+            else:
+                seat(unit, best)
+            remaining -= unit_size[unit]
+
+    assignments = {guest_id: unit_table.get(_find(parent, guest_id)) for guest_id in by_id}
+    unassigned = sorted(g for unit in unassigned_units for g in members[unit])
+    if unassigned:
+        conflicts.append(f"{len(unassigned)} guests could not be seated (not enough room or conflicting constraints)")
+
+    return {
+        "assignments": assignments,
+        "unassigned": unassigned,
+        "conflicts": conflicts,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
@@ -1,7 +1,280 @@
-const CACHE_NAME = 'wedding-v2';
+// Wedding Elite V2.0 - Service worker
+// App shell: precached per SHELL_VERSION, served cache-first; bumping the version
+// replaces it and activate drops every cache this worker no longer uses.
+// API reads: stale-while-revalidate - the cached copy renders instantly while a
+// conditional request (If-None-Match with the cached ETag) refreshes it; a 304 just
+// keeps the copy. The API cache holds at most API_MAX_ENTRIES responses, least recently
+// validated evicted first, and copies older than API_MAX_AGE_MS are only used offline.
+// Copies are kept per X-User-Id (the server answers by caller), and every successful
+// write - sent live or replayed - drops the cached reads it may have changed.
+// API writes made offline are queued in IndexedDB and replayed in order by Background
+// Sync (or on the next `online`/start-up where Background Sync is missing). A write that
+// failed on the client may still have reached the server, so only writes that are safe to
+// apply twice are queued: PUT/DELETE, setting an RSVP, marking notifications read, and the
+// creates that honor Idempotency-Key (weddings, bookings, tasks). Anything else - other
+// creates, the task completion toggle - gets an offline error instead.
+
+const SHELL_VERSION = 'v3';
+const SHELL_CACHE = `wedding-shell-${SHELL_VERSION}`;
+const API_CACHE = 'wedding-api-v1';
+const SHELL_ASSETS = ['/', '/index.html', '/manifest.json'];
+
+const API_PATH = /^\/(weddings|users|planners|vendors|tasks|bookings|budget|guests|tables)(\/|$)/;
+const API_MAX_ENTRIES = 200;
+const API_MAX_AGE_MS = 7 * 24 * 60 * 60 * 1000;
+const FETCHED_AT_HEADER = 'X-SW-Fetched-At';
+const CACHE_USER_PARAM = '__sw_user';
+// Reads that span weddings or are addressed by row id: stale after any wedding write
+const CROSS_WEDDING_READS = /^\/(users|planners|vendors|budget)(\/|$)/;
+
+const OUTBOX_DB = 'wedding-sw';
+const OUTBOX_STORE = 'outbox';
+const SYNC_TAG = 'replay-outbox';
+
+const REPLAYABLE_WRITES = [
+  { method: 'POST', path: /^\/weddings\/?$/ },
+  { method: 'POST', path: /^\/weddings\/[^/]+\/(bookings|tasks)\/?$/ },
+  { method: 'POST', path: /^\/users\/[^/]+\/notifications\/read\/?$/ },
+  { method: 'PATCH', path: /^\/guests\/[^/]+\/rsvp\/?$/ },
+  { method: 'PUT', path: /./ },
+  { method: 'DELETE', path: /./ },
+];
+
 self.addEventListener('install', (e) => {
-  e.waitUntil(caches.open(CACHE_NAME).then((cache) => cache.addAll(['/', '/index.html'])));
+  e.waitUntil(
+    caches.open(SHELL_CACHE)
+      .then((cache) => cache.addAll(SHELL_ASSETS))
+      .then(() => self.skipWaiting())
+  );
 });
+
+self.addEventListener('activate', (e) => {
+  e.waitUntil(
+    caches.keys()
+      .then((names) => Promise.all(
+        names.filter((name) => name !== SHELL_CACHE && name !== API_CACHE).map((name) => caches.delete(name))
+      ))
+      .then(() => self.clients.claim())
+      .then(() => replayOutbox())
+  );
+});
+
 self.addEventListener('fetch', (e) => {
+  const url = new URL(e.request.url);
+  if (url.protocol !== 'http:' && url.protocol !== 'https:') return;
+
+  if (API_PATH.test(url.pathname)) {
+    if (e.request.method === 'GET') {
+      e.respondWith(staleWhileRevalidate(e));
+    } else {
+      e.respondWith(sendOrQueue(e.request));
+    }
+    return;
+  }
+
+  if (e.request.method !== 'GET' || url.origin !== self.location.origin) return;
+  if (e.request.mode === 'navigate') {
+    e.respondWith(caches.match('/index.html').then((res) => res || fetch(e.request)));
+    return;
+  }
   e.respondWith(caches.match(e.request).then((res) => res || fetch(e.request)));
 });
+
+self.addEventListener('sync', (e) => {
+  if (e.tag === SYNC_TAG) e.waitUntil(replayOutbox());
+});
+
+self.addEventListener('message', (e) => {
+  if (e.data && e.data.type === SYNC_TAG) e.waitUntil(replayOutbox());
+});
+
+// ==================== API READS ====================
+
+async function staleWhileRevalidate(e) {
+  const cache = await caches.open(API_CACHE);
+  const key = cacheKey(e.request);
+  const cached = await cache.match(key);
+  const refresh = revalidate(cache, e.request, key, cached && cached.clone());
+
+  if (cached && Date.now() - Number(cached.headers.get(FETCHED_AT_HEADER)) < API_MAX_AGE_MS) {
+    e.waitUntil(refresh.catch(() => {}));
+    return cached;
+  }
+  try {
+    return await refresh;
+  } catch (err) {
+    return cached || offlineResponse('Offline and not cached yet');
+  }
+}
+
+// A 304 re-stores the cached copy too, which renews its age and its place in the eviction order
+async function revalidate(cache, request, key, cached) {
+  const headers = new Headers(request.headers);
+  const etag = cached && cached.headers.get('ETag');
+  if (etag) headers.set('If-None-Match', etag);
+
+  const res = await fetch(request.url, { headers, mode: 'cors', credentials: request.credentials });
+  const source = res.status === 304 && cached ? cached : res;
+  if (source.status !== 200) return res;
+
+  const stored = new Headers(source.headers);
+  stored.set(FETCHED_AT_HEADER, String(Date.now()));
+  const copy = new Response(await source.clone().blob(), { status: 200, statusText: source.statusText, headers: stored });
+  await cache.put(key, copy.clone());
+  await trimCache(cache);
+  return copy;
+}
+
+// One user's answer must never be served to another user of the same browser
+function cacheKey(request) {
+  const user = request.headers.get('X-User-Id');
+  if (!user) return request;
+  const url = new URL(request.url);
+  url.searchParams.set(CACHE_USER_PARAM, user);
+  return url.href;
+}
+
+// A write to /weddings/{id}/... drops that wedding's reads and the cross-wedding ones;
+// row-id and other writes cannot be traced to a wedding, so they drop every cached read
+async function dropStaleReads(url) {
+  const wedding = new URL(url).pathname.match(/^\/weddings\/[^/]+/);
+  const cache = await caches.open(API_CACHE);
+  const keys = await cache.keys();
+  await Promise.all(keys
+    .filter((key) => {
+      const { pathname } = new URL(key.url);
+      return !wedding || pathname === wedding[0] || pathname.startsWith(`${wedding[0]}/`)
+        || CROSS_WEDDING_READS.test(pathname);
+    })
+    .map((key) => cache.delete(key)));
+}
+
+// Cache.put appends, so keys() lists entries oldest write first
+async function trimCache(cache) {
+  const keys = await cache.keys();
+  const excess = keys.length - API_MAX_ENTRIES;
+  await Promise.all(keys.slice(0, Math.max(excess, 0)).map((key) => cache.delete(key)));
+}
+
+// ==================== API WRITES ====================
+
+function isReplayable(method, url) {
+  const { pathname } = new URL(url);
+  return REPLAYABLE_WRITES.some((write) => write.method === method && write.path.test(pathname));
+}
+
+async function sendOrQueue(request) {
+  const replayable = isReplayable(request.method, request.url);
+  const headers = new Headers(request.headers);
+  if (replayable && request.method === 'POST' && !headers.has('Idempotency-Key')) {
+    headers.set('Idempotency-Key', crypto.randomUUID());
+  }
+  const entry = {
+    url: request.url,
+    method: request.method,
+    headers: [...headers.entries()],
+    body: await request.text(),
+    queuedAt: Date.now(),
+  };
+
+  try {
+    return await send(entry);
+  } catch (err) {
+    if (!replayable) return offlineResponse('Offline - this change cannot be saved until you are back online');
+    await outbox('readwrite', (store) => store.add(entry));
+    if (self.registration.sync) {
+      await self.registration.sync.register(SYNC_TAG).catch(() => {});
+    }
+    return new Response(JSON.stringify({ detail: 'Saved offline, will be sent when back online', queued: true }), {
+      status: 202,
+      headers: { 'Content-Type': 'application/json' },
+    });
+  }
+}
+
+async function send(entry) {
+  const res = await fetch(entry.url, {
+    method: entry.method,
+    headers: entry.headers,
+    body: entry.body || undefined,
+    mode: 'cors',
+  });
+  // The write went through: a cache error must not get it queued (or replayed) again
+  if (res.ok) await dropStaleReads(entry.url).catch(() => {});
+  return res;
+}
+
+// sync, message and activate can all fire together: one replay runs at a time, and a call
+// made during it gets another pass afterwards for anything queued meanwhile
+let replaying = null;
+let replayRequested = false;
+
+function replayOutbox() {
+  if (replaying) {
+    replayRequested = true;
+    return replaying;
+  }
+  replaying = (async () => {
+    try {
+      do {
+        replayRequested = false;
+      } while ((await drainOutbox()) && replayRequested);
+    } finally {
+      replaying = null;
+    }
+  })();
+  return replaying;
+}
+
+// Replays in queue order and stops at the first network error, 429 or 5xx so later
+// writes never overtake earlier ones; other responses (including 4xx) are final.
+// Resolves true when the queue was emptied.
+async function drainOutbox() {
+  const entries = await outbox('readonly', (store) => store.getAll(), true);
+  let sent = 0;
+  for (const { id, ...entry } of entries) {
+    let res;
+    try {
+      res = await send(entry);
+    } catch (err) {
+      break;
+    }
+    if (res.status === 429 || res.status >= 500) break;
+    await outbox('readwrite', (store) => store.delete(id));
+    sent += 1;
+  }
+
+  if (sent) {
+    const clients = await self.clients.matchAll();
+    clients.forEach((client) => client.postMessage({ type: 'outbox-replayed', sent, pending: entries.length - sent }));
+  }
+  return sent === entries.length;
+}
+
+// ==================== INDEXEDDB ====================
+
+function openOutbox() {
+  return new Promise((resolve, reject) => {
+    const req = indexedDB.open(OUTBOX_DB, 1);
+    req.onupgradeneeded = () => req.result.createObjectStore(OUTBOX_STORE, { keyPath: 'id', autoIncrement: true });
+    req.onsuccess = () => resolve(req.result);
+    req.onerror = () => reject(req.error);
+  });
+}
+
+async function outbox(mode, fn, withResult = false) {
+  const db = await openOutbox();
+  return new Promise((resolve, reject) => {
+    const tx = db.transaction(OUTBOX_STORE, mode);
+    const req = fn(tx.objectStore(OUTBOX_STORE));
+    tx.oncomplete = () => { db.close(); resolve(withResult ? req.result : undefined); };
+    tx.onerror = () => { db.close(); reject(tx.error); };
+  });
+}
+
+function offlineResponse(detail) {
+  return new Response(JSON.stringify({ detail, offline: true }), {
+    status: 503,
+    headers: { 'Content-Type': 'application/json', 'Retry-After': '5' },
+  });
+}
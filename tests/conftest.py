@@ -0,0 +1,36 @@
+"""
+Test setup: a throwaway three-shard database, configured before main is imported
+(main reads its settings and initialises every database at import time).
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+DATA_DIR = tempfile.mkdtemp(prefix="wedding-tests-")
+os.environ.update({
+    "WEDDING_DATABASE": os.path.join(DATA_DIR, "wedding.db"),
+    "WEDDING_SHARD_COUNT": "3",
+    "WEDDING_RATE_PER_WEDDING": "0",
+    "WEDDING_RATE_PER_IP": "0",
+    "WEDDING_BACKUP_DIR": os.path.join(DATA_DIR, "backups"),
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+@pytest.fixture
+def client():
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+@pytest.fixture
+def wedding_id(client):
+    response = client.post("/weddings", json={
+        "groom_name": "Dan", "bride_name": "Noa", "wedding_date": "2027-06-01", "total_budget": 100000
+    })
+    assert response.status_code == 200
+    return response.json()["id"]
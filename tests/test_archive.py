@@ -0,0 +1,53 @@
+import pytest
+
+import database
+from database import ARCHIVED_SHARD, WeddingMoved, archive_past_weddings, get_wedding_db, restore_wedding, shard_for_wedding
+
+@pytest.fixture
+def past_wedding_id(client):
+    response = client.post("/weddings", json={
+        "groom_name": "Avi", "bride_name": "Maya", "wedding_date": "2024-03-01", "total_budget": 80000
+    })
+    return response.json()["id"]
+
+def test_archived_wedding_reads_and_row_writes(client, past_wedding_id):
+    client.post(f"/weddings/{past_wedding_id}/tasks", json={"title": "Send photos"})
+    tasks = client.get(f"/weddings/{past_wedding_id}/tasks").json()
+    assert archive_past_weddings() >= 1
+    assert shard_for_wedding(past_wedding_id) == ARCHIVED_SHARD
+    assert client.get(f"/weddings/{past_wedding_id}/tasks").json() == tasks
+
+    # Row-id writes restore the wedding first instead of answering 404
+    task_id = tasks[0]["id"]
+    assert client.patch(f"/tasks/{task_id}/complete").status_code == 200
+    assert shard_for_wedding(past_wedding_id) != ARCHIVED_SHARD
+    assert client.put(f"/tasks/{task_id}", json={"title": "Thank-you notes"}).status_code == 200
+    task = next(t for t in client.get(f"/weddings/{past_wedding_id}/tasks").json() if t["id"] == task_id)
+    assert task["title"] == "Thank-you notes" and task["is_completed"] != tasks[0]["is_completed"]
+
+def test_stale_shard_map_follows_archive_and_restore(client, past_wedding_id):
+    shard = shard_for_wedding(past_wedding_id)
+    archive_past_weddings()
+
+    # A server process that cached the wedding before another process archived it
+    database._shard_map_cache[past_wedding_id] = shard
+    assert client.get(f"/weddings/{past_wedding_id}").status_code == 200
+    assert database._shard_map_cache[past_wedding_id] == ARCHIVED_SHARD
+
+    # ... and one that still thinks it is archived after a restore elsewhere
+    restore_wedding(past_wedding_id)
+    database._shard_map_cache[past_wedding_id] = ARCHIVED_SHARD
+    assert client.get(f"/weddings/{past_wedding_id}").status_code == 200
+    assert database._shard_map_cache[past_wedding_id] == shard
+
+def test_write_routed_before_archiving_is_refused_not_lost(client, past_wedding_id):
+    tasks_before = len(client.get(f"/weddings/{past_wedding_id}/tasks").json())
+
+    with pytest.raises(WeddingMoved):
+        with get_wedding_db(past_wedding_id, write=True) as conn:
+            archive_past_weddings()
+            conn.execute("INSERT INTO tasks (id, wedding_id, title) VALUES ('late-archive', ?, 'Late')",
+                         (past_wedding_id,))
+            conn.commit()
+
+    assert len(client.get(f"/weddings/{past_wedding_id}/tasks").json()) == tasks_before
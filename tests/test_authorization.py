@@ -0,0 +1,72 @@
+import time
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+import main
+from authorization import EDIT, NO_ACCESS, VIEW, PermissionCache
+
+OWNER = {"X-User-Id": "owner-1"}
+STRANGER = {"X-User-Id": "stranger-1"}
+VIEWER = {"X-User-Id": "viewer-1"}
+
+@pytest.fixture
+def owned_wedding_id(client, monkeypatch):
+    monkeypatch.setattr(main, "ACCESS_CONTROL_ENABLED", True)
+    response = client.post("/weddings", headers=OWNER, json={
+        "groom_name": "Dan", "bride_name": "Noa", "wedding_date": "2027-06-01", "total_budget": 100000
+    })
+    return response.json()["id"]
+
+def test_middleware_checks_the_caller(client, owned_wedding_id):
+    assert client.get(f"/weddings/{owned_wedding_id}").status_code == 401
+    assert client.get(f"/weddings/{owned_wedding_id}", headers=STRANGER).status_code == 403
+    assert client.get(f"/weddings/{owned_wedding_id}", headers=OWNER).status_code == 200
+
+    client.post(f"/weddings/{owned_wedding_id}/shares", headers=OWNER, json={"user_id": "viewer-1"})
+    assert client.get(f"/weddings/{owned_wedding_id}/tasks", headers=VIEWER).status_code == 200
+    task_id = client.get(f"/weddings/{owned_wedding_id}/tasks", headers=OWNER).json()[0]["id"]
+    assert client.put(f"/tasks/{task_id}", headers=VIEWER, json={"title": "Mine now"}).status_code == 403
+    assert client.put(f"/tasks/{task_id}", headers=STRANGER, json={"title": "Mine now"}).status_code == 403
+
+    client.delete(f"/weddings/{owned_wedding_id}/shares/viewer-1", headers=OWNER)
+    assert client.get(f"/weddings/{owned_wedding_id}/tasks", headers=VIEWER).status_code == 403
+
+def test_revoke_reaches_another_process_after_the_ttl(client, owned_wedding_id):
+    client.post(f"/weddings/{owned_wedding_id}/shares", headers=OWNER, json={"user_id": "viewer-1", "can_edit": True})
+    other_worker = PermissionCache(ttl=0.2)
+    assert other_worker.level("viewer-1", owned_wedding_id) == EDIT
+
+    # Invalidation only reaches the process that handled the revoke
+    client.delete(f"/weddings/{owned_wedding_id}/shares/viewer-1", headers=OWNER)
+    assert other_worker.cached_level("viewer-1", owned_wedding_id) == EDIT
+
+    time.sleep(0.3)
+    assert other_worker.cached_level("viewer-1", owned_wedding_id) is None
+    assert other_worker.level("viewer-1", owned_wedding_id) == NO_ACCESS
+
+def test_invalidation_drops_cached_permissions(client, owned_wedding_id):
+    cache = PermissionCache()
+    assert cache.level("viewer-1", owned_wedding_id) == NO_ACCESS
+    client.post(f"/weddings/{owned_wedding_id}/shares", headers=OWNER, json={"user_id": "viewer-1"})
+    assert cache.cached_level("viewer-1", owned_wedding_id) == NO_ACCESS
+
+    cache.invalidate("viewer-1")
+
+    assert cache.level("viewer-1", owned_wedding_id) == VIEW
+
+def test_websocket_needs_view_access(client, owned_wedding_id):
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect(f"/ws/wedding/{owned_wedding_id}?user_id=stranger-1") as websocket:
+            websocket.receive_text()
+    with client.websocket_connect(f"/ws/wedding/{owned_wedding_id}?user_id=owner-1"):
+        pass
+
+def test_review_needs_access_to_the_reviewing_wedding(client, owned_wedding_id):
+    vendor_id = client.post("/vendors", json={"business_name": "Band", "category": "music"}).json()["id"]
+    review = {"wedding_id": owned_wedding_id, "rating": 5, "comment": "Great"}
+
+    assert client.post(f"/vendors/{vendor_id}/reviews", json=review).status_code == 401
+    assert client.post(f"/vendors/{vendor_id}/reviews", headers=STRANGER, json=review).status_code == 403
+    assert client.post(f"/vendors/{vendor_id}/reviews", headers=OWNER, json=review).status_code == 200
+    assert client.get(f"/vendors/{vendor_id}").json()["review_count"] == 1
@@ -0,0 +1,52 @@
+import main
+from database import SHARD_COUNT, archive_past_weddings, get_wedding_db, migrate_wedding, restore_wedding, shard_for_wedding
+
+def history(client, category_id):
+    return [(entry["delta"], entry["reason"], entry["running_total"])
+            for entry in client.get(f"/budget/{category_id}/history").json()]
+
+def actual_amount(client, wedding_id, category_id):
+    budget = {row["id"]: row for row in client.get(f"/weddings/{wedding_id}/budget").json()}
+    return budget[category_id]["actual_amount"]
+
+def test_ledger_and_snapshots_survive_migrate_archive_and_restore(client):
+    wedding_id = client.post("/weddings", json={
+        "groom_name": "Avi", "bride_name": "Maya", "wedding_date": "2024-03-01", "total_budget": 80000
+    }).json()["id"]
+    category_id = client.get(f"/weddings/{wedding_id}/budget").json()[0]["id"]
+    for amount in (100, 250, 400):
+        client.post(f"/weddings/{wedding_id}/bookings",
+                    json={"category_id": category_id, "vendor_name": f"Vendor {amount}", "amount": amount})
+    main.snapshot_budget_ledger(min_tail=1)
+    booking_id = client.get(f"/weddings/{wedding_id}/bookings").json()[0]["id"]
+    client.put(f"/bookings/{booking_id}", json={"amount": 1000})
+    client.put(f"/budget/{category_id}", json={"actual_amount": 2000})
+    before = history(client, category_id)
+
+    migrate_wedding(wedding_id, (shard_for_wedding(wedding_id) + 1) % SHARD_COUNT)
+    assert history(client, category_id) == before
+    assert actual_amount(client, wedding_id, category_id) == 2000
+
+    main.snapshot_budget_ledger(min_tail=1)
+    assert archive_past_weddings() >= 1
+    assert history(client, category_id) == before
+    restore_wedding(wedding_id)
+    assert history(client, category_id) == before
+    assert actual_amount(client, wedding_id, category_id) == 2000
+    client.post(f"/weddings/{wedding_id}/bookings", json={"category_id": category_id, "vendor_name": "Late", "amount": 5})
+    assert actual_amount(client, wedding_id, category_id) == 2005
+
+def test_booking_cannot_spend_another_weddings_category(client, wedding_id):
+    other_id = client.post("/weddings", json={
+        "groom_name": "Ron", "bride_name": "Tal", "wedding_date": "2027-09-01", "total_budget": 50000
+    }).json()["id"]
+    other_category_id = client.get(f"/weddings/{other_id}/budget").json()[0]["id"]
+
+    response = client.post(f"/weddings/{wedding_id}/bookings",
+                           json={"category_id": other_category_id, "vendor_name": "DJ", "amount": 900})
+
+    assert response.status_code == 404
+    assert client.get(f"/budget/{other_category_id}/history").json() == []
+    assert client.get(f"/weddings/{wedding_id}/bookings").json() == []
+    with get_wedding_db(other_id) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM budget_ledger WHERE wedding_id = ?", (other_id,)).fetchone()[0] == 0
@@ -0,0 +1,25 @@
+def add_booking(client, wedding_id, category_id, amount, due):
+    response = client.post(f"/weddings/{wedding_id}/bookings", json={
+        "category_id": category_id, "vendor_name": f"Vendor {due}", "amount": amount, "payment_due_date": due
+    })
+    assert response.status_code == 200
+
+def test_buckets_across_a_year_boundary(client, wedding_id):
+    category_id = client.get(f"/weddings/{wedding_id}/budget").json()[0]["id"]
+    add_booking(client, wedding_id, category_id, 100, "2030-12-31")  # Tuesday
+    add_booking(client, wedding_id, category_id, 200, "2031-01-05")  # Sunday, same ISO week
+    add_booking(client, wedding_id, category_id, 400, "2031-01-06")  # Monday, next week
+
+    weeks = client.get(f"/weddings/{wedding_id}/cashflow", params={"granularity": "week"}).json()
+    assert [(b["period_start"], b["outstanding"], b["cumulative"]) for b in weeks["buckets"]] == [
+        ("2030-12-30", 300, 300), ("2031-01-06", 400, 700)
+    ]
+
+    months = client.get(f"/weddings/{wedding_id}/cashflow", params={"granularity": "month"}).json()
+    assert [(b["period_start"], b["outstanding"], b["bookings"], b["cumulative"]) for b in months["buckets"]] == [
+        ("2030-12-01", 100, 1, 100), ("2031-01-01", 600, 2, 700)
+    ]
+    assert months["total_outstanding"] == 700 and months["unscheduled"] == 0
+
+def test_unknown_granularity_is_rejected(client, wedding_id):
+    assert client.get(f"/weddings/{wedding_id}/cashflow", params={"granularity": "day"}).status_code == 400
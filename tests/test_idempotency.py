@@ -0,0 +1,41 @@
+import uuid
+
+from database import get_db
+
+WEDDING = {"groom_name": "Dan", "bride_name": "Noa", "wedding_date": "2027-06-01", "total_budget": 100000}
+
+def test_replayed_create_returns_the_original_response(client):
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    first = client.post("/weddings", json=WEDDING, headers=headers)
+    replay = client.post("/weddings", json=WEDDING, headers=headers)
+
+    assert first.status_code == replay.status_code == 200
+    assert replay.json()["id"] == first.json()["id"]
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+
+def test_replayed_task_is_created_once(client, wedding_id):
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    tasks_before = len(client.get(f"/weddings/{wedding_id}/tasks").json())
+    task = {"title": "Book the photographer", "timeline_period": "6 months"}
+
+    ids = {client.post(f"/weddings/{wedding_id}/tasks", json=task, headers=headers).json()["id"] for _ in range(3)}
+
+    assert len(ids) == 1
+    assert len(client.get(f"/weddings/{wedding_id}/tasks").json()) == tasks_before + 1
+
+def test_key_reused_with_a_different_body_is_rejected(client):
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    assert client.post("/weddings", json=WEDDING, headers=headers).status_code == 200
+    assert client.post("/weddings", json={**WEDDING, "groom_name": "Other"}, headers=headers).status_code == 422
+
+def test_failed_request_is_not_remembered(client, wedding_id):
+    key = str(uuid.uuid4())
+    vendor_id = client.post("/vendors", json={"business_name": "Band", "category": "music"}).json()["id"]
+    client.post(f"/vendors/{vendor_id}/availability/blocks", json={"start_date": "2027-06-01", "end_date": "2027-06-01"})
+    category_id = client.get(f"/weddings/{wedding_id}/budget").json()[0]["id"]
+    booking = {"vendor_id": vendor_id, "category_id": category_id, "vendor_name": "Band", "amount": 100}
+
+    assert client.post(f"/weddings/{wedding_id}/bookings", json=booking, headers={"Idempotency-Key": key}).status_code == 409
+    with get_db() as conn:
+        assert conn.execute("SELECT 1 FROM idempotency_keys WHERE key = ?", (key,)).fetchone() is None
@@ -0,0 +1,67 @@
+import asyncio
+import glob
+import os
+from datetime import date
+
+import pytest
+
+import main
+from backup import BACKUP_DIR, BackupError, backups, restore_backup, verify_backups
+from database import all_database_paths, archive_path, connect
+
+def create_wedding_with_task(title):
+    wedding = main._create_wedding(main.WeddingCreate(groom_name="Dan", bride_name="Noa", wedding_date=date(2027, 6, 1)))
+    main._create_task(wedding.id, main.TaskCreate(title=title))
+    return wedding.id
+
+def test_restore_matches_the_live_databases(tmp_path):
+    create_wedding_with_task("Before the full copy")
+    backups.full_backup()
+    create_wedding_with_task("Shipped as WAL frames")
+    assert backups.ship_wal() > 0
+
+    restored = restore_backup(str(tmp_path))
+
+    assert sum(result["frames"] for result in restored.values()) > 0
+    for path in all_database_paths() + [archive_path()]:
+        with connect(path) as live, connect(str(tmp_path / os.path.basename(path))) as copy:
+            assert list(copy.iterdump()) == list(live.iterdump())
+
+def test_verify_detects_a_corrupted_backup():
+    backups.full_backup()
+    catalog_dir = os.path.join(BACKUP_DIR, os.path.basename(all_database_paths()[0]))
+    base = sorted(glob.glob(os.path.join(catalog_dir, "*", "base.db")))[-1]
+    with open(base, "r+b") as f:
+        f.seek(4096)
+        byte = f.read(1)
+        f.seek(4096)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    with pytest.raises(BackupError):
+        verify_backups()
+    backups.full_backup()
+    verify_backups()
+
+def test_management_arguments_are_converted():
+    args = vars(main.management_parser().parse_args(["prune-notifications", "30"]))
+    assert args == {"command": "prune-notifications", "retention_days": 30,
+                    "batch_size": main.NOTIFICATION_PRUNE_BATCH}
+    args = vars(main.management_parser().parse_args(["restore-backup", "restored/"]))
+    assert args == {"command": "restore-backup", "target_dir": "restored/", "generation": None}
+
+def test_failing_background_job_keeps_running():
+    calls = []
+
+    def flaky_job():
+        calls.append(len(calls))
+        raise OSError("disk full")
+
+    async def run_for_a_while():
+        task = asyncio.create_task(main.run_periodic(flaky_job, 0))
+        await asyncio.sleep(0.2)
+        task.cancel()
+
+    asyncio.run(run_for_a_while())
+
+    status = main.background_job_status["flaky_job"]
+    assert status["failures"] > 1 and status["last_error"] == "OSError('disk full')"
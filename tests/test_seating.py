@@ -0,0 +1,62 @@
+from collections import Counter
+
+from seating import solve_seating
+
+def make_guests(count, party_size=1, group_name=None):
+    return [{"id": f"g{i}", "party_size": party_size, "group_name": group_name, "table_id": None, "seat_locked": False}
+            for i in range(count)]
+
+def seats_used(guests, assignments):
+    sizes = {guest["id"]: guest["party_size"] for guest in guests}
+    used = Counter()
+    for guest_id, table_id in assignments.items():
+        if table_id:
+            used[table_id] += sizes[guest_id]
+    return used
+
+def test_together_and_apart_constraints_hold():
+    guests = make_guests(20, party_size=2, group_name="family")
+    tables = [{"id": f"t{i}", "capacity": 10} for i in range(5)]
+    together = [("g0", "g1"), ("g1", "g2")]
+    apart = [("g3", "g4"), ("g0", "g5")]
+
+    result = solve_seating(guests, tables, together, apart, incremental=False)
+    seats = result["assignments"]
+
+    assert seats["g0"] == seats["g1"] == seats["g2"] is not None
+    assert seats["g3"] != seats["g4"]
+    assert seats["g0"] != seats["g5"]
+    assert all(used <= 10 for used in seats_used(guests, seats).values())
+    assert not result["unassigned"] and not result["conflicts"]
+
+def test_contradictory_constraints_are_reported():
+    guests = make_guests(4)
+    tables = [{"id": "t0", "capacity": 10}]
+
+    result = solve_seating(guests, tables, [("g0", "g1")], [("g1", "g0")], incremental=False)
+
+    assert len(result["conflicts"]) == 1
+
+def test_locked_seat_is_kept():
+    guests = make_guests(6)
+    guests[0].update(table_id="t1", seat_locked=True)
+    tables = [{"id": "t0", "capacity": 10}, {"id": "t1", "capacity": 10}]
+
+    result = solve_seating(guests, tables, [("g0", "g1")], [], incremental=False)
+
+    assert result["assignments"]["g0"] == "t1"
+
+def test_solve_endpoint_applies_constraints(client, wedding_id):
+    guests = [{"name": f"Guest {i}", "group_name": f"group{i % 3}", "rsvp_status": "attending"} for i in range(12)]
+    ids = client.post(f"/weddings/{wedding_id}/guests/import", json={"guests": guests}).json()["ids"]
+    for i in range(3):
+        client.post(f"/weddings/{wedding_id}/tables", json={"name": f"T{i}", "capacity": 6})
+    for a, b, kind in [(ids[0], ids[1], "together"), (ids[3], ids[6], "apart")]:
+        response = client.post(f"/weddings/{wedding_id}/seating/constraints",
+                               json={"guest_id": a, "other_guest_id": b, "kind": kind})
+        assert response.status_code == 200
+
+    assert client.post(f"/weddings/{wedding_id}/seating/solve", json={"incremental": False}).status_code == 200
+    seats = {guest["id"]: guest["table_id"] for guest in client.get(f"/weddings/{wedding_id}/guests").json()}
+    assert seats[ids[0]] == seats[ids[1]] is not None
+    assert seats[ids[3]] != seats[ids[6]]
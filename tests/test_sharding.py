@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+import database
+from database import SHARD_COUNT, WeddingMoved, get_shard_db, get_wedding_db, migrate_wedding, shard_for_wedding
+
+def other_shard(wedding_id):
+    return (shard_for_wedding(wedding_id) + 1) % SHARD_COUNT
+
+def count_rows(shard, table, wedding_id):
+    with get_shard_db(shard) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table} WHERE wedding_id = ?", (wedding_id,)).fetchone()[0]
+
+def test_migrate_moves_rows_and_keeps_routes_working(client, wedding_id):
+    category_id = client.get(f"/weddings/{wedding_id}/budget").json()[0]["id"]
+    booking = client.post(f"/weddings/{wedding_id}/bookings",
+                          json={"category_id": category_id, "vendor_name": "DJ", "amount": 1200})
+    assert booking.status_code == 200
+    task_id = client.get(f"/weddings/{wedding_id}/tasks").json()[0]["id"]
+    tasks_before = count_rows(shard_for_wedding(wedding_id), "tasks", wedding_id)
+
+    source, target = shard_for_wedding(wedding_id), other_shard(wedding_id)
+    assert migrate_wedding(wedding_id, target)
+
+    assert shard_for_wedding(wedding_id) == target
+    assert count_rows(source, "tasks", wedding_id) == 0
+    assert count_rows(target, "tasks", wedding_id) == tasks_before
+    assert count_rows(target, "budget_ledger", wedding_id) == 1
+    budget = {row["id"]: row for row in client.get(f"/weddings/{wedding_id}/budget").json()}
+    assert budget[category_id]["actual_amount"] == 1200
+    assert client.put(f"/tasks/{task_id}", json={"title": "Moved"}).status_code == 200
+
+def test_stale_shard_map_follows_the_tombstone(client, wedding_id):
+    source, target = shard_for_wedding(wedding_id), other_shard(wedding_id)
+    migrate_wedding(wedding_id, target)
+
+    # Another process still has the pre-move shard cached
+    database._shard_map_cache[wedding_id] = source
+    assert client.get(f"/weddings/{wedding_id}").status_code == 200
+    assert database._shard_map_cache[wedding_id] == target
+
+def test_write_routed_before_a_move_is_refused_not_lost(client, wedding_id):
+    target = other_shard(wedding_id)
+    tasks_before = len(client.get(f"/weddings/{wedding_id}/tasks").json())
+
+    with pytest.raises(WeddingMoved):
+        with get_wedding_db(wedding_id, write=True) as conn:
+            migrate_wedding(wedding_id, target)
+            conn.execute("INSERT INTO tasks (id, wedding_id, title) VALUES ('late', ?, 'Late')", (wedding_id,))
+            conn.commit()
+
+    assert len(client.get(f"/weddings/{wedding_id}/tasks").json()) == tasks_before
+
+def test_move_waits_for_an_open_write(client, wedding_id):
+    source, target = shard_for_wedding(wedding_id), other_shard(wedding_id)
+    with get_shard_db(source) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("INSERT INTO tasks (id, wedding_id, title) VALUES ('open-write', ?, 'Open')", (wedding_id,))
+        mover = threading.Thread(target=migrate_wedding, args=(wedding_id, target))
+        mover.start()
+        time.sleep(0.2)
+        conn.commit()
+    mover.join()
+
+    assert shard_for_wedding(wedding_id) == target
+    assert count_rows(source, "tasks", wedding_id) == 0
+    with get_shard_db(target) as conn:
+        assert conn.execute("SELECT 1 FROM tasks WHERE id = 'open-write'").fetchone()
@@ -0,0 +1,68 @@
+import pytest
+
+def create_wedding(client, wedding_date="2027-06-01"):
+    return client.post("/weddings", json={
+        "groom_name": "Ron", "bride_name": "Tal", "wedding_date": wedding_date, "total_budget": 50000
+    }).json()["id"]
+
+def book(client, wedding_id, vendor_id, event_date=None):
+    category_id = client.get(f"/weddings/{wedding_id}/budget").json()[0]["id"]
+    booking = {"vendor_id": vendor_id, "category_id": category_id, "vendor_name": "Band", "amount": 1000}
+    if event_date:
+        booking["event_date"] = event_date
+    return client.post(f"/weddings/{wedding_id}/bookings", json=booking)
+
+@pytest.fixture
+def vendor_id(client):
+    return client.post("/vendors", json={"business_name": "Band", "category": "music"}).json()["id"]
+
+def test_second_booking_on_a_full_date_is_refused(client, vendor_id):
+    assert book(client, create_wedding(client), vendor_id).status_code == 200
+    assert book(client, create_wedding(client), vendor_id).status_code == 409
+
+def test_reviving_a_cancelled_booking_needs_a_free_date(client, vendor_id):
+    booking_id = book(client, create_wedding(client), vendor_id).json()["id"]
+    assert client.put(f"/bookings/{booking_id}", json={"status": "cancelled"}).status_code == 200
+    assert book(client, create_wedding(client), vendor_id).status_code == 200
+
+    assert client.put(f"/bookings/{booking_id}", json={"status": "confirmed"}).status_code == 409
+
+def test_moving_a_booking_checks_and_frees_dates(client, vendor_id):
+    booking_id = book(client, create_wedding(client), vendor_id).json()["id"]
+    assert book(client, create_wedding(client), vendor_id, "2027-07-01").status_code == 200
+
+    assert client.put(f"/bookings/{booking_id}", json={"event_date": "2027-07-01"}).status_code == 409
+    assert client.put(f"/bookings/{booking_id}", json={"event_date": "2027-08-01"}).status_code == 200
+    assert book(client, create_wedding(client), vendor_id, "2027-06-01").status_code == 200
+
+def test_failed_update_gives_the_old_date_back(client, vendor_id):
+    wedding_id = create_wedding(client)
+    booking = book(client, wedding_id, vendor_id).json()
+    category_id = client.get(f"/weddings/{wedding_id}/bookings").json()[0]["category_id"]
+    client.delete(f"/budget/{category_id}")
+
+    response = client.put(f"/bookings/{booking['id']}", json={"event_date": "2027-08-01", "amount": 500})
+
+    assert response.status_code == 404
+    assert book(client, create_wedding(client), vendor_id, "2027-08-01").status_code == 200
+    assert book(client, create_wedding(client), vendor_id, "2027-06-01").status_code == 409
+
+def test_wedding_date_change_moves_the_vendor_claims(client, vendor_id):
+    wedding_id = create_wedding(client)
+    book(client, wedding_id, vendor_id)
+
+    assert client.put(f"/weddings/{wedding_id}", json={"wedding_date": "2027-09-01"}).status_code == 200
+
+    assert client.get(f"/weddings/{wedding_id}/bookings").json()[0]["event_date"] == "2027-09-01"
+    assert book(client, create_wedding(client), vendor_id, "2027-06-01").status_code == 200
+    assert book(client, create_wedding(client), vendor_id, "2027-09-01").status_code == 409
+
+def test_wedding_date_change_onto_a_taken_vendor_is_refused(client, vendor_id):
+    wedding_id = create_wedding(client)
+    book(client, wedding_id, vendor_id)
+    assert book(client, create_wedding(client), vendor_id, "2027-09-01").status_code == 200
+
+    assert client.put(f"/weddings/{wedding_id}", json={"wedding_date": "2027-09-01"}).status_code == 409
+
+    assert client.get(f"/weddings/{wedding_id}").json()["wedding_date"] == "2027-06-01"
+    assert book(client, create_wedding(client), vendor_id, "2027-06-01").status_code == 409